@@ -0,0 +1,36 @@
+"""Add job leases and retry bookkeeping
+
+Revision ID: 011_add_job_leases
+Revises: 010_add_system_settings
+Create Date: 2025-01-20 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '011_add_job_leases'
+down_revision = '010_add_system_settings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('lease_expires_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('jobs', sa.Column('attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('jobs', sa.Column('available_at', sa.DateTime(timezone=True), nullable=True))
+    # The lease sweeper scans active jobs by expiry
+    op.create_index('ix_jobs_status_lease_expires_at', 'jobs', ['status', 'lease_expires_at'], unique=False)
+    
+    # Give jobs already out on nodes a lease so lost ones are eventually reclaimed
+    op.execute(
+        "UPDATE jobs SET lease_expires_at = now() + interval '10 minutes', attempts = 1 "
+        "WHERE status IN ('ASSIGNED', 'RUNNING')"
+    )
+
+
+def downgrade():
+    op.drop_index('ix_jobs_status_lease_expires_at', table_name='jobs')
+    op.drop_column('jobs', 'available_at')
+    op.drop_column('jobs', 'attempts')
+    op.drop_column('jobs', 'lease_expires_at')
@@ -0,0 +1,37 @@
+"""Add job owner, group and priority for fair-share scheduling
+
+Revision ID: 012_add_job_fair_share
+Revises: 011_add_job_leases
+Create Date: 2025-01-21 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '012_add_job_fair_share'
+down_revision = '011_add_job_leases'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('jobs', sa.Column('group_id', sa.Integer(), nullable=True))
+    op.add_column('jobs', sa.Column('priority', sa.Integer(), nullable=False, server_default='1'))
+    op.create_foreign_key('fk_jobs_user_id', 'jobs', 'users', ['user_id'], ['id'])
+    op.create_foreign_key('fk_jobs_group_id', 'jobs', 'groups', ['group_id'], ['id'])
+    op.create_index(op.f('ix_jobs_user_id'), 'jobs', ['user_id'], unique=False)
+    
+    # Default priority classes per job type (2 = high, 1 = normal, 0 = low)
+    op.execute("UPDATE jobs SET priority = 2 WHERE type = 'INFERENCE'")
+    op.execute("UPDATE jobs SET priority = 0 WHERE type = 'FINETUNE'")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_jobs_user_id'), table_name='jobs')
+    op.drop_constraint('fk_jobs_group_id', 'jobs', type_='foreignkey')
+    op.drop_constraint('fk_jobs_user_id', 'jobs', type_='foreignkey')
+    op.drop_column('jobs', 'priority')
+    op.drop_column('jobs', 'group_id')
+    op.drop_column('jobs', 'user_id')
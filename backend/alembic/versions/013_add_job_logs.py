@@ -0,0 +1,29 @@
+"""Add streamed job log pointer and tail
+
+Revision ID: 013_add_job_logs
+Revises: 012_add_job_fair_share
+Create Date: 2025-01-22 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '013_add_job_logs'
+down_revision = '012_add_job_fair_share'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('log_object_prefix', sa.String(), nullable=True))
+    op.add_column('jobs', sa.Column('log_chunks', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('jobs', sa.Column('log_bytes', sa.BigInteger(), nullable=False, server_default='0'))
+    op.add_column('jobs', sa.Column('log_tail', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('jobs', 'log_tail')
+    op.drop_column('jobs', 'log_bytes')
+    op.drop_column('jobs', 'log_chunks')
+    op.drop_column('jobs', 'log_object_prefix')
@@ -0,0 +1,23 @@
+"""Add per-file output manifest to jobs
+
+Revision ID: 014_add_job_output_manifest
+Revises: 013_add_job_logs
+Create Date: 2025-01-23 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '014_add_job_output_manifest'
+down_revision = '013_add_job_logs'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('output_manifest', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('jobs', 'output_manifest')
@@ -0,0 +1,77 @@
+"""Add pipelines and job dependencies
+
+Revision ID: 015_add_pipelines
+Revises: 014_add_job_output_manifest
+Create Date: 2025-01-24 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '015_add_pipelines'
+down_revision = '014_add_job_output_manifest'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Jobs held back until the jobs they depend on complete.
+    # ALTER TYPE ... ADD VALUE cannot run inside a transaction block.
+    with op.get_context().autocommit_block():
+        op.execute("ALTER TYPE jobstatus ADD VALUE IF NOT EXISTS 'WAITING'")
+
+    op.create_table(
+        'pipelines',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('pipeline_id', sa.String(), nullable=False),
+        sa.Column('name', sa.String(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=True),
+        sa.Column('group_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.ForeignKeyConstraint(['group_id'], ['groups.id'], ),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_pipelines_id'), 'pipelines', ['id'], unique=False)
+    op.create_index(op.f('ix_pipelines_pipeline_id'), 'pipelines', ['pipeline_id'], unique=True)
+    op.create_index(op.f('ix_pipelines_user_id'), 'pipelines', ['user_id'], unique=False)
+
+    op.add_column('jobs', sa.Column('pipeline_id', sa.Integer(), nullable=True))
+    op.add_column('jobs', sa.Column('stage', sa.String(), nullable=True))
+    op.add_column('jobs', sa.Column('preferred_node_id', sa.Integer(), nullable=True))
+    op.add_column('jobs', sa.Column('affinity_until', sa.DateTime(timezone=True), nullable=True))
+    op.create_foreign_key('fk_jobs_pipeline_id', 'jobs', 'pipelines', ['pipeline_id'], ['id'])
+    op.create_foreign_key('fk_jobs_preferred_node_id', 'jobs', 'nodes', ['preferred_node_id'], ['id'])
+    op.create_index(op.f('ix_jobs_pipeline_id'), 'jobs', ['pipeline_id'], unique=False)
+
+    op.create_table(
+        'job_dependencies',
+        sa.Column('job_id', sa.Integer(), nullable=False),
+        sa.Column('depends_on_id', sa.Integer(), nullable=False),
+        sa.Column('input_path', sa.String(), nullable=False),
+        sa.Column('output_file', sa.String(), nullable=True),
+        sa.ForeignKeyConstraint(['job_id'], ['jobs.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['depends_on_id'], ['jobs.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('job_id', 'depends_on_id')
+    )
+    # Children of a job are looked up when it completes or fails
+    op.create_index(op.f('ix_job_dependencies_depends_on_id'), 'job_dependencies', ['depends_on_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_job_dependencies_depends_on_id'), table_name='job_dependencies')
+    op.drop_table('job_dependencies')
+    op.drop_index(op.f('ix_jobs_pipeline_id'), table_name='jobs')
+    op.drop_constraint('fk_jobs_preferred_node_id', 'jobs', type_='foreignkey')
+    op.drop_constraint('fk_jobs_pipeline_id', 'jobs', type_='foreignkey')
+    op.drop_column('jobs', 'affinity_until')
+    op.drop_column('jobs', 'preferred_node_id')
+    op.drop_column('jobs', 'stage')
+    op.drop_column('jobs', 'pipeline_id')
+    op.drop_index(op.f('ix_pipelines_user_id'), table_name='pipelines')
+    op.drop_index(op.f('ix_pipelines_pipeline_id'), table_name='pipelines')
+    op.drop_index(op.f('ix_pipelines_id'), table_name='pipelines')
+    op.drop_table('pipelines')
+    # Postgres cannot drop a value from an enum; move waiting jobs back to pending
+    op.execute("UPDATE jobs SET status = 'PENDING' WHERE status = 'WAITING'")
@@ -0,0 +1,41 @@
+"""Add job lifecycle timings and node performance statistics
+
+Revision ID: 016_add_job_timings
+Revises: 015_add_pipelines
+Create Date: 2025-01-25 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '016_add_job_timings'
+down_revision = '015_add_pipelines'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('jobs', sa.Column('queued_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('jobs', sa.Column('inputs_ready_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('jobs', sa.Column('container_started_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('jobs', sa.Column('queue_seconds', sa.Float(), nullable=True))
+    op.add_column('jobs', sa.Column('download_seconds', sa.Float(), nullable=True))
+    op.add_column('jobs', sa.Column('run_seconds', sa.Float(), nullable=True))
+    # Rolling per-node statistics are computed over each node's recent jobs
+    op.create_index('ix_jobs_node_id_completed_at', 'jobs', ['node_id', 'completed_at'], unique=False)
+    op.create_index(op.f('ix_jobs_completed_at'), 'jobs', ['completed_at'], unique=False)
+
+    op.add_column('nodes', sa.Column('performance', sa.JSON(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('nodes', 'performance')
+    op.drop_index(op.f('ix_jobs_completed_at'), table_name='jobs')
+    op.drop_index('ix_jobs_node_id_completed_at', table_name='jobs')
+    op.drop_column('jobs', 'run_seconds')
+    op.drop_column('jobs', 'download_seconds')
+    op.drop_column('jobs', 'queue_seconds')
+    op.drop_column('jobs', 'container_started_at')
+    op.drop_column('jobs', 'inputs_ready_at')
+    op.drop_column('jobs', 'queued_at')
@@ -0,0 +1,43 @@
+"""Add inference endpoints
+
+Revision ID: 017_add_inference_endpoints
+Revises: 016_add_job_timings
+Create Date: 2025-01-26 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '017_add_inference_endpoints'
+down_revision = '016_add_job_timings'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'inference_endpoints',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('node_id', sa.Integer(), nullable=False),
+        sa.Column('model_cid', sa.String(), nullable=False),
+        sa.Column('url', sa.String(), nullable=False),
+        sa.Column('max_concurrency', sa.Integer(), nullable=False, server_default='4'),
+        sa.Column('is_healthy', sa.Boolean(), nullable=False, server_default=sa.true()),
+        sa.Column('consecutive_failures', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('last_checked_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['node_id'], ['nodes.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('node_id', 'model_cid', name='uq_inference_endpoints_node_model')
+    )
+    op.create_index(op.f('ix_inference_endpoints_id'), 'inference_endpoints', ['id'], unique=False)
+    op.create_index(op.f('ix_inference_endpoints_node_id'), 'inference_endpoints', ['node_id'], unique=False)
+    op.create_index(op.f('ix_inference_endpoints_model_cid'), 'inference_endpoints', ['model_cid'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_inference_endpoints_model_cid'), table_name='inference_endpoints')
+    op.drop_index(op.f('ix_inference_endpoints_node_id'), table_name='inference_endpoints')
+    op.drop_index(op.f('ix_inference_endpoints_id'), table_name='inference_endpoints')
+    op.drop_table('inference_endpoints')
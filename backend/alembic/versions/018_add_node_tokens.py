@@ -0,0 +1,23 @@
+"""Add node tokens
+
+Revision ID: 018_add_node_tokens
+Revises: 017_add_inference_endpoints
+Create Date: 2025-01-27 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '018_add_node_tokens'
+down_revision = '017_add_inference_endpoints'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('nodes', sa.Column('token_hash', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('nodes', 'token_hash')
@@ -0,0 +1,23 @@
+"""Add inference endpoint secrets
+
+Revision ID: 019_add_inference_secrets
+Revises: 018_add_node_tokens
+Create Date: 2025-01-28 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '019_add_inference_secrets'
+down_revision = '018_add_node_tokens'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('inference_endpoints', sa.Column('secret', sa.String(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('inference_endpoints', 'secret')
@@ -19,6 +19,13 @@ try:
     
     # Create ASGI adapter for Vercel
     handler = Mangum(app, lifespan="off")
+    # lifespan="off" skips the startup hook, so periodic tasks never run here
+    logger.error(
+        "Background tasks (lease sweep, queue reconciliation, pipeline release, "
+        "heartbeat flush, ...) do not run on serverless; run a long-running "
+        "backend process against the same database and Redis. /health reports "
+        "them as not running."
+    )
     
     logger.info("FastAPI app initialized successfully")
 except Exception as e:
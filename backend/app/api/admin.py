@@ -7,7 +7,7 @@ from app.models.wallet import AdminWallet, WalletNetwork
 from app.models.payment import Payment, PaymentStatus
 from app.models.subscription import Subscription
 from app.models.node import Node
-from app.models.job import Job
+from app.models.job import Job, JobStatus
 from app.models.model import Model
 from app.models.nft import NFTShare, NFTReward, NFTRewardPool
 from app.models.infrastructure import InfrastructureInvestment
@@ -18,6 +18,10 @@ from app.models.chat import Conversation, Message
 from app.models.api_service import APIRequest
 from app.schemas.wallet import AdminWalletCreate, AdminWalletResponse
 from app.services.wallet_service import WalletService
+from app.services.job_queue import JobQueue, WEIGHTS_SETTING
+from app.services.system_service import SystemService
+from app.services.node_service import NodeService
+from app.services.node_stats_service import NodeStatsService
 from typing import Optional, Dict, Any, Tuple
 from decimal import Decimal
 from datetime import datetime
@@ -119,11 +123,13 @@ async def get_platform_stats(
         },
         "nodes": {
             "total": total_nodes,
-            "active": active_nodes
+            "active": active_nodes,
+            "online": NodeService.online_count()
         },
         "jobs": {
             "total": total_jobs,
-            "completed": completed_jobs
+            "completed": completed_jobs,
+            "queued": JobQueue.depth()
         },
         "models": {
             "total": total_models
@@ -983,11 +989,76 @@ async def retry_job(
     
     job.status = "pending"
     job.error = None
+    job.node_id = None
+    job.attempts = 0
+    job.available_at = None
+    job.queued_at = datetime.utcnow()
     db.commit()
     db.refresh(job)
     
+    JobQueue.enqueue(job)
+    
     return {"message": "Job queued for retry", "job": job}
 
+@router.get("/jobs/queue-metrics")
+async def get_job_queue_metrics(
+    admin_wallet: Tuple[str, WalletNetwork] = Depends(verify_admin_wallet)
+):
+    """Queue depth and dispatch wait time per queue (admin only)"""
+    return {
+        "depth": JobQueue.depth(),
+        "wait_seconds": JobQueue.wait_stats()
+    }
+
+@router.get("/jobs/fair-share")
+async def get_fair_share_weights(
+    admin_wallet: Tuple[str, WalletNetwork] = Depends(verify_admin_wallet),
+    db: Session = Depends(get_db)
+):
+    """Get fair-share weights per tenant (admin only)"""
+    return {"weights": SystemService.get_setting_value(db, WEIGHTS_SETTING, {}) or {}}
+
+@router.put("/jobs/fair-share")
+async def set_fair_share_weights(
+    weights: Dict[str, float],
+    admin_wallet: Tuple[str, WalletNetwork] = Depends(verify_admin_wallet),
+    db: Session = Depends(get_db)
+):
+    """
+    Set fair-share weights (admin only). Keys are "group:<id>" or
+    "user:<id>"; tenants not listed have weight 1.
+    """
+    for tenant, weight in weights.items():
+        if not (tenant.startswith("group:") or tenant.startswith("user:")) or weight <= 0:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid fair-share weight: {tenant}={weight}"
+            )
+    
+    SystemService.set_setting(
+        db=db,
+        key=WEIGHTS_SETTING,
+        value=weights,
+        value_type="json",
+        category="jobs",
+        description="Job scheduling fair-share weights per group/user"
+    )
+    try:
+        JobQueue.set_weights(weights)
+    except Exception:
+        # Applied on the next queue reconciliation
+        pass
+    
+    SystemService.log_action(
+        db=db,
+        action="fair_share_weights_updated",
+        category="jobs",
+        details={"weights": weights},
+        performed_by_wallet=admin_wallet[0]
+    )
+    
+    return {"weights": weights}
+
 # Node Management Enhancements
 @router.patch("/nodes/{node_id}/activate")
 async def activate_node(
@@ -1043,16 +1114,13 @@ async def get_node_stats(
             detail="Node not found"
         )
     
-    # Get jobs assigned to this node
-    jobs_assigned = db.query(func.count(Job.id)).filter(Job.node_id == node_id).scalar()
-    jobs_completed = db.query(func.count(Job.id)).filter(
-        Job.node_id == node_id,
-        Job.status == "completed"
-    ).scalar()
-    jobs_failed = db.query(func.count(Job.id)).filter(
-        Job.node_id == node_id,
-        Job.status == "failed"
-    ).scalar()
+    # Job counts by status, in one pass over the node's jobs
+    counts = dict(db.query(Job.status, func.count(Job.id)).filter(
+        Job.node_id == node_id
+    ).group_by(Job.status).all())
+    jobs_assigned = sum(counts.values())
+    jobs_completed = counts.get(JobStatus.COMPLETED, 0)
+    jobs_failed = counts.get(JobStatus.FAILED, 0)
     
     return {
         "node": {
@@ -1066,6 +1134,31 @@ async def get_node_stats(
             "jobs_completed": jobs_completed,
             "jobs_failed": jobs_failed,
             "success_rate": (jobs_completed / jobs_assigned * 100) if jobs_assigned > 0 else 0
-        }
+        },
+        # Recent jobs only: throughput, runtime/download percentiles, failure rate
+        "performance": NodeStatsService.node_stats(db, node)
     }
 
+@router.get("/nodes/performance")
+async def get_nodes_performance(
+    admin_wallet: Tuple[str, WalletNetwork] = Depends(verify_admin_wallet),
+    db: Session = Depends(get_db)
+):
+    """Rolling performance of every node with recent jobs, flagged nodes first (admin only)"""
+    nodes = db.query(Node).filter(Node.performance.isnot(None)).all()
+    nodes.sort(key=lambda node: (
+        not (node.performance.get("flaky") or node.performance.get("slow_downloads")),
+        -node.performance.get("failure_rate", 0)
+    ))
+    return {
+        "nodes": [
+            {
+                "id": node.id,
+                "node_id": node.node_id,
+                "name": node.name,
+                "is_active": node.is_active,
+                "performance": node.performance
+            }
+            for node in nodes
+        ]
+    }
@@ -11,6 +11,7 @@ from app.schemas.api_service import (
     APISubscriptionCreate, APISubscriptionResponse
 )
 from app.services.payment_service import PaymentService
+from app.services.api_key_cache import api_key_cache
 from app.models.payment import PaymentType
 from typing import List, Optional
 import secrets
@@ -175,6 +176,8 @@ async def update_api_service(
     
     db.commit()
     db.refresh(service)
+    # Pricing, limits and status are cached with every subscription's API key
+    api_key_cache.invalidate_service(service.id)
     
     return service
 
@@ -1,11 +1,44 @@
 from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
+from fastapi.security import OAuth2PasswordBearer, HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from typing import Optional
+import hashlib
+import hmac
 from app.core.database import get_db
 from app.core.security import decode_access_token
+from app.models.node import Node
 from app.models.user import User
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
+node_token_scheme = HTTPBearer(auto_error=False)
+
+def hash_node_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_current_node(
+    node_id: str,
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(node_token_scheme),
+    db: Session = Depends(get_db)
+) -> Node:
+    """The node in the path, if the request carries the token it was issued at registration"""
+    node = db.query(Node).filter(Node.node_id == node_id).first()
+    if not node:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Node not found"
+        )
+    
+    # Nodes registered before tokens were stored have none and must re-register
+    if credentials is None or not node.token_hash or not hmac.compare_digest(
+        hash_node_token(credentials.credentials), node.token_hash
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid node token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    return node
 
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
@@ -1,21 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 import uuid
 from datetime import datetime
 from app.core.database import get_db
 from app.models.job import Job, JobStatus, JobType
 from app.models.user import User
-from app.schemas.job import JobCreate, JobResponse, JobStatusUpdate
+from app.models.group import GroupMembership
+from app.schemas.job import JobCreate, JobResponse, JobStatusUpdate, JobLogTail
 from app.api.dependencies import get_current_user
-import redis
-from app.core.config import settings
+from app.services.job_queue import JobQueue
+from app.services.job_log_service import JobLogService
+from app.services.pipeline_service import PipelineService
 
 router = APIRouter()
 
-# Redis connection for job queue
-redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
-
 @router.post("", response_model=JobResponse, status_code=status.HTTP_201_CREATED)
 async def create_job(
     job_data: JobCreate,
@@ -24,6 +24,18 @@ async def create_job(
 ):
     """Create a new job"""
     
+    # Jobs submitted for a group count against the group's fair share
+    if job_data.group_id is not None:
+        membership = db.query(GroupMembership).filter(
+            GroupMembership.group_id == job_data.group_id,
+            GroupMembership.user_id == current_user.id
+        ).first()
+        if not membership:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not a member of this group"
+            )
+    
     # Generate unique job ID
     job_id = f"job-{uuid.uuid4().hex[:8]}"
     
@@ -31,6 +43,9 @@ async def create_job(
     db_job = Job(
         job_id=job_id,
         type=job_data.type,
+        user_id=current_user.id,
+        group_id=job_data.group_id,
+        priority=JobQueue.default_priority(job_data.type),
         config=job_data.config,
         input_files=job_data.input_files,
         output_files=job_data.output_files,
@@ -40,18 +55,16 @@ async def create_job(
         memory_limit=job_data.memory_limit,
         cpu_limit=job_data.cpu_limit,
         gpus=job_data.gpus,
-        status=JobStatus.PENDING
+        status=JobStatus.PENDING,
+        queued_at=datetime.utcnow()
     )
     
     db.add(db_job)
     db.commit()
     db.refresh(db_job)
     
-    # Add job to Redis queue
-    try:
-        redis_client.lpush("job_queue", job_id)
-    except Exception as e:
-        print(f"Warning: Failed to add job to Redis queue: {e}")
+    # Add job to its dispatch queue (reconciliation retries if Redis is down)
+    JobQueue.enqueue(db_job)
     
     return db_job
 
@@ -85,6 +98,44 @@ async def get_job(
         )
     return job
 
+@router.get("/{job_id}/logs", response_model=JobLogTail)
+async def get_job_logs(
+    job_id: str,
+    since: Optional[int] = Query(None, ge=0, description="Byte offset returned by a previous call"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Live tail of a job's log. Poll with `since` set to the previous
+    `log_bytes` to receive only new output.
+    """
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return JobLogService.tail(job, since)
+
+@router.get("/{job_id}/logs/download")
+async def download_job_logs(
+    job_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Full log of a job, streamed from object storage"""
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return StreamingResponse(
+        JobLogService.iter_log(job),
+        media_type="text/plain",
+        headers={"Content-Disposition": f'attachment; filename="{job.job_id}.log"'}
+    )
+
 @router.delete("/{job_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def cancel_job(
     job_id: str,
@@ -99,14 +150,15 @@ async def cancel_job(
             detail="Job not found"
         )
     
-    # Only allow cancelling pending or assigned jobs
-    if job.status not in [JobStatus.PENDING, JobStatus.ASSIGNED]:
+    # Only allow cancelling jobs that have not started
+    if job.status not in [JobStatus.WAITING, JobStatus.PENDING, JobStatus.ASSIGNED]:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Cannot cancel job in current status"
         )
     
     job.status = JobStatus.CANCELLED
+    PipelineService.cancel_dependents(db, job)
     db.commit()
     
     return None
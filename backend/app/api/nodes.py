@@ -1,20 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+from pydantic import ValidationError
 from typing import Optional
 import uuid
+import asyncio
+import secrets
 from datetime import datetime
 from app.core.database import get_db
+from app.core.config import settings
+from app.core.job_notifier import job_notifier
 from app.models.node import Node
 from app.models.job import Job, JobStatus
 from app.schemas.node import NodeCreate, NodeResponse, NodeRegistrationResponse
-from app.schemas.job import JobResponse
-from app.api.dependencies import get_current_user
+from app.schemas.job import JobResponse, OutputManifest
+from app.schemas.inference import InferenceRegistration, InferenceEndpointResponse
+from app.services.job_dispatch_service import JobDispatchService
+from app.services.scheduler_service import SchedulerService, ACTIVE_JOB_STATUSES, FINISHED_JOB_STATUSES
+from app.services.job_lease_service import JobLeaseService
+from app.services.node_service import NodeService
+from app.services.job_log_service import JobLogService
+from app.services.pipeline_service import PipelineService
+from app.services.node_stats_service import NodeStatsService
+from app.services.inference_router import InferenceRouter
+from app.api.dependencies import get_current_user, get_current_node, hash_node_token
 from app.models.user import User
 
 router = APIRouter()
 
+# Upper bound on jobs claimed in a single poll
+MAX_JOBS_PER_POLL = 32
+# Upper bound on status updates in one batch
+MAX_STATUS_UPDATES = 500
+
+# Endpoints that only do blocking database work are plain functions, which
+# FastAPI runs in its threadpool. As coroutines they would block the event
+# loop on pool checkout while the sessions that could be returned to the
+# pool wait on the loop to be closed, stalling the worker under load.
+
 @router.post("/register", response_model=NodeRegistrationResponse, status_code=status.HTTP_201_CREATED)
-async def register_node(
+def register_node(
     node_data: NodeCreate,
     db: Session = Depends(get_db)
 ):
@@ -22,6 +47,8 @@ async def register_node(
     
     # Generate unique node ID
     node_id = f"node-{uuid.uuid4().hex[:8]}"
+    # Token the node authenticates with; only its hash is stored
+    token = f"node_{node_id}_{secrets.token_hex(24)}"
     
     # Create node record
     db_node = Node(
@@ -31,6 +58,7 @@ async def register_node(
         resources=node_data.resources,
         max_concurrent_jobs=node_data.max_concurrent_jobs,
         gpu_enabled=node_data.gpu_enabled,
+        token_hash=hash_node_token(token),
         is_active=True,
         last_heartbeat=datetime.utcnow()
     )
@@ -38,10 +66,7 @@ async def register_node(
     db.add(db_node)
     db.commit()
     db.refresh(db_node)
-    
-    # Generate token for node authentication (simple implementation)
-    # In production, use proper JWT or API key generation
-    token = f"node_{node_id}_{uuid.uuid4().hex[:16]}"
+    NodeService.cache_node(node_id, db_node.resources)
     
     return NodeRegistrationResponse(
         node_id=node_id,
@@ -50,36 +75,75 @@ async def register_node(
     )
 
 @router.post("/{node_id}/heartbeat", status_code=status.HTTP_200_OK)
-async def node_heartbeat(
+def node_heartbeat(
     node_id: str,
     heartbeat_data: dict,
     db: Session = Depends(get_db)
 ):
     """Receive heartbeat from node"""
     
-    node = db.query(Node).filter(Node.node_id == node_id).first()
-    if not node:
+    # Nodes send either the full resource snapshot ("resources") or only the
+    # fields that changed ("resources_delta"); both are buffered and flushed
+    # to the database in bulk. Nodes that list their "running_jobs" are told
+    # which of them to stop ("cancel_jobs").
+    result = NodeService.record_heartbeat(db, node_id, heartbeat_data)
+    if result is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Node not found"
         )
     
-    # Update heartbeat timestamp and resources
-    node.last_heartbeat = datetime.utcnow()
-    if "resources" in heartbeat_data:
-        node.resources = heartbeat_data["resources"]
-    node.is_active = True
-    
-    db.commit()
+    return result
+
+@router.put("/{node_id}/inference", response_model=list[InferenceEndpointResponse])
+def register_inference_endpoints(
+    registration: InferenceRegistration,
+    node: Node = Depends(get_current_node),
+    db: Session = Depends(get_db)
+):
+    """
+    Announce the model server this node runs and the models (by IPFS CID)
+    it serves, replacing any earlier announcement. Chat completions for
+    those models are then routed to it directly. Requires the node's token,
+    and the server must be on a public address.
+    """
+    problem = InferenceRouter.check_url(registration.url)
+    if problem:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Model server URL not accepted: {problem}"
+        )
     
-    return {"status": "ok"}
+    return InferenceRouter.register(db, node, registration)
 
-@router.get("/{node_id}/jobs/poll", response_model=dict)
-async def poll_job(
-    node_id: str,
+@router.delete("/{node_id}/inference", status_code=status.HTTP_200_OK)
+def unregister_inference_endpoints(
+    node: Node = Depends(get_current_node),
     db: Session = Depends(get_db)
 ):
-    """Poll for available jobs for this node"""
+    """Stop routing inference to this node"""
+    removed = InferenceRouter.unregister(db, node)
+    return {"status": "ok", "removed": removed}
+
+def job_payload(job: Job) -> dict:
+    """Job description sent to nodes"""
+    return {
+        "id": job.job_id,
+        "type": job.type.value,
+        "user_id": job.user_id,
+        "config": job.config,
+        "input_files": job.input_files,
+        "output_files": job.output_files,
+        "docker_image": job.docker_image,
+        "command": job.command,
+        "environment": job.environment,
+        "memory_limit": job.memory_limit,
+        "cpu_limit": job.cpu_limit,
+        "gpus": job.gpus
+    }
+
+def claim_for_node(node_id: str, db: Session, max_jobs: int = 1) -> dict:
+    """Try once to claim up to `max_jobs` jobs for a node"""
     
     node = db.query(Node).filter(Node.node_id == node_id).first()
     if not node:
@@ -95,51 +159,113 @@ async def poll_job(
             detail="Node is not active"
         )
     
-    # Check current running jobs count
-    running_jobs = db.query(Job).filter(
-        Job.node_id == node.id,
-        Job.status == JobStatus.RUNNING
-    ).count()
-    
-    if running_jobs >= node.max_concurrent_jobs:
-        return {"job": None, "message": "Node at capacity"}
-    
-    # Find a pending job that matches node capabilities
-    # For now, simple implementation - get first pending job
-    # In production, implement job matching based on resource requirements
-    job = db.query(Job).filter(
-        Job.status == JobStatus.PENDING,
-        Job.gpus <= (1 if node.gpu_enabled else 0) if Job.gpus else True
-    ).first()
-    
-    if job:
-        # Assign job to node
-        job.node_id = node.id
-        job.status = JobStatus.ASSIGNED
-        job.started_at = datetime.utcnow()
-        db.commit()
-        db.refresh(job)
+    # Check free job slots and resources on the node
+    state = SchedulerService.node_state(db, node)
+    if state["slots"] <= 0:
+        return {"job": None, "jobs": [], "message": "Node at capacity"}
+    
+    # Claim the pending jobs that best fit the node's free resources
+    jobs = JobDispatchService.claim_jobs(db, node, max_jobs, state)
+    
+    if jobs:
+        payloads = [job_payload(job) for job in jobs]
+        # "job" is kept for clients that only take one job per poll
+        return {"job": payloads[0], "jobs": payloads}
+    
+    return {"job": None, "jobs": [], "message": "No jobs available"}
+
+@router.get("/{node_id}/jobs/poll", response_model=dict)
+async def poll_job(
+    node_id: str,
+    max_jobs: int = Query(1, ge=1, le=MAX_JOBS_PER_POLL),
+    db: Session = Depends(get_db)
+):
+    """Poll for available jobs for this node, claiming up to `max_jobs` at once"""
+    return await run_in_threadpool(claim_for_node, node_id, db, max_jobs)
+
+@router.get("/{node_id}/jobs", response_model=dict)
+async def wait_for_job(
+    node_id: str,
+    wait: int = Query(30, ge=0, le=settings.JOB_LONG_POLL_MAX_WAIT),
+    max_jobs: int = Query(1, ge=1, le=MAX_JOBS_PER_POLL),
+    db: Session = Depends(get_db)
+):
+    """
+    Long-poll for jobs: blocks until at least one job (up to `max_jobs`) is
+    assigned to this node or `wait` seconds pass. Returns immediately if the
+    node is at capacity.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    
+    while True:
+        # Claiming blocks on the database and Redis; run off the event loop so
+        # pollers woken together do not stall every other request
+        result = await run_in_threadpool(claim_for_node, node_id, db, max_jobs)
+        if result["job"] or result["message"] == "Node at capacity":
+            return result
+        
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return result
         
-        return {
-            "job": {
-                "id": job.job_id,
-                "type": job.type.value,
-                "config": job.config,
-                "input_files": job.input_files,
-                "output_files": job.output_files,
-                "docker_image": job.docker_image,
-                "command": job.command,
-                "environment": job.environment,
-                "memory_limit": job.memory_limit,
-                "cpu_limit": job.cpu_limit,
-                "gpus": job.gpus
-            }
-        }
-    
-    return {"job": None, "message": "No jobs available"}
+        # Release the connection while parked; hundreds of waiting nodes
+        # must not hold the database pool
+        db.rollback()
+        
+        # Re-check on a timer as well, in case a notification is missed
+        await job_notifier.wait(min(remaining, settings.JOB_LONG_POLL_RECHECK_INTERVAL))
+
+def invalid_status_update(status_data: dict) -> Optional[str]:
+    """Why a status update from a node cannot be applied, or None if it can"""
+    if status_data.get("status"):
+        try:
+            JobStatus(status_data["status"])
+        except ValueError:
+            return f"Unknown status {status_data['status']!r}"
+    progress = status_data.get("progress")
+    if progress is not None and (isinstance(progress, bool) or not isinstance(progress, (int, float))):
+        return "progress must be a number"
+    return None
+
+def apply_status_update(db: Session, job: Job, status_data: dict) -> bool:
+    """
+    Apply a status update from a node (caller commits). Updates for jobs
+    that already finished are ignored, e.g. progress that was still in
+    flight when the job completed. Returns False if ignored.
+    """
+    if job.status in FINISHED_JOB_STATUSES:
+        return False
+    
+    # Nodes send every field, with None for those they are not updating
+    if status_data.get("status"):
+        job.status = JobStatus(status_data["status"])
+    if status_data.get("progress") is not None:
+        job.progress = status_data["progress"]
+    if status_data.get("result") is not None:
+        job.result = status_data["result"]
+    if status_data.get("error"):
+        job.error = status_data["error"]
+        job.status = JobStatus.FAILED
+    NodeStatsService.record_timings(job, status_data.get("timings"))
+    
+    # Progress from the node renews its lease on the job
+    if job.status in ACTIVE_JOB_STATUSES:
+        JobLeaseService.renew(job)
+    else:
+        job.lease_expires_at = None
+    if job.status in FINISHED_JOB_STATUSES and job.completed_at is None:
+        job.completed_at = datetime.utcnow()
+    if job.status == JobStatus.FAILED and job.node:
+        job.node.total_jobs_failed += 1
+    
+    # Pipeline jobs that needed this one's output can no longer run
+    if job.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+        PipelineService.cancel_dependents(db, job)
+    return True
 
 @router.put("/{node_id}/jobs/{job_id}/status", status_code=status.HTTP_200_OK)
-async def update_job_status(
+def update_job_status(
     node_id: str,
     job_id: str,
     status_data: dict,
@@ -168,29 +294,146 @@ async def update_job_status(
             detail="Job does not belong to this node"
         )
     
-    # Update job status
-    if "status" in status_data:
-        job.status = JobStatus(status_data["status"])
-    if "progress" in status_data:
-        job.progress = status_data["progress"]
-    if "result" in status_data:
-        job.result = status_data["result"]
-    if "error" in status_data:
-        job.error = status_data["error"]
-        job.status = JobStatus.FAILED
+    problem = invalid_status_update(status_data)
+    if problem:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=problem
+        )
     
+    applied = apply_status_update(db, job, status_data)
     db.commit()
     
-    return {"status": "ok"}
+    return {"status": "ok" if applied else "ignored"}
+
+@router.post("/{node_id}/jobs/status", status_code=status.HTTP_200_OK)
+def update_job_statuses(
+    node_id: str,
+    batch: dict,
+    db: Session = Depends(get_db)
+):
+    """
+    Apply a batch of job status updates ({"updates": [{"job_id", "status",
+    "progress", "result", "error"}, ...]}) in one transaction. Returns the
+    outcome per job: ok, ignored (job already finished), invalid (bad
+    status or progress), not_found or forbidden (job not assigned to this
+    node).
+    """
+    
+    node = db.query(Node).filter(Node.node_id == node_id).first()
+    if not node:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Node not found"
+        )
+    
+    updates = [
+        update for update in batch.get("updates") or []
+        if isinstance(update, dict) and isinstance(update.get("job_id"), str) and update["job_id"]
+    ]
+    if len(updates) > MAX_STATUS_UPDATES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {MAX_STATUS_UPDATES} updates per batch"
+        )
+    
+    job_ids = {update["job_id"] for update in updates}
+    jobs = {
+        job.job_id: job
+        for job in db.query(Job).filter(Job.job_id.in_(job_ids)).all()
+    } if job_ids else {}
+    
+    results = {}
+    for update in updates:
+        job = jobs.get(update["job_id"])
+        if not job:
+            results[update["job_id"]] = "not_found"
+        elif job.node_id != node.id:
+            results[update["job_id"]] = "forbidden"
+        elif invalid_status_update(update):
+            results[update["job_id"]] = "invalid"
+        else:
+            results[update["job_id"]] = "ok" if apply_status_update(db, job, update) else "ignored"
+    
+    db.commit()
+    
+    return {"status": "ok", "results": results}
+
+@router.post("/{node_id}/jobs/{job_id}/logs", status_code=status.HTTP_200_OK)
+async def upload_job_logs(
+    node_id: str,
+    job_id: str,
+    request: Request,
+    seq: int = Query(..., ge=0),
+    db: Session = Depends(get_db)
+):
+    """
+    Append a chunk of job output (raw bytes in the request body). Chunks are
+    numbered from 0 and must be sent in order; resending a stored chunk is
+    harmless.
+    """
+    
+    node = db.query(Node).filter(Node.node_id == node_id).first()
+    if not node:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Node not found"
+        )
+    
+    job = db.query(Job).filter(Job.job_id == job_id).first()
+    if not job:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    
+    # Verify job belongs to this node
+    if job.node_id != node.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Job does not belong to this node"
+        )
+    
+    data = await request.body()
+    if len(data) > settings.JOB_LOG_CHUNK_MAX_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Log chunks are limited to {settings.JOB_LOG_CHUNK_MAX_BYTES} bytes"
+        )
+    
+    try:
+        JobLogService.append(db, job, seq, data)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": str(e), "next_seq": job.log_chunks or 0}
+        )
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=f"Log storage unavailable: {e}"
+        )
+    
+    # Output from the job shows the node is still working on it
+    if job.status in ACTIVE_JOB_STATUSES:
+        JobLeaseService.renew(job)
+    
+    db.commit()
+    
+    return {"status": "ok", "next_seq": job.log_chunks}
 
 @router.post("/{node_id}/jobs/{job_id}/complete", status_code=status.HTTP_200_OK)
-async def complete_job(
+def complete_job(
     node_id: str,
     job_id: str,
     completion_data: dict,
     db: Session = Depends(get_db)
 ):
-    """Mark job as complete"""
+    """
+    Mark job as complete. A completion for a job that already finished (a
+    retry, or a job cancelled or failed meanwhile) is ignored.
+    """
     
     node = db.query(Node).filter(Node.node_id == node_id).first()
     if not node:
@@ -199,7 +442,8 @@ async def complete_job(
             detail="Node not found"
         )
     
-    job = db.query(Job).filter(Job.job_id == job_id).first()
+    # Locked so a cancellation or a second completion cannot interleave
+    job = db.query(Job).filter(Job.job_id == job_id).with_for_update().first()
     if not job:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -213,35 +457,60 @@ async def complete_job(
             detail="Job does not belong to this node"
         )
     
+    if job.status in FINISHED_JOB_STATUSES:
+        finished = job.status.value
+        db.rollback()
+        return {"status": "ignored", "message": f"Job already {finished}"}
+    
     # Update job
     job.status = JobStatus.COMPLETED
     job.completed_at = datetime.utcnow()
+    job.lease_expires_at = None
     if "result" in completion_data:
         job.result = completion_data["result"]
     if "output_cid" in completion_data:
         job.output_cid = completion_data["output_cid"]
-    if "progress" in completion_data:
-        job.progress = completion_data.get("progress", 1.0)
+    if completion_data.get("output_manifest"):
+        try:
+            job.output_manifest = OutputManifest.model_validate(completion_data["output_manifest"]).model_dump()
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Invalid output manifest: {e}"
+            )
+    job.progress = completion_data.get("progress", 1.0)
+    NodeStatsService.record_timings(job, completion_data.get("timings"))
     
     # Update node statistics
     node.total_jobs_completed += 1
     
     db.commit()
     
+    # Start pipeline jobs that were waiting for this one
+    PipelineService.release_dependents(db, job)
+    
     return {"status": "ok", "message": "Job completed"}
 
+def node_response(node: Node, last_seen: Optional[datetime]) -> NodeResponse:
+    """Node details with the latest heartbeat, which may not be flushed yet"""
+    response = NodeResponse.model_validate(node)
+    if last_seen:
+        response.last_heartbeat = last_seen
+    return response
+
 @router.get("", response_model=list[NodeResponse])
-async def list_nodes(
+def list_nodes(
     db: Session = Depends(get_db),
     skip: int = 0,
     limit: int = 100
 ):
     """List all nodes"""
     nodes = db.query(Node).offset(skip).limit(limit).all()
-    return nodes
+    last_seen = NodeService.last_seen([node.node_id for node in nodes])
+    return [node_response(node, last_seen.get(node.node_id)) for node in nodes]
 
 @router.get("/{node_id}", response_model=NodeResponse)
-async def get_node(
+def get_node(
     node_id: str,
     db: Session = Depends(get_db)
 ):
@@ -252,5 +521,5 @@ async def get_node(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Node not found"
         )
-    return node
+    return node_response(node, NodeService.last_seen([node.node_id]).get(node.node_id))
 
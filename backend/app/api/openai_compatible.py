@@ -2,48 +2,49 @@
 OpenAI-compatible API endpoints for AIForge Network
 This allows integration with Continue.dev, ChatGPT-like apps, and other OpenAI-compatible tools
 """
-from fastapi import APIRouter, Depends, HTTPException, status, Header
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import update
 from sqlalchemy.orm import Session
-from app.core.database import get_db
+from app.core.database import get_db, SessionLocal
 from app.models.api_service import APIService, APISubscription, APIRequest
 from app.schemas.api_service import OpenAICompletionRequest, OpenAICompletionResponse
 from app.services.subscription_service import SubscriptionService
-from typing import Optional
-import hashlib
+from app.services.inference_router import inference_router, InferenceUnavailable
+from app.services.api_key_cache import api_key_cache, CachedService, CachedSubscription
+from app.services.rate_limiter import rate_limiter, RateLimitResult
+from typing import AsyncIterator, Optional, Tuple
+import json
 import time
 import uuid
 from decimal import Decimal
 
 router = APIRouter()
 
-def verify_api_key(api_key: str, db: Session) -> Optional[APISubscription]:
-    """Verify API key and return subscription"""
+def verify_api_key(api_key: str, db: Session) -> Optional[Tuple[CachedSubscription, CachedService]]:
+    """Verify API key and return its subscription and service (cached)"""
     if not api_key:
         return None
     
-    # Hash the provided API key
-    api_key_hash = hashlib.sha256(api_key.encode()).hexdigest()
-    
-    # Find subscription by API key hash
-    subscription = db.query(APISubscription).filter(
-        APISubscription.api_key_hash == api_key_hash,
-        APISubscription.is_active == True
-    ).first()
-    
-    if not subscription:
+    found = api_key_cache.get(db, api_key)
+    if not found:
         return None
+    subscription, service = found
     
     # Check if subscription is expired
     from datetime import datetime
     if subscription.expires_at and subscription.expires_at < datetime.utcnow():
-        subscription.is_active = False
+        db.execute(
+            update(APISubscription).where(APISubscription.id == subscription.id).values(is_active=False)
+        )
         db.commit()
+        api_key_cache.invalidate_key(subscription.api_key_hash)
         return None
     
-    return subscription
+    return subscription, service
 
-def check_rate_limit(subscription: APISubscription, service: APIService, db: Session) -> bool:
-    """Check if request is within rate limits"""
+def check_rate_limit(subscription: CachedSubscription, service: CachedService, db: Session) -> RateLimitResult:
+    """Check if request is within rate limits; the result carries the headers to send"""
     from datetime import datetime, timedelta
     
     # Check monthly limit
@@ -53,20 +54,25 @@ def check_rate_limit(subscription: APISubscription, service: APIService, db: Ses
             if subscription.last_reset_at:
                 days_since_reset = (datetime.utcnow() - subscription.last_reset_at).days
                 if days_since_reset >= 30:
-                    subscription.requests_used_this_month = 0
-                    subscription.last_reset_at = datetime.utcnow()
+                    now = datetime.utcnow()
+                    db.execute(
+                        update(APISubscription).where(APISubscription.id == subscription.id).values(
+                            requests_used_this_month=0, last_reset_at=now
+                        )
+                    )
                     db.commit()
+                    subscription.requests_used_this_month = 0
+                    subscription.last_reset_at = now
                 elif subscription.requests_used_this_month >= subscription.monthly_limit:
-                    return False
+                    reset_at = subscription.last_reset_at + timedelta(days=30)
+                    return RateLimitResult(False, (reset_at - datetime.utcnow()).total_seconds())
             else:
-                return False
+                return RateLimitResult(False)
     
-    # TODO: Implement per-minute, per-hour, per-day rate limiting
-    # For now, just check monthly limit
-    
-    return True
+    # Per-minute, per-hour and per-day limits
+    return rate_limiter.hit(subscription.id, service)
 
-def calculate_cost(tokens_used: int, service: APIService, subscription: APISubscription) -> Decimal:
+def calculate_cost(tokens_used: int, service: CachedService, subscription: CachedSubscription) -> Decimal:
     """Calculate cost for API request"""
     if subscription.subscription_type.value == "subscription":
         # Subscription-based: no per-request cost
@@ -78,68 +84,142 @@ def calculate_cost(tokens_used: int, service: APIService, subscription: APISubsc
             return service.price_per_request
     return Decimal("0.00")
 
-async def process_chat_completion(
+def estimate_tokens(text: str) -> int:
+    """Rough token count (1 token ≈ 4 characters)"""
+    return len(text) // 4
+
+def prompt_tokens(messages: list) -> int:
+    return estimate_tokens("".join(msg.get("content", "") for msg in messages))
+
+def check_credits(messages: list, service: CachedService, subscription: CachedSubscription):
+    """
+    Refuse pay-per-request calls that cannot cover their prompt. The
+    completion is charged once it is finished, so this has to be decided
+    before anything is generated or streamed.
+    """
+    if subscription.subscription_type.value == "pay_per_request":
+        if subscription.credits_remaining < calculate_cost(prompt_tokens(messages), service, subscription):
+            raise HTTPException(
+                status_code=status.HTTP_402_PAYMENT_REQUIRED,
+                detail="Insufficient credits"
+            )
+
+async def generate_completion(
     messages: list,
-    model_name: str,
-    service: APIService,
-    subscription: APISubscription,
-    db: Session,
+    model_cid: Optional[str],
     temperature: float = 0.7,
     max_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Yield the completion text in pieces as the model produces them, from a
+    node serving the model. Raises InferenceUnavailable if none can.
+    """
+    if not model_cid:
+        raise InferenceUnavailable("Model has no content ID to serve")
+    payload = {"messages": messages, "temperature": temperature, "max_tokens": max_tokens}
+    async for text in inference_router.stream(model_cid, payload):
+        yield text
+
+def record_usage(
+    db: Session,
+    messages: list,
+    response_text: str,
+    service: CachedService,
+    subscription: CachedSubscription,
+    request_status: str = "success",
+    error_message: Optional[str] = None
 ) -> dict:
     """
-    Process chat completion request
-    This is a placeholder - in production, this would:
-    1. Load the model from IPFS/MinIO
-    2. Run inference using the model
-    3. Return the response
+    Charge for a finished (or interrupted) completion and log the request.
+    Output that was delivered is charged even if the request then failed.
+    Counters are updated in the database rather than from the (possibly
+    cached) snapshots, so concurrent requests do not overwrite each other.
+    Returns the OpenAI usage block.
     """
-    # TODO: Implement actual model inference
-    # For now, return a mock response
-    
-    # Mock response
-    response_text = f"This is a mock response from {service.name}. Model inference not yet implemented."
-    
-    # Estimate tokens (rough approximation: 1 token ≈ 4 characters)
-    input_tokens = sum(len(msg.get("content", "")) for msg in messages) // 4
-    output_tokens = len(response_text) // 4
+    input_tokens = prompt_tokens(messages)
+    output_tokens = estimate_tokens(response_text)
     total_tokens = input_tokens + output_tokens
+    charged = None  # (credits remaining, requests used this month) after the charge
     
-    # Calculate cost
-    cost = calculate_cost(total_tokens, service, subscription)
-    
-    # Update subscription credits if pay-per-request
-    if subscription.subscription_type.value == "pay_per_request":
-        if subscription.credits_remaining < cost:
-            raise HTTPException(
-                status_code=status.HTTP_402_PAYMENT_REQUIRED,
-                detail="Insufficient credits"
+    if request_status != "success" and not response_text:
+        # Nothing was delivered: log the failure without charging for it
+        input_tokens = output_tokens = total_tokens = 0
+        cost = Decimal("0.00")
+    else:
+        # Calculate cost
+        cost = calculate_cost(total_tokens, service, subscription)
+        
+        # Update usage statistics, and subscription credits if pay-per-request
+        counters = {
+            "requests_used_this_month": APISubscription.requests_used_this_month + 1,
+            "total_requests": APISubscription.total_requests + 1
+        }
+        if subscription.subscription_type.value == "pay_per_request":
+            counters["credits_remaining"] = APISubscription.credits_remaining - cost
+            counters["total_spent"] = APISubscription.total_spent + cost
+        charged = db.execute(
+            update(APISubscription).where(APISubscription.id == subscription.id).values(**counters).returning(
+                APISubscription.credits_remaining, APISubscription.requests_used_this_month
             )
-        subscription.credits_remaining -= cost
-        subscription.total_spent += cost
-    
-    # Update usage statistics
-    subscription.requests_used_this_month += 1
-    subscription.total_requests += 1
-    service.total_requests += 1
-    service.total_revenue += cost
+        ).one()
+        db.execute(
+            update(APIService).where(APIService.id == service.id).values(
+                total_requests=APIService.total_requests + 1,
+                total_revenue=APIService.total_revenue + cost
+            )
+        )
     
     # Create API request record
     api_request = APIRequest(
         subscription_id=subscription.id,
         service_id=service.id,
         request_data=str(messages),
-        response_data=response_text,
+        response_data=response_text or None,
         tokens_used=total_tokens,
         input_tokens=input_tokens,
         output_tokens=output_tokens,
         cost=cost,
-        status="success"
+        status=request_status,
+        error_message=error_message
     )
     
     db.add(api_request)
     db.commit()
     
+    if charged:
+        credits_remaining, requests_used = charged
+        subscription.credits_remaining = credits_remaining
+        subscription.requests_used_this_month = requests_used
+        api_key_cache.record_usage(subscription.api_key_hash, credits_remaining, requests_used)
+        if subscription.subscription_type.value == "pay_per_request" and credits_remaining <= 0:
+            # Out of credits: other workers must not keep serving from their copy
+            api_key_cache.invalidate_key(subscription.api_key_hash)
+    
+    return {
+        "prompt_tokens": input_tokens,
+        "completion_tokens": output_tokens,
+        "total_tokens": total_tokens
+    }
+
+async def process_chat_completion(
+    messages: list,
+    model_name: str,
+    service: CachedService,
+    subscription: CachedSubscription,
+    db: Session,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None
+) -> dict:
+    """Run a chat completion to the end and return it in one response"""
+    check_credits(messages, service, subscription)
+    
+    parts = []
+    async for text in generate_completion(messages, service.model_cid, temperature, max_tokens):
+        parts.append(text)
+    response_text = "".join(parts)
+    
+    usage = record_usage(db, messages, response_text, service, subscription)
+    
     return {
         "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
         "object": "chat.completion",
@@ -153,22 +233,84 @@ async def process_chat_completion(
             },
             "finish_reason": "stop"
         }],
-        "usage": {
-            "prompt_tokens": input_tokens,
-            "completion_tokens": output_tokens,
-            "total_tokens": total_tokens
-        }
+        "usage": usage
     }
 
+def server_sent_event(payload) -> str:
+    data = payload if isinstance(payload, str) else json.dumps(payload)
+    return f"data: {data}\n\n"
+
+async def stream_chat_completion(
+    messages: list,
+    model_name: str,
+    model_cid: str,
+    service: CachedService,
+    subscription: CachedSubscription,
+    temperature: float = 0.7,
+    max_tokens: Optional[int] = None
+) -> AsyncIterator[str]:
+    """
+    Server-sent events for a streamed chat completion: one
+    `chat.completion.chunk` per piece of text, then `[DONE]`. Usage is
+    recorded when the stream ends, including when the client disconnects
+    part-way, so only what was generated is charged.
+    """
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    
+    def chunk(delta: dict, finish_reason: Optional[str] = None) -> str:
+        return server_sent_event({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model_name,
+            "choices": [{
+                "index": 0,
+                "delta": delta,
+                "finish_reason": finish_reason
+            }]
+        })
+    
+    parts = []
+    request_status = "success"
+    error_message = None
+    try:
+        # Sent before the backend produces anything, so clients start rendering at once
+        yield chunk({"role": "assistant", "content": ""})
+        async for text in generate_completion(messages, model_cid, temperature, max_tokens):
+            parts.append(text)
+            yield chunk({"content": text})
+        yield chunk({}, "stop")
+        yield server_sent_event("[DONE]")
+    except Exception as e:
+        # The status line has been sent already; report the error in-band
+        request_status = "error"
+        error_message = str(e)
+        yield server_sent_event({"error": {"message": f"Error processing request: {e}", "type": "server_error"}})
+    except BaseException:
+        # Client disconnected (cancelled or closed mid-stream)
+        request_status = "cancelled"
+        error_message = "Client disconnected"
+        raise
+    finally:
+        # The request's session may already be closed once the response is under way
+        db = SessionLocal()
+        try:
+            record_usage(db, messages, "".join(parts), service, subscription, request_status, error_message)
+        finally:
+            db.close()
+
 @router.post("/v1/chat/completions", response_model=OpenAICompletionResponse)
 async def chat_completions(
     request: OpenAICompletionRequest,
+    response: Response,
     authorization: Optional[str] = Header(None),
     db: Session = Depends(get_db)
 ):
     """
     OpenAI-compatible chat completions endpoint
     Usage: Authorization: Bearer <api_key>
+    With "stream": true the completion is sent as server-sent events.
     """
     # Extract API key from Authorization header
     if not authorization or not authorization.startswith("Bearer "):
@@ -180,31 +322,58 @@ async def chat_completions(
     api_key = authorization.replace("Bearer ", "").strip()
     
     # Verify API key
-    subscription = verify_api_key(api_key, db)
-    if not subscription:
+    found = verify_api_key(api_key, db)
+    if not found:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid API key"
         )
+    subscription, service = found
     
-    # Get service
-    service = db.query(APIService).filter(APIService.id == subscription.service_id).first()
-    if not service or not service.is_active:
+    if not service.is_active:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="API service not found or inactive"
         )
     
     # Check rate limits
-    if not check_rate_limit(subscription, service, db):
+    rate_limit = check_rate_limit(subscription, service, db)
+    if not rate_limit.allowed:
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
-            detail="Rate limit exceeded"
+            detail="Rate limit exceeded",
+            headers=rate_limit.headers()
+        )
+    response.headers.update(rate_limit.headers())
+    
+    if request.stream:
+        # Errors after this point are reported inside the stream
+        check_credits(request.messages, service, subscription)
+        try:
+            inference_router.check_available(service.model_cid)
+        except InferenceUnavailable as e:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=str(e)
+            )
+        return StreamingResponse(
+            stream_chat_completion(
+                messages=request.messages,
+                model_name=request.model,
+                model_cid=service.model_cid,
+                service=service,
+                subscription=subscription,
+                temperature=request.temperature,
+                max_tokens=request.max_tokens
+            ),
+            media_type="text/event-stream",
+            # Stop proxies (nginx) from buffering the stream
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **rate_limit.headers()}
         )
     
     # Process chat completion
     try:
-        response = await process_chat_completion(
+        return await process_chat_completion(
             messages=request.messages,
             model_name=request.model,
             service=service,
@@ -213,25 +382,20 @@ async def chat_completions(
             temperature=request.temperature,
             max_tokens=request.max_tokens
         )
-        return response
     except HTTPException:
         raise
+    except InferenceUnavailable as e:
+        db.rollback()
+        record_usage(db, request.messages, "", service, subscription, "error", str(e))
+        
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=str(e)
+        )
     except Exception as e:
         # Log error
-        api_request = APIRequest(
-            subscription_id=subscription.id,
-            service_id=service.id,
-            request_data=str(request.messages),
-            response_data=None,
-            tokens_used=0,
-            input_tokens=0,
-            output_tokens=0,
-            cost=Decimal("0.00"),
-            status="error",
-            error_message=str(e)
-        )
-        db.add(api_request)
-        db.commit()
+        db.rollback()
+        record_usage(db, request.messages, "", service, subscription, "error", str(e))
         
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -249,26 +413,22 @@ async def list_models(
     # Verify API key if provided
     if authorization and authorization.startswith("Bearer "):
         api_key = authorization.replace("Bearer ", "").strip()
-        subscription = verify_api_key(api_key, db)
-        if subscription:
+        found = verify_api_key(api_key, db)
+        if found:
             # Return models for this subscription
-            service = db.query(APIService).filter(APIService.id == subscription.service_id).first()
-            if service:
-                from app.models.model import Model
-                model = db.query(Model).filter(Model.id == service.model_id).first()
-                if model:
-                    return {
-                        "object": "list",
-                        "data": [{
-                            "id": f"aiforge-{service.id}",
-                            "object": "model",
-                            "created": int(time.time()),
-                            "owned_by": "aiforge",
-                            "permission": [],
-                            "root": f"aiforge-{service.id}",
-                            "parent": None
-                        }]
-                    }
+            subscription, service = found
+            return {
+                "object": "list",
+                "data": [{
+                    "id": f"aiforge-{service.id}",
+                    "object": "model",
+                    "created": int(time.time()),
+                    "owned_by": "aiforge",
+                    "permission": [],
+                    "root": f"aiforge-{service.id}",
+                    "parent": None
+                }]
+            }
     
     # Return all public models
     services = db.query(APIService).filter(
@@ -0,0 +1,95 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.orm import Session
+from typing import List
+from app.core.database import get_db
+from app.models.pipeline import Pipeline
+from app.models.user import User
+from app.models.group import GroupMembership
+from app.schemas.pipeline import PipelineCreate, PipelineResponse
+from app.api.dependencies import get_current_user
+from app.services.pipeline_service import PipelineService
+
+router = APIRouter()
+
+def get_pipeline_or_404(db: Session, pipeline_id: str, user: User) -> Pipeline:
+    """A pipeline the user owns; 404 if missing, 403 if someone else's"""
+    pipeline = db.query(Pipeline).filter(Pipeline.pipeline_id == pipeline_id).first()
+    if not pipeline:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Pipeline not found"
+        )
+    if pipeline.user_id is not None and pipeline.user_id != user.id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not your pipeline"
+        )
+    return pipeline
+
+@router.post("", response_model=PipelineResponse, status_code=status.HTTP_201_CREATED)
+async def create_pipeline(
+    pipeline_data: PipelineCreate,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Submit a graph of jobs. Each job may depend on earlier ones; it starts
+    once they complete, with their outputs placed at the paths it asks for.
+    """
+
+    # Jobs submitted for a group count against the group's fair share
+    if pipeline_data.group_id is not None:
+        membership = db.query(GroupMembership).filter(
+            GroupMembership.group_id == pipeline_data.group_id,
+            GroupMembership.user_id == current_user.id
+        ).first()
+        if not membership:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Not a member of this group"
+            )
+
+    try:
+        pipeline = PipelineService.create(db, pipeline_data, current_user.id)
+    except ValueError as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(e)
+        )
+
+    return PipelineService.to_response(db, pipeline)
+
+@router.get("", response_model=List[PipelineResponse])
+async def list_pipelines(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db),
+    skip: int = 0,
+    limit: int = 100
+):
+    """List your pipelines"""
+    pipelines = db.query(Pipeline).filter(
+        Pipeline.user_id == current_user.id
+    ).order_by(Pipeline.created_at.desc()).offset(skip).limit(limit).all()
+    return [PipelineService.to_response(db, pipeline) for pipeline in pipelines]
+
+@router.get("/{pipeline_id}", response_model=PipelineResponse)
+async def get_pipeline(
+    pipeline_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a pipeline with the state of each of its jobs"""
+    pipeline = get_pipeline_or_404(db, pipeline_id, current_user)
+    return PipelineService.to_response(db, pipeline)
+
+@router.delete("/{pipeline_id}", status_code=status.HTTP_200_OK)
+async def cancel_pipeline(
+    pipeline_id: str,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel every job of a pipeline that has not started yet"""
+    pipeline = get_pipeline_or_404(db, pipeline_id, current_user)
+
+    cancelled = PipelineService.cancel(db, pipeline)
+    return {"message": f"Cancelled {cancelled} jobs", "cancelled": cancelled}
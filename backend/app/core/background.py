@@ -0,0 +1,89 @@
+"""
+Periodic maintenance tasks run inside the API process
+Each task runs in a worker thread with its own database session. When
+several API workers are running, a short Redis lock makes sure only one of
+them runs a given task per interval.
+
+The tasks are started from the app's startup hook, so they only run in a
+long-running API process. Serverless deployments (the Vercel entry point)
+never start them; each run is recorded in Redis so callers and /health can
+tell whether anyone is running a task.
+"""
+from typing import Callable, Dict, List
+import asyncio
+import logging
+from sqlalchemy.orm import Session
+from app.core.database import SessionLocal
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+_registry: List[tuple] = []
+_running: List[asyncio.Task] = []
+
+def periodic_task(name: str, interval: float):
+    """Register a function taking a db Session to run every `interval` seconds"""
+    def decorator(func: Callable[[Session], None]):
+        _registry.append((name, interval, func))
+        return func
+    return decorator
+
+def _acquire(name: str, interval: float) -> bool:
+    """Take the per-interval lock for a task. Runs anyway if Redis is down."""
+    try:
+        return bool(redis_client.set(f"background_lock:{name}", "1", nx=True, px=int(interval * 1000)))
+    except Exception:
+        return True
+
+def _ran_key(name: str) -> str:
+    return f"background_ran:{name}"
+
+def _mark_ran(name: str, interval: float):
+    """Record that a task ran, expiring after a few missed intervals"""
+    try:
+        redis_client.set(_ran_key(name), "1", px=int(interval * 3000))
+    except Exception:
+        pass
+
+def task_recent(name: str) -> bool:
+    """Whether any API process has run the task in the last few intervals"""
+    try:
+        return bool(redis_client.exists(_ran_key(name)))
+    except Exception:
+        return False
+
+def task_status() -> Dict[str, bool]:
+    """Whether each registered task is running here or ran recently elsewhere"""
+    return {name: bool(_running) or task_recent(name) for name, _, _ in _registry}
+
+def _run_once(name: str, interval: float, func: Callable[[Session], None]):
+    if not SessionLocal:
+        return
+    _mark_ran(name, interval)
+    db = SessionLocal()
+    try:
+        func(db)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Background task {name} failed: {e}", exc_info=True)
+    finally:
+        db.close()
+
+async def _loop(name: str, interval: float, func: Callable[[Session], None]):
+    while True:
+        await asyncio.sleep(interval)
+        if await asyncio.to_thread(_acquire, name, interval):
+            await asyncio.to_thread(_run_once, name, interval, func)
+
+def start_background_tasks():
+    """Start all registered tasks on the running event loop"""
+    for name, interval, func in _registry:
+        _running.append(asyncio.create_task(_loop(name, interval, func)))
+        logger.info(f"Started background task: {name} (every {interval}s)")
+
+async def stop_background_tasks():
+    """Cancel all running tasks"""
+    for task in _running:
+        task.cancel()
+    await asyncio.gather(*_running, return_exceptions=True)
+    _running.clear()
@@ -8,6 +8,56 @@ class Settings(BaseSettings):
     # Redis
     REDIS_URL: str = "redis://localhost:6379/0"
     
+    # Job dispatch
+    # The *_INTERVAL tasks below run in a long-running API process (app
+    # startup hook); serverless deployments never start them, see /health
+    JOB_QUEUE_RECONCILE_INTERVAL: int = 60  # Seconds between queue/database reconciliation passes
+    JOB_LONG_POLL_MAX_WAIT: int = 60  # Longest a node may block waiting for a job
+    JOB_LONG_POLL_RECHECK_INTERVAL: int = 15  # Waiting nodes re-check this often even without a notification
+    JOB_LEASE_SECONDS: int = 120  # Assignments expire unless heartbeats or progress updates renew them
+    JOB_LEASE_SWEEP_INTERVAL: int = 30  # Seconds between sweeps for expired leases and stale nodes
+    JOB_MAX_ATTEMPTS: int = 3  # Jobs whose lease expires this many times are failed
+    JOB_RETRY_BACKOFF: int = 30  # Base retry delay in seconds, doubled per attempt
+    JOB_RETRY_BACKOFF_MAX: int = 600
+    JOB_IMAGE_DEMAND_INTERVAL: int = 30  # Seconds between recounts of the images pending jobs need
+    NODE_PREFETCH_IMAGES: int = 3  # Most-demanded images suggested to each node for pre-pulling
+    JOB_LOG_TAIL_BYTES: int = 64 * 1024  # Log tail kept on the job row for live viewing
+    JOB_LOG_CHUNK_MAX_BYTES: int = 4 * 1024 * 1024  # Largest log chunk a node may upload at once
+    PIPELINE_MAX_JOBS: int = 100  # Most jobs a single pipeline may contain
+    PIPELINE_AFFINITY_SECONDS: int = 30  # Released jobs are held this long for the node that ran their parent
+    PIPELINE_RELEASE_INTERVAL: int = 60  # Seconds between sweeps for waiting jobs whose parents have finished
+    
+    # Node heartbeats
+    NODE_HEARTBEAT_FLUSH_INTERVAL: int = 5  # Seconds between bulk writes of buffered heartbeats
+    NODE_HEARTBEAT_TIMEOUT: int = 90  # Nodes silent for longer are not counted as online
+
+    # Node performance
+    NODE_STATS_INTERVAL: int = 60  # Seconds between recomputations of per-node statistics
+    NODE_STATS_WINDOW_HOURS: int = 24  # Only jobs finished this recently count
+    NODE_STATS_MAX_JOBS: int = 200  # Most recent jobs per node that count
+    NODE_STATS_MIN_JOBS: int = 5  # Nodes with fewer jobs are never flagged as flaky
+    NODE_FLAKY_FAILURE_RATE: float = 0.5  # Nodes failing this share of jobs run one job at a time
+    NODE_SLOW_DOWNLOAD_FACTOR: float = 3.0  # Median downloads this many times the fleet's are flagged slow
+
+    # Inference routing
+    INFERENCE_CONNECT_TIMEOUT: float = 2.0  # Seconds to connect to a node's model server
+    INFERENCE_READ_TIMEOUT: float = 120.0  # Longest wait for the next piece of a completion
+    INFERENCE_MAX_CONNECTIONS: int = 500  # Connections to model servers per API worker
+    INFERENCE_MAX_KEEPALIVE: int = 100  # Idle connections kept open for reuse per API worker
+    INFERENCE_MAX_ATTEMPTS: int = 3  # Endpoints tried before a request fails, if none has answered yet
+    INFERENCE_EJECT_SECONDS: int = 30  # Endpoints that fail a request are skipped this long
+    INFERENCE_ENDPOINT_CACHE_SECONDS: float = 5.0  # How long each worker reuses a model's endpoint list
+    INFERENCE_HEALTH_INTERVAL: int = 15  # Seconds between health checks of every endpoint
+    INFERENCE_HEALTH_TIMEOUT: float = 2.0
+    INFERENCE_UNHEALTHY_AFTER: int = 2  # Consecutive failed checks before an endpoint stops receiving requests
+    INFERENCE_ALLOW_PRIVATE_URLS: bool = False  # Accept model servers on private or loopback addresses (development only)
+
+    # API keys
+    API_KEY_CACHE_SIZE: int = 10000  # Subscriptions each API worker keeps in memory
+    API_KEY_CACHE_TTL: float = 60.0  # Seconds before a cached subscription is re-read from the database
+    RATE_LIMIT_REDIS_RETRY: int = 10  # After Redis fails, rate limits are kept per worker this long
+    RATE_LIMIT_LOCAL_MAX_BUCKETS: int = 100000  # Per-worker buckets kept while Redis is unavailable
+    
     # JWT
     SECRET_KEY: str = "your-secret-key-change-in-production"
     ALGORITHM: str = "HS256"
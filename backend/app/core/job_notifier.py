@@ -0,0 +1,81 @@
+"""
+Wake-ups for long-polling nodes
+Publishing on a Redis channel reaches long polls parked in every API worker.
+Each worker keeps one subscriber task that fans notifications out to its
+local waiters. Without Redis, notifications only reach the local worker and
+waiters fall back to re-checking on a timer.
+"""
+from typing import Optional
+import asyncio
+import logging
+import redis.asyncio as aioredis
+from app.core.config import settings
+from app.core.redis_client import redis_client
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "job_queue:events"
+
+class JobNotifier:
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._event: Optional[asyncio.Event] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _wake(self):
+        """Release every current waiter (runs on the event loop)"""
+        if self._event:
+            self._event.set()
+        self._event = asyncio.Event()
+
+    def _wake_local(self):
+        if self._loop and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake)
+
+    def notify(self):
+        """Signal that new jobs were queued. Safe to call from any thread."""
+        try:
+            redis_client.publish(CHANNEL, "1")
+        except Exception:
+            self._wake_local()
+
+    async def _listen(self):
+        while True:
+            client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._wake()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Job notification listener disconnected: {e}")
+            finally:
+                try:
+                    await client.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(5)
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to `timeout` seconds for a notification. Returns True if woken."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # First use, or the app was restarted on a new event loop
+            self._loop = loop
+            self._event = asyncio.Event()
+            self._listener = None
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self._listen())
+
+        event = self._event
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+# Global notifier instance
+job_notifier = JobNotifier()
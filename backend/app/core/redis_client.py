@@ -0,0 +1,11 @@
+import redis
+from app.core.config import settings
+
+# Shared Redis connection pool. redis.from_url does not connect until the
+# first command, so importing this module never fails when Redis is down.
+redis_client = redis.from_url(
+    settings.REDIS_URL,
+    decode_responses=True,
+    socket_timeout=5,
+    socket_connect_timeout=2
+)
@@ -71,13 +71,14 @@ def safe_include_router(module_name: str, router_attr: str, prefix: str, tags: l
 # Import and include routers
 import_error_info = None
 try:
-    from app.api import auth, groups, models, nodes, jobs, wallets, payments, subscriptions, admin, api_services, openai_compatible, revenue, publishing, group_revenue, nft, infrastructure, chat, system_settings
+    from app.api import auth, groups, models, nodes, jobs, pipelines, wallets, payments, subscriptions, admin, api_services, openai_compatible, revenue, publishing, group_revenue, nft, infrastructure, chat, system_settings
     
     app.include_router(auth.router, prefix="/api/auth", tags=["auth"])
     app.include_router(groups.router, prefix="/api/groups", tags=["groups"])
     app.include_router(models.router, prefix="/api/models", tags=["models"])
     app.include_router(nodes.router, prefix="/api/nodes", tags=["nodes"])
     app.include_router(jobs.router, prefix="/api/jobs", tags=["jobs"])
+    app.include_router(pipelines.router, prefix="/api/pipelines", tags=["pipelines"])
     app.include_router(wallets.router, prefix="/api/wallets", tags=["wallets"])
     app.include_router(payments.router, prefix="/api/payments", tags=["payments"])
     app.include_router(subscriptions.router, prefix="/api/subscriptions", tags=["subscriptions"])
@@ -107,6 +108,19 @@ except Exception as e:
     async def import_error():
         return import_error_info if import_error_info else {"error": "Unknown import error"}
 
+@app.on_event("startup")
+async def startup_background_tasks():
+    """Start periodic maintenance tasks (queue reconciliation, etc.)"""
+    from app.core.background import start_background_tasks
+    start_background_tasks()
+
+@app.on_event("shutdown")
+async def shutdown_background_tasks():
+    from app.core.background import stop_background_tasks
+    from app.services.inference_router import inference_router
+    await stop_background_tasks()
+    await inference_router.close()
+
 @app.get("/")
 async def root():
     return {"message": "AIForge Network API", "version": "0.1.0"}
@@ -115,6 +129,7 @@ async def root():
 async def health():
     """Health check endpoint - tests database connection"""
     from app.core.database import engine
+    from app.core.background import task_status
     from sqlalchemy import text
     try:
         if not engine:
@@ -126,9 +141,21 @@ async def health():
         # Test database connection
         with engine.connect() as conn:
             conn.execute(text("SELECT 1"))
+        # Periodic maintenance (lease sweep, queue reconciliation, ...) only
+        # runs in a long-running process; serverless never starts it
+        tasks = task_status()
+        stopped = sorted(name for name, recent in tasks.items() if not recent)
+        if stopped:
+            return {
+                "status": "degraded",
+                "database": "connected",
+                "background_tasks": "not running",
+                "stopped_tasks": stopped
+            }
         return {
             "status": "healthy",
-            "database": "connected"
+            "database": "connected",
+            "background_tasks": "running"
         }
     except Exception as e:
         return {
@@ -3,6 +3,8 @@ from app.models.group import Group, GroupMembership
 from app.models.model import Model
 from app.models.node import Node
 from app.models.job import Job, JobStatus, JobType
+from app.models.pipeline import Pipeline, JobDependency
+from app.models.inference import InferenceEndpoint
 from app.models.wallet import UserWallet, AdminWallet, WalletNetwork, WalletType
 from app.models.payment import Payment, PaymentStatus, PaymentType
 from app.models.subscription import Subscription, SubscriptionPlan, SubscriptionStatus
@@ -18,7 +20,7 @@ from app.models.system_settings import SystemSetting, FeatureFlag, SystemLog
 
 __all__ = [
     "User", "Group", "GroupMembership", "Model", 
-    "Node", "Job", "JobStatus", "JobType",
+    "Node", "Job", "JobStatus", "JobType", "Pipeline", "JobDependency", "InferenceEndpoint",
     "UserWallet", "AdminWallet", "WalletNetwork", "WalletType",
     "Payment", "PaymentStatus", "PaymentType",
     "Subscription", "SubscriptionPlan", "SubscriptionStatus",
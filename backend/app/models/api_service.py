@@ -113,7 +113,7 @@ class APIRequest(Base):
     cost = Column(Numeric(18, 8), default=0.0, nullable=False)  # Cost in USDT
     
     # Status
-    status = Column(String, default="success", nullable=False)  # "success", "error", "rate_limited"
+    status = Column(String, default="success", nullable=False)  # "success", "error", "cancelled", "rate_limited"
     error_message = Column(Text, nullable=True)
     
     # Timestamps
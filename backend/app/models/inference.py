@@ -0,0 +1,34 @@
+"""
+Inference Endpoint Model
+A node serving a model over HTTP. The coordinator routes interactive
+requests for the model (by IPFS CID) straight to these endpoints instead of
+through the job queue.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Boolean, UniqueConstraint
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class InferenceEndpoint(Base):
+    """One model served by one node"""
+    __tablename__ = "inference_endpoints"
+    __table_args__ = (
+        UniqueConstraint("node_id", "model_cid", name="uq_inference_endpoints_node_model"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    node_id = Column(Integer, ForeignKey("nodes.id", ondelete="CASCADE"), nullable=False, index=True)
+    model_cid = Column(String, nullable=False, index=True)  # IPFS CID of the model served
+    url = Column(String, nullable=False)  # Base URL of the node's model server
+    max_concurrency = Column(Integer, default=4, nullable=False)  # Requests the node accepts at once
+    secret = Column(String, nullable=True)  # Bearer token the coordinator presents to the model server
+
+    # Health (InferenceRouter health checks)
+    is_healthy = Column(Boolean, default=True, nullable=False)
+    consecutive_failures = Column(Integer, default=0, nullable=False)
+    last_checked_at = Column(DateTime(timezone=True), nullable=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    node = relationship("Node")
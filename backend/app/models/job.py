@@ -1,10 +1,11 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Enum, JSON, Float, Text
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, Enum, JSON, Float, Text, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 from app.core.database import Base
 
 class JobStatus(str, enum.Enum):
+    WAITING = "waiting"  # Held until the jobs it depends on complete
     PENDING = "pending"
     ASSIGNED = "assigned"
     RUNNING = "running"
@@ -26,9 +27,23 @@ class Job(Base):
     job_id = Column(String, unique=True, index=True, nullable=False)  # Unique identifier
     type = Column(Enum(JobType), default=JobType.TEST, nullable=False)
     
+    # Ownership and scheduling
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # Submitter
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)  # Group the job is billed to for fair share
+    priority = Column(Integer, default=1, nullable=False)  # Priority class, higher is dispatched first
+    
+    # Pipelines: jobs whose inputs are the outputs of earlier jobs
+    pipeline_id = Column(Integer, ForeignKey("pipelines.id"), nullable=True, index=True)
+    stage = Column(String, nullable=True)  # Name of the job within its pipeline
+    
     # Assignment
     node_id = Column(Integer, ForeignKey("nodes.id"), nullable=True)
     status = Column(Enum(JobStatus), default=JobStatus.PENDING, nullable=False)
+    lease_expires_at = Column(DateTime(timezone=True), nullable=True)  # Assignment is reclaimed after this
+    attempts = Column(Integer, default=0, nullable=False)  # Times the job has been assigned
+    available_at = Column(DateTime(timezone=True), nullable=True)  # Retry backoff: not claimable before this
+    preferred_node_id = Column(Integer, ForeignKey("nodes.id"), nullable=True)  # Node holding the job's inputs
+    affinity_until = Column(DateTime(timezone=True), nullable=True)  # Only the preferred node may claim it before this
     
     # Job configuration
     config = Column(JSON, nullable=False)  # Job-specific configuration
@@ -45,17 +60,40 @@ class Job(Base):
     result = Column(JSON, nullable=True)
     error = Column(Text, nullable=True)
     output_cid = Column(String, nullable=True)  # IPFS CID of output
+    output_manifest = Column(JSON, nullable=True)  # {"cid", "format", "files": [{"path", "size", "cid"}], "missing"}
+    
+    # Logs are shipped in chunks to object storage; only a bounded tail is kept here
+    log_object_prefix = Column(String, nullable=True)  # e.g. "job-logs/job-1a2b3c4d/"
+    log_chunks = Column(Integer, default=0, nullable=False)  # Chunks stored so far
+    log_bytes = Column(BigInteger, default=0, nullable=False)  # Total log size
+    log_tail = Column(Text, nullable=True)  # Last JOB_LOG_TAIL_BYTES of the log
     
     # Resource requirements
     memory_limit = Column(String, nullable=True)  # e.g., "4G"
     cpu_limit = Column(Float, nullable=True)  # CPU cores
     gpus = Column(Integer, nullable=True)  # Number of GPUs required
     
-    # Timestamps
+    # Lifecycle timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    started_at = Column(DateTime(timezone=True), nullable=True)
-    completed_at = Column(DateTime(timezone=True), nullable=True)
+    queued_at = Column(DateTime(timezone=True), nullable=True)  # Last became pending (submitted, released or requeued)
+    started_at = Column(DateTime(timezone=True), nullable=True)  # Claimed by a node
+    inputs_ready_at = Column(DateTime(timezone=True), nullable=True)  # Reported by the node
+    container_started_at = Column(DateTime(timezone=True), nullable=True)  # Reported by the node
+    completed_at = Column(DateTime(timezone=True), nullable=True, index=True)  # Finished, successfully or not
+    
+    # Durations derived from the timestamps, for per-node statistics. The
+    # node-side ones are measured on the node's clock, so clock skew between
+    # node and coordinator does not distort them.
+    queue_seconds = Column(Float, nullable=True)  # Eligible to claimed
+    download_seconds = Column(Float, nullable=True)  # Received by the node to inputs ready
+    run_seconds = Column(Float, nullable=True)  # Container started to finished
     
     # Relationships
-    node = relationship("Node", back_populates="jobs")
+    node = relationship("Node", back_populates="jobs", foreign_keys=[node_id])
+    pipeline = relationship("Pipeline", back_populates="jobs")
+    
+    __table_args__ = (
+        Index("ix_jobs_status_lease_expires_at", "status", "lease_expires_at"),
+        Index("ix_jobs_node_id_completed_at", "node_id", "completed_at"),
+    )
 
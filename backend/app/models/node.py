@@ -10,6 +10,7 @@ class Node(Base):
     node_id = Column(String, unique=True, index=True, nullable=False)  # Unique identifier
     name = Column(String, nullable=False)
     description = Column(String, nullable=True)
+    token_hash = Column(String, nullable=True)  # SHA-256 of the token issued at registration
     
     # Status
     is_active = Column(Boolean, default=True, nullable=False)
@@ -23,11 +24,12 @@ class Node(Base):
     # Statistics
     total_jobs_completed = Column(Integer, default=0, nullable=False)
     total_jobs_failed = Column(Integer, default=0, nullable=False)
+    performance = Column(JSON, nullable=True)  # Rolling statistics over recent jobs (NodeStatsService)
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
     
     # Relationships
-    jobs = relationship("Job", back_populates="node", cascade="all, delete-orphan")
+    jobs = relationship("Job", back_populates="node", foreign_keys="Job.node_id", cascade="all, delete-orphan")
 
@@ -0,0 +1,37 @@
+"""
+Pipeline Models
+A pipeline is a set of jobs linked by dependencies: a job waits until the
+jobs it depends on complete, then reads their outputs as inputs.
+"""
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey
+from sqlalchemy.orm import relationship
+from sqlalchemy.sql import func
+from app.core.database import Base
+
+class Pipeline(Base):
+    """A submitted job graph"""
+    __tablename__ = "pipelines"
+
+    id = Column(Integer, primary_key=True, index=True)
+    pipeline_id = Column(String, unique=True, index=True, nullable=False)  # Unique identifier
+    name = Column(String, nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # Submitter
+    group_id = Column(Integer, ForeignKey("groups.id"), nullable=True)  # Group the jobs are billed to
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    # Relationships
+    jobs = relationship("Job", back_populates="pipeline", order_by="Job.id")
+
+class JobDependency(Base):
+    """An edge of the graph: `job_id` reads an output of `depends_on_id`"""
+    __tablename__ = "job_dependencies"
+
+    job_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True)
+    depends_on_id = Column(Integer, ForeignKey("jobs.id", ondelete="CASCADE"), primary_key=True, index=True)
+    input_path = Column(String, nullable=False)  # Where the parent's output is placed in the child's workspace
+    output_file = Column(String, nullable=True)  # One file of the parent's output package; the whole package if None
+
+    # Relationships
+    job = relationship("Job", foreign_keys=[job_id])
+    depends_on = relationship("Job", foreign_keys=[depends_on_id])
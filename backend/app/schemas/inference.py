@@ -0,0 +1,23 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, List
+
+class InferenceRegistration(BaseModel):
+    url: str  # Base URL of the node's model server, reachable from the coordinator
+    models: List[str]  # IPFS CIDs of the models it serves
+    max_concurrency: int = Field(4, ge=1)  # Requests it accepts at once
+
+class InferenceEndpointResponse(BaseModel):
+    id: int
+    node_id: int
+    model_cid: str
+    url: str
+    max_concurrency: int
+    secret: Optional[str] = None  # The model server must require it as a Bearer token
+    is_healthy: bool
+    last_checked_at: Optional[datetime] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+        protected_namespaces = ()
@@ -3,6 +3,17 @@ from datetime import datetime
 from typing import Optional, Dict, Any, List
 from app.models.job import JobStatus, JobType
 
+class OutputFile(BaseModel):
+    path: str
+    size: int
+    cid: Optional[str] = None  # None inside tar packages
+
+class OutputManifest(BaseModel):
+    cid: Optional[str] = None  # Root of the package (IPFS directory or archive)
+    format: Optional[str] = None  # "directory", "tar" or "tar.zst"
+    files: List[OutputFile] = []
+    missing: List[str] = []  # Declared outputs the job did not produce
+
 class JobBase(BaseModel):
     type: JobType = JobType.TEST
     config: Dict[str, Any]
@@ -16,20 +27,34 @@ class JobBase(BaseModel):
     gpus: Optional[int] = None
 
 class JobCreate(JobBase):
-    pass
+    group_id: Optional[int] = None  # Submit on behalf of a group you belong to
 
 class JobResponse(JobBase):
     id: int
     job_id: str
+    user_id: Optional[int] = None
+    group_id: Optional[int] = None
+    priority: int
+    stage: Optional[str] = None  # Name within its pipeline, if any
     node_id: Optional[int] = None
     status: JobStatus
     progress: float
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
     output_cid: Optional[str] = None
+    output_manifest: Optional[OutputManifest] = None
+    log_bytes: int = 0
+    attempts: int = 0
+    lease_expires_at: Optional[datetime] = None
     created_at: datetime
+    queued_at: Optional[datetime] = None
     started_at: Optional[datetime] = None
+    inputs_ready_at: Optional[datetime] = None
+    container_started_at: Optional[datetime] = None
     completed_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None
+    download_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
     
     class Config:
         from_attributes = True
@@ -42,9 +67,20 @@ class JobStatusUpdate(BaseModel):
     progress: Optional[float] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    timings: Optional[Dict[str, float]] = None  # Unix times of received, inputs_ready, container_started, finished
 
 class JobComplete(BaseModel):
     status: JobStatus = JobStatus.COMPLETED
     result: Dict[str, Any]
     output_cid: Optional[str] = None
+    output_manifest: Optional[OutputManifest] = None
+    timings: Optional[Dict[str, float]] = None
+
 
+class JobLogTail(BaseModel):
+    job_id: str
+    status: JobStatus
+    progress: float
+    log_bytes: int  # Total size of the log so far
+    offset: int  # Byte offset in the full log where `text` starts
+    text: str
@@ -18,6 +18,7 @@ class NodeResponse(NodeBase):
     resources: Optional[Dict[str, Any]] = None
     total_jobs_completed: int
     total_jobs_failed: int
+    performance: Optional[Dict[str, Any]] = None  # Rolling statistics over recent jobs
     created_at: datetime
     
     class Config:
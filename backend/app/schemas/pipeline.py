@@ -0,0 +1,30 @@
+from pydantic import BaseModel, Field
+from datetime import datetime
+from typing import Optional, Dict, List
+from app.schemas.job import JobBase, JobResponse
+
+class PipelineDependency(BaseModel):
+    job: str  # Name of the job whose output is needed
+    path: str  # Where the output is placed in the dependent job's workspace
+    file: Optional[str] = None  # One file of the output package instead of all of it
+
+class PipelineJob(BaseModel):
+    name: str = Field(..., min_length=1)  # Unique within the pipeline
+    job: JobBase
+    depends_on: List[PipelineDependency] = []
+
+class PipelineCreate(BaseModel):
+    name: Optional[str] = None
+    group_id: Optional[int] = None  # Submit on behalf of a group you belong to
+    jobs: List[PipelineJob] = Field(..., min_length=1)
+
+class PipelineResponse(BaseModel):
+    id: int
+    pipeline_id: str
+    name: Optional[str] = None
+    user_id: Optional[int] = None
+    group_id: Optional[int] = None
+    status: str  # waiting, running, completed, failed or cancelled
+    jobs: List[JobResponse]
+    dependencies: Dict[str, List[str]]  # Job name -> names of the jobs it depends on
+    created_at: datetime
@@ -0,0 +1,194 @@
+"""
+API key cache
+Keeps what authorising a chat completion needs (the subscription behind an
+API key and its service) in memory, so a request with a known key makes no
+database round trips before inference starts. Entries expire after
+API_KEY_CACHE_TTL seconds and the least recently used are dropped beyond
+API_KEY_CACHE_SIZE.
+
+Code that deactivates a subscription or changes a service calls
+invalidate_key() / invalidate_service(); the invalidation is published on
+Redis so every API worker drops its copy. Without Redis it only reaches the
+local worker and the others catch up when their entries expire.
+"""
+from typing import Optional, Tuple
+from collections import OrderedDict
+from decimal import Decimal
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+import redis.asyncio as aioredis
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.models.api_service import APIService, APISubscription
+from app.models.model import Model
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "api_keys:invalidate"
+
+class CachedSubscription:
+    """The fields of an APISubscription needed to authorise and charge a request"""
+
+    def __init__(self, subscription: APISubscription):
+        self.id = subscription.id
+        self.service_id = subscription.service_id
+        self.user_id = subscription.user_id
+        self.api_key_hash = subscription.api_key_hash
+        self.subscription_type = subscription.subscription_type
+        self.credits_remaining = Decimal(subscription.credits_remaining or 0)
+        self.monthly_limit = subscription.monthly_limit
+        self.requests_used_this_month = subscription.requests_used_this_month or 0
+        self.last_reset_at = subscription.last_reset_at
+        self.expires_at = subscription.expires_at
+
+class CachedService:
+    """The fields of an APIService needed to authorise, route and price a request"""
+
+    def __init__(self, service: APIService, model_cid: Optional[str]):
+        self.id = service.id
+        self.name = service.name
+        self.is_active = service.is_active
+        self.price_per_token = service.price_per_token
+        self.price_per_request = service.price_per_request
+        self.rate_limit_per_minute = service.rate_limit_per_minute
+        self.rate_limit_per_hour = service.rate_limit_per_hour
+        self.rate_limit_per_day = service.rate_limit_per_day
+        self.model_cid = model_cid  # IPFS CID of the model; inference nodes register by it
+
+# (expires at, subscription, service)
+Entry = Tuple[float, CachedSubscription, CachedService]
+
+class APIKeyCache:
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Entry]" = OrderedDict()
+        # Bumped by every invalidation, so a lookup that raced one is not cached
+        self._generation = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def hash_key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode()).hexdigest()
+
+    @staticmethod
+    def snapshot(subscription: APISubscription, service: APIService) -> Tuple[CachedSubscription, CachedService]:
+        """Snapshots of ORM rows, for callers that loaded them already"""
+        return CachedSubscription(subscription), CachedService(service, service.model.ipfs_cid if service.model else None)
+
+    def get(self, db: Session, api_key: str) -> Optional[Tuple[CachedSubscription, CachedService]]:
+        """The active subscription for an API key and its service, or None"""
+        self._ensure_listener()
+        api_key_hash = self.hash_key(api_key)
+        with self._lock:
+            entry = self._entries.get(api_key_hash)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(api_key_hash)
+                return entry[1], entry[2]
+            generation = self._generation
+
+        # Subscription, service and model CID in one query
+        row = db.query(APISubscription, APIService, Model.ipfs_cid).join(
+            APIService, APIService.id == APISubscription.service_id
+        ).outerjoin(
+            Model, Model.id == APIService.model_id
+        ).filter(
+            APISubscription.api_key_hash == api_key_hash,
+            APISubscription.is_active == True
+        ).first()
+        if row is None:
+            return None
+        subscription, service = CachedSubscription(row[0]), CachedService(row[1], row[2])
+
+        with self._lock:
+            if generation == self._generation:
+                self._entries[api_key_hash] = (time.monotonic() + self.ttl, subscription, service)
+                self._entries.move_to_end(api_key_hash)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return subscription, service
+
+    def record_usage(self, api_key_hash: str, credits_remaining: Decimal, requests_used_this_month: int):
+        """Bring a cached subscription's counters up to date after a request was charged"""
+        with self._lock:
+            entry = self._entries.get(api_key_hash)
+            if entry:
+                entry[1].credits_remaining = credits_remaining
+                entry[1].requests_used_this_month = requests_used_this_month
+
+    def _drop(self, message: str):
+        """Apply an invalidation message ("key:<hash>" or "service:<id>") locally"""
+        kind, _, value = message.partition(":")
+        with self._lock:
+            self._generation += 1
+            if kind == "key":
+                self._entries.pop(value, None)
+            elif kind == "service":
+                for api_key_hash in [h for h, entry in self._entries.items() if str(entry[2].id) == value]:
+                    del self._entries[api_key_hash]
+            else:
+                self._entries.clear()
+
+    def _publish(self, message: str):
+        self._drop(message)
+        try:
+            redis_client.publish(CHANNEL, message)
+        except Exception as e:
+            logger.warning(f"API key invalidation not published, other workers will catch up in {self.ttl}s: {e}")
+
+    def invalidate_key(self, api_key_hash: str):
+        """Forget a subscription everywhere (deactivated, expired, out of credits...)"""
+        self._publish(f"key:{api_key_hash}")
+
+    def invalidate_service(self, service_id: int):
+        """Forget every subscription to a service everywhere (service updated)"""
+        self._publish(f"service:{service_id}")
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+    async def _listen(self):
+        while True:
+            client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+            try:
+                pubsub = client.pubsub()
+                await pubsub.subscribe(CHANNEL)
+                # Invalidations may have been missed while not subscribed
+                self.clear()
+                async for message in pubsub.listen():
+                    if message.get("type") == "message":
+                        self._drop(message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"API key invalidation listener disconnected: {e}")
+            finally:
+                try:
+                    await client.close()
+                except Exception:
+                    pass
+            await asyncio.sleep(5)
+
+    def _ensure_listener(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not called from the event loop (background thread): nothing to start
+            return
+        if self._loop is not loop:
+            # First use, or the app was restarted on a new event loop
+            self._loop = loop
+            self._listener = None
+        if self._listener is None or self._listener.done():
+            self._listener = loop.create_task(self._listen())
+
+# Global cache instance
+api_key_cache = APIKeyCache(settings.API_KEY_CACHE_SIZE, settings.API_KEY_CACHE_TTL)
@@ -10,6 +10,7 @@ from app.models.user import User
 from app.models.model import Model
 from app.models.api_service import APIService, APISubscription
 from app.api.openai_compatible import process_chat_completion
+from app.services.api_key_cache import APIKeyCache
 from decimal import Decimal
 
 class ChatService:
@@ -184,12 +185,13 @@ class ChatService:
         )
         
         # Process chat completion
+        cached_subscription, cached_service = APIKeyCache.snapshot(subscription, api_service)
         try:
             response = await process_chat_completion(
                 messages=message_history,
                 model_name=api_service.name,
-                service=api_service,
-                subscription=subscription,
+                service=cached_service,
+                subscription=cached_subscription,
                 db=db,
                 temperature=temperature,
                 max_tokens=max_tokens
@@ -415,11 +417,12 @@ class ChatService:
         max_toks = max_tokens if max_tokens is not None else original_metadata.get("max_tokens")
         
         # Regenerate
+        cached_subscription, cached_service = APIKeyCache.snapshot(subscription, api_service)
         response = await process_chat_completion(
             messages=message_history,
             model_name=api_service.name,
-            service=api_service,
-            subscription=subscription,
+            service=cached_service,
+            subscription=cached_subscription,
             db=db,
             temperature=temp,
             max_tokens=max_toks
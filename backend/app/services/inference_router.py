@@ -0,0 +1,382 @@
+"""
+Inference Router
+Sends interactive inference requests straight to nodes that serve the
+model, instead of through the job queue. Nodes register an HTTP model
+server for each model CID they hold; each API worker forwards requests over
+a pool of keep-alive connections to the endpoint with the fewest requests
+in flight from that worker. Endpoints that fail a request are skipped for a
+while, and a periodic health check takes unresponsive ones out of rotation.
+Model servers must be on public addresses: an endpoint's name is resolved
+and checked by the coordinator, which then connects to the checked address.
+
+Model server protocol:
+    GET  {url}/health          200 when the server is up
+    POST {url}/v1/completions  {"model": cid, "messages": [...],
+                                "temperature": ..., "max_tokens": ...}
+        with "Authorization: Bearer <secret>", the secret issued to the
+        node when it registered the endpoint.
+        200 with newline-delimited JSON: {"text": "..."} per piece of
+        output, then {"done": true}; {"error": "..."} if generation fails.
+        503 or 429 when the server is at capacity; 401 without the secret.
+"""
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing
+from datetime import datetime
+from urllib.parse import urlsplit
+import asyncio
+import ipaddress
+import json
+import logging
+import random
+import secrets
+import socket
+import time
+import httpx
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.background import periodic_task
+from app.models.inference import InferenceEndpoint
+from app.models.node import Node
+from app.schemas.inference import InferenceRegistration
+
+logger = logging.getLogger(__name__)
+
+# Endpoints probed at once by the health check
+HEALTH_CHECK_WORKERS = 16
+
+# (endpoint id, base URL, max concurrency, secret)
+Endpoint = Tuple[int, str, int, Optional[str]]
+
+class InferenceUnavailable(Exception):
+    """No endpoint could take the request"""
+
+class InferenceError(Exception):
+    """The model server failed the request"""
+
+class _EndpointFailed(Exception):
+    """The endpoint failed before producing output; another may be tried"""
+
+class InferenceRouter:
+    """Per-worker routing state: connection pool, in-flight counts, ejections"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self._outstanding: Dict[int, int] = defaultdict(int)
+        self._ejected_until: Dict[int, float] = {}
+        self._endpoints: Dict[str, Tuple[float, List[Endpoint]]] = {}
+        self._addresses: Dict[str, Tuple[float, str]] = {}
+
+    def _http(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            # First use, or the app was restarted on a new event loop
+            self._loop = loop
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(settings.INFERENCE_READ_TIMEOUT, connect=settings.INFERENCE_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=settings.INFERENCE_MAX_CONNECTIONS,
+                    max_keepalive_connections=settings.INFERENCE_MAX_KEEPALIVE
+                )
+            )
+        return self._client
+
+    async def close(self):
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            await self._client.aclose()
+        self._client = None
+
+    def endpoints(self, model_cid: str) -> List[Endpoint]:
+        """Healthy endpoints of active nodes serving a model, cached briefly"""
+        now = time.monotonic()
+        cached = self._endpoints.get(model_cid)
+        if cached and cached[0] > now:
+            return cached[1]
+
+        db = SessionLocal()
+        try:
+            rows = db.query(
+                InferenceEndpoint.id, InferenceEndpoint.url, InferenceEndpoint.max_concurrency,
+                InferenceEndpoint.secret
+            ).join(Node, Node.id == InferenceEndpoint.node_id).filter(
+                InferenceEndpoint.model_cid == model_cid,
+                InferenceEndpoint.is_healthy == True,
+                Node.is_active == True
+            ).all()
+        finally:
+            db.close()
+        endpoints = [tuple(row) for row in rows]
+        self._endpoints[model_cid] = (now + settings.INFERENCE_ENDPOINT_CACHE_SECONDS, endpoints)
+        return endpoints
+
+    def _pick(self, endpoints: List[Endpoint], tried: Set[int]) -> Optional[Endpoint]:
+        """The endpoint with the fewest requests in flight, ties broken at random"""
+        now = time.monotonic()
+        candidates = [
+            endpoint for endpoint in endpoints
+            if endpoint[0] not in tried
+            and self._ejected_until.get(endpoint[0], 0) <= now
+            and self._outstanding[endpoint[0]] < endpoint[2]
+        ]
+        if not candidates:
+            return None
+        least = min(self._outstanding[endpoint[0]] for endpoint in candidates)
+        return random.choice([endpoint for endpoint in candidates if self._outstanding[endpoint[0]] == least])
+
+    def _eject(self, endpoint: Endpoint, reason: str):
+        self._ejected_until[endpoint[0]] = time.monotonic() + settings.INFERENCE_EJECT_SECONDS
+        logger.warning(f"Inference endpoint {endpoint[1]} skipped for {settings.INFERENCE_EJECT_SECONDS}s: {reason}")
+
+    def check_available(self, model_cid: Optional[str]):
+        """Raise InferenceUnavailable unless some endpoint could take a request now"""
+        if not model_cid:
+            raise InferenceUnavailable("Model has no content ID to serve")
+        if self._pick(self.endpoints(model_cid), set()) is None:
+            raise InferenceUnavailable("No inference nodes are available for this model")
+
+    async def _forward(self, endpoint: Endpoint, payload: dict) -> AsyncIterator[str]:
+        """Stream output from one endpoint. Raises _EndpointFailed if it failed before any output."""
+        started = False
+        try:
+            address = await self._address(endpoint[1])
+        except _EndpointFailed as e:
+            self._eject(endpoint, str(e))
+            raise
+        url, headers, extensions = self.pinned(endpoint[1], address)
+        if endpoint[3]:
+            headers["Authorization"] = f"Bearer {endpoint[3]}"
+        try:
+            async with self._http().stream(
+                "POST", f"{url}/v1/completions", json=payload, headers=headers, extensions=extensions
+            ) as response:
+                if response.status_code in (429, 503):
+                    raise _EndpointFailed("busy")
+                if response.status_code != 200:
+                    detail = (await response.aread()).decode(errors="replace")[:200]
+                    # 401: the node re-registered with a new secret since it was cached
+                    if 400 <= response.status_code < 500 and response.status_code not in (401, 404):
+                        raise InferenceError(f"Model server rejected the request: {detail}")
+                    self._eject(endpoint, f"HTTP {response.status_code}")
+                    raise _EndpointFailed(f"HTTP {response.status_code}")
+
+                async for line in response.aiter_lines():
+                    if not line.strip():
+                        continue
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise InferenceError(message["error"])
+                    if message.get("done"):
+                        return
+                    if message.get("text"):
+                        started = True
+                        yield message["text"]
+                raise httpx.RemoteProtocolError("stream ended before completion")
+        except (httpx.TransportError, ValueError) as e:
+            # Connection, timeout and protocol errors, or a malformed line
+            self._eject(endpoint, str(e) or type(e).__name__)
+            if started:
+                raise InferenceError(f"Model server failed mid-response: {e}") from e
+            raise _EndpointFailed(str(e)) from e
+
+    async def stream(self, model_cid: str, payload: dict) -> AsyncIterator[str]:
+        """
+        Stream a completion from a node serving the model. Endpoints that fail
+        before producing output are skipped and the next one is tried.
+        Raises InferenceUnavailable if none could serve the request and
+        InferenceError if the one serving it failed.
+        """
+        endpoints = self.endpoints(model_cid)
+        tried: Set[int] = set()
+        for _ in range(settings.INFERENCE_MAX_ATTEMPTS):
+            endpoint = self._pick(endpoints, tried)
+            if endpoint is None:
+                break
+            tried.add(endpoint[0])
+
+            self._outstanding[endpoint[0]] += 1
+            try:
+                # Closed with the caller's stream, so a disconnect releases the connection at once
+                async with aclosing(self._forward(endpoint, {**payload, "model": model_cid})) as output:
+                    async for text in output:
+                        yield text
+                return
+            except _EndpointFailed:
+                continue
+            finally:
+                self._outstanding[endpoint[0]] -= 1
+
+        raise InferenceUnavailable("No inference nodes are available for this model")
+
+    @staticmethod
+    def _parse_url(url: str):
+        """(parts, None) for a usable model server URL, or (None, why not)"""
+        try:
+            parts = urlsplit(url)
+            parts.port
+        except ValueError as e:
+            return None, str(e)
+        if parts.scheme not in ("http", "https") or not parts.hostname:
+            return None, "must be an http or https URL"
+        if parts.username or parts.password:
+            return None, "must not contain credentials"
+        return parts, None
+
+    @staticmethod
+    def _pick_address(host: str, infos: list) -> Tuple[Optional[str], Optional[str]]:
+        """
+        The address to connect to out of getaddrinfo results, or None and why
+        not. Every address must be public, so a node cannot point the
+        coordinator at its own network.
+        """
+        addresses = list(dict.fromkeys(info[4][0] for info in infos))
+        if not addresses:
+            return None, f"{host} does not resolve"
+        if not settings.INFERENCE_ALLOW_PRIVATE_URLS:
+            for address in addresses:
+                ip = ipaddress.ip_address(address.split("%")[0])
+                if getattr(ip, "ipv4_mapped", None):
+                    ip = ip.ipv4_mapped
+                if not ip.is_global or ip.is_multicast:
+                    return None, f"{host} resolves to non-public address {ip}"
+        return addresses[0], None
+
+    @staticmethod
+    def resolve(url: str) -> Tuple[Optional[str], Optional[str]]:
+        """Resolve and check a model server URL (blocking): its address, or None and why not"""
+        parts, problem = InferenceRouter._parse_url(url)
+        if problem:
+            return None, problem
+        try:
+            infos = socket.getaddrinfo(parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP)
+        except (socket.gaierror, UnicodeError) as e:
+            return None, f"{parts.hostname} does not resolve: {e}"
+        return InferenceRouter._pick_address(parts.hostname, infos)
+
+    @staticmethod
+    def check_url(url: str) -> Optional[str]:
+        """Why a model server URL may not be registered, or None if it may (blocking)"""
+        return InferenceRouter.resolve(url)[1]
+
+    @staticmethod
+    def pinned(url: str, address: str) -> Tuple[str, dict, dict]:
+        """
+        (URL, headers, extensions) that reach `url` at the checked `address`
+        rather than whatever its name resolves to by the time of the request,
+        which a node could switch to an internal address between checks
+        """
+        parts = urlsplit(url)
+        host = f"[{address}]" if ":" in address else address
+        netloc = f"{host}:{parts.port}" if parts.port else host
+        extensions = {"sni_hostname": parts.hostname} if parts.scheme == "https" else {}
+        return parts._replace(netloc=netloc).geturl(), {"Host": parts.netloc}, extensions
+
+    async def _address(self, url: str) -> str:
+        """A checked address for an endpoint's URL, cached briefly. Raises _EndpointFailed."""
+        now = time.monotonic()
+        cached = self._addresses.get(url)
+        if cached and cached[0] > now:
+            return cached[1]
+        parts, problem = self._parse_url(url)
+        address = None
+        if not problem:
+            try:
+                infos = await asyncio.get_running_loop().getaddrinfo(
+                    parts.hostname, parts.port or 80, proto=socket.IPPROTO_TCP
+                )
+                address, problem = self._pick_address(parts.hostname, infos)
+            except (socket.gaierror, UnicodeError) as e:
+                problem = f"{parts.hostname} does not resolve: {e}"
+        if problem:
+            raise _EndpointFailed(problem)
+        self._addresses[url] = (now + settings.INFERENCE_ENDPOINT_CACHE_SECONDS, address)
+        return address
+
+    @staticmethod
+    def register(db: Session, node: Node, registration: InferenceRegistration) -> List[InferenceEndpoint]:
+        """
+        Replace the set of models a node serves. A (re)registered endpoint
+        starts healthy, with a new secret for the model server to require.
+        """
+        existing = {
+            endpoint.model_cid: endpoint
+            for endpoint in db.query(InferenceEndpoint).filter(InferenceEndpoint.node_id == node.id).all()
+        }
+        models = list(dict.fromkeys(registration.models))
+        for model_cid, endpoint in existing.items():
+            if model_cid not in models:
+                db.delete(endpoint)
+
+        secret = secrets.token_urlsafe(32)
+        endpoints = []
+        for model_cid in models:
+            endpoint = existing.get(model_cid) or InferenceEndpoint(node_id=node.id, model_cid=model_cid)
+            endpoint.url = registration.url.rstrip("/")
+            endpoint.max_concurrency = registration.max_concurrency
+            endpoint.secret = secret
+            endpoint.is_healthy = True
+            endpoint.consecutive_failures = 0
+            db.add(endpoint)
+            endpoints.append(endpoint)
+        db.commit()
+        return endpoints
+
+    @staticmethod
+    def unregister(db: Session, node: Node) -> int:
+        """Stop routing inference to a node. Returns the number of endpoints removed."""
+        removed = db.query(InferenceEndpoint).filter(
+            InferenceEndpoint.node_id == node.id
+        ).delete(synchronize_session=False)
+        db.commit()
+        return removed
+
+    @staticmethod
+    def _probe(client: httpx.Client, url: str) -> bool:
+        address, problem = InferenceRouter.resolve(url)
+        if problem:
+            logger.warning(f"Inference endpoint {url} not probed: {problem}")
+            return False
+        pinned_url, headers, extensions = InferenceRouter.pinned(url, address)
+        try:
+            return client.get(f"{pinned_url}/health", headers=headers, extensions=extensions).status_code == 200
+        except httpx.HTTPError:
+            return False
+
+    @staticmethod
+    def check_health(db: Session) -> int:
+        """Probe every endpoint's server once. Returns the number of unhealthy endpoints."""
+        endpoints = db.query(InferenceEndpoint).all()
+        if not endpoints:
+            return 0
+        # A node's server usually serves several models: probe each URL once
+        urls = list({endpoint.url for endpoint in endpoints})
+        with httpx.Client(timeout=settings.INFERENCE_HEALTH_TIMEOUT) as client, \
+                ThreadPoolExecutor(max_workers=HEALTH_CHECK_WORKERS) as pool:
+            healthy = dict(zip(urls, pool.map(lambda url: InferenceRouter._probe(client, url), urls)))
+
+        now = datetime.utcnow()
+        unhealthy = 0
+        for endpoint in endpoints:
+            if healthy[endpoint.url]:
+                if not endpoint.is_healthy:
+                    logger.info(f"Inference endpoint {endpoint.url} ({endpoint.model_cid}) is healthy again")
+                endpoint.consecutive_failures = 0
+                endpoint.is_healthy = True
+            else:
+                endpoint.consecutive_failures += 1
+                if endpoint.is_healthy and endpoint.consecutive_failures >= settings.INFERENCE_UNHEALTHY_AFTER:
+                    logger.warning(f"Inference endpoint {endpoint.url} ({endpoint.model_cid}) is unhealthy")
+                    endpoint.is_healthy = False
+            endpoint.last_checked_at = now
+            unhealthy += not endpoint.is_healthy
+        db.commit()
+        return unhealthy
+
+# Global router instance
+inference_router = InferenceRouter()
+
+@periodic_task("inference_health", settings.INFERENCE_HEALTH_INTERVAL)
+def check_inference_endpoints(db: Session):
+    InferenceRouter.check_health(db)
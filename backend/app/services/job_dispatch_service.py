@@ -0,0 +1,224 @@
+"""
+Job Dispatch Service
+Hands pending jobs to polling nodes without ever assigning the same job twice
+"""
+from typing import Optional, List, Dict, Any, Set
+from datetime import datetime, timezone
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+from app.models.node import Node
+from app.models.job import Job, JobStatus
+from app.services.job_queue import JobQueue
+from app.services.scheduler_service import SchedulerService
+from app.services.job_lease_service import JobLeaseService
+
+# How many queued candidates a poller considers per attempt. A window lets
+# the scheduler pick the best-fitting job instead of the first one, and lets
+# a small node pass over jobs it cannot run.
+CLAIM_WINDOW = 20
+
+# Upper bound on queue pops per claim, so a queue full of stale ids
+# (cancelled jobs, ids claimed through the fallback path) or of jobs that do
+# not fit the node cannot stall a poll
+MAX_QUEUE_ATTEMPTS = 5
+
+class JobDispatchService:
+    """Service for claiming pending jobs on behalf of nodes"""
+
+    @staticmethod
+    def pending_jobs_query(db: Session, node: Node):
+        """Pending jobs this node is allowed to run"""
+        query = db.query(Job).filter(
+            Job.status == JobStatus.PENDING,
+            or_(Job.available_at.is_(None), Job.available_at <= datetime.utcnow())
+        )
+        if not node.gpu_enabled:
+            query = query.filter(or_(Job.gpus.is_(None), Job.gpus == 0))
+        return query
+
+    @staticmethod
+    def _assign(db: Session, job: Job, node: Node) -> bool:
+        """Compare-and-set a pending job onto a node, taking a lease on it"""
+        now = datetime.utcnow()
+        since = JobQueue.eligible_since(job)
+        queue_seconds = max((now.replace(tzinfo=timezone.utc) - since).total_seconds(), 0.0) if since else None
+        return db.query(Job).filter(
+            Job.id == job.id,
+            Job.status == JobStatus.PENDING
+        ).update({
+            Job.node_id: node.id,
+            Job.status: JobStatus.ASSIGNED,
+            Job.started_at: now,
+            Job.queue_seconds: queue_seconds,
+            Job.lease_expires_at: JobLeaseService.lease_expiry(now),
+            Job.attempts: Job.attempts + 1
+        }, synchronize_session=False) > 0
+
+    @staticmethod
+    def _after(moment: Optional[datetime], now: datetime) -> bool:
+        """Whether a (possibly timezone-aware) timestamp is later than naive UTC `now`"""
+        if moment is None:
+            return False
+        if moment.tzinfo:
+            moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+        return moment > now
+
+    @staticmethod
+    def _backing_off(job: Job, now: datetime) -> bool:
+        """Whether a retried job is still waiting out its backoff"""
+        return JobDispatchService._after(job.available_at, now)
+
+    @staticmethod
+    def _held_for_other_node(job: Job, node: Node, now: datetime) -> bool:
+        """Whether a pipeline job is still reserved for the node holding its inputs"""
+        return (
+            job.preferred_node_id is not None
+            and job.preferred_node_id != node.id
+            and JobDispatchService._after(job.affinity_until, now)
+        )
+
+    @staticmethod
+    def _place(db: Session, node: Node, candidates: List[Job], state: Dict[str, Any], limit: int) -> List[Job]:
+        """Assign up to `limit` best-placed candidates to the node"""
+        now = datetime.utcnow()
+        cached = SchedulerService.cached_inputs(node)
+        eligible = []
+        for job in candidates:
+            if JobDispatchService._backing_off(job, now):
+                continue
+            if JobDispatchService._held_for_other_node(job, node, now):
+                continue
+            requirements = SchedulerService.job_requirements(job)
+            requirements["cached_bytes"] = SchedulerService.cached_bytes(job, cached)
+            eligible.append((job, requirements))
+        
+        # Higher priority classes are placed first; lower classes only
+        # backfill the slots and resources that remain
+        chosen = []
+        free = state["free"]
+        for priority in sorted({job.priority for job, _ in eligible}, reverse=True):
+            tier = [(job, req) for job, req in eligible if job.priority == priority]
+            picked = SchedulerService.select_jobs(tier, free, limit - len(chosen))
+            requirements = {id(job): req for job, req in tier}
+            for job in picked:
+                free = SchedulerService.reserve(free, requirements[id(job)])
+            chosen.extend(picked)
+            if len(chosen) >= limit:
+                break
+        
+        return [job for job in chosen if JobDispatchService._assign(db, job, node)]
+
+    @staticmethod
+    def _finish(db: Session, claimed: List[Job]) -> List[Job]:
+        """Commit a claim transaction, or roll back to release row locks"""
+        if claimed:
+            db.commit()
+            for job in claimed:
+                db.refresh(job)
+            JobQueue.record_waits(claimed)
+        else:
+            db.rollback()
+        return claimed
+
+    @staticmethod
+    def _still_pending(db: Session, job_ids: List[str]) -> Set[str]:
+        """Which of these jobs are pending. A plain read: it does not wait on other pollers' row locks."""
+        if not job_ids:
+            return set()
+        return {
+            job_id for (job_id,) in db.query(Job.job_id).filter(
+                Job.job_id.in_(job_ids),
+                Job.status == JobStatus.PENDING
+            )
+        }
+
+    @staticmethod
+    def claim_jobs(
+        db: Session,
+        node: Node,
+        max_jobs: int = 1,
+        state: Optional[Dict[str, Any]] = None
+    ) -> List[Job]:
+        """
+        Atomically claim up to `max_jobs` pending jobs that fit on a node,
+        in a single transaction.
+
+        Candidates come from the Redis dispatch queues, so poll cost does not
+        grow with the size of the jobs table. Candidate rows are locked with
+        FOR UPDATE SKIP LOCKED, the scheduler packs the best fits into the
+        node's free resources and slots (highest priority class first), and each assignment is a
+        compare-and-set on status, which keeps the claim safe even if a stale
+        or duplicate id is popped. When Redis is unavailable the jobs table is
+        scanned instead.
+
+        `state` is the node's SchedulerService.node_state, computed if omitted.
+        """
+        if state is None:
+            state = SchedulerService.node_state(db, node)
+        limit = min(max_jobs, state["slots"])
+        if limit <= 0:
+            return []
+
+        window = CLAIM_WINDOW + limit
+        # Popped entries that nothing could be claimed from are kept out of
+        # the queue until the poll is over, so the next pop reaches the jobs
+        # (and lower queues) behind them instead of the same ones again
+        held = []
+        try:
+            for _ in range(MAX_QUEUE_ATTEMPTS):
+                entries = JobQueue.pop(JobQueue.node_queues(node), window)
+                if entries is None:
+                    return JobDispatchService._claim_from_table(db, node, state, limit)
+                if not entries:
+                    return []
+
+                order = {job_id: index for index, (_, job_id, _) in enumerate(entries)}
+                candidates = db.query(Job).filter(
+                    Job.job_id.in_(list(order)),
+                    Job.status == JobStatus.PENDING
+                ).with_for_update(skip_locked=True).all()
+                candidates.sort(key=lambda job: order[job.job_id])
+                candidate_ids = {job.job_id for job in candidates}
+
+                claimed = JobDispatchService._finish(
+                    db, JobDispatchService._place(db, node, candidates, state, limit)
+                )
+
+                # Return unclaimed candidates to the front of the queue, along
+                # with ids whose rows another poller had locked: if its claim
+                # does not go through, nothing else would put them back until
+                # reconciliation. This must happen after our row locks are
+                # released, or a concurrent poller popping them would skip the
+                # locked rows and drop the ids.
+                unclaimed = candidate_ids - {job.job_id for job in claimed}
+                unclaimed |= JobDispatchService._still_pending(
+                    db, [job_id for job_id in order if job_id not in candidate_ids]
+                )
+                unclaimed_entries = [entry for entry in entries if entry[1] in unclaimed]
+
+                if claimed:
+                    JobQueue.requeue(unclaimed_entries)
+                    return claimed
+                # Nothing popped fits this node (or every id was stale): look further
+                held.extend(unclaimed_entries)
+        finally:
+            JobQueue.requeue(held)
+
+        return []
+
+    @staticmethod
+    def claim_job(db: Session, node: Node, state: Optional[Dict[str, Any]] = None) -> Optional[Job]:
+        """Atomically claim one pending job that fits on a node"""
+        claimed = JobDispatchService.claim_jobs(db, node, 1, state)
+        return claimed[0] if claimed else None
+
+    @staticmethod
+    def _claim_from_table(db: Session, node: Node, state: Dict[str, Any], limit: int) -> List[Job]:
+        """Claim by scanning pending rows directly (used when Redis is down)"""
+        candidates = JobDispatchService.pending_jobs_query(db, node).order_by(
+            Job.priority.desc(), Job.id
+        ).with_for_update(skip_locked=True).limit(CLAIM_WINDOW + limit).all()
+
+        return JobDispatchService._finish(
+            db, JobDispatchService._place(db, node, candidates, state, limit)
+        )
@@ -0,0 +1,128 @@
+"""
+Job Lease Service
+Every assignment carries a lease that the node's heartbeats and progress
+updates renew. A periodic sweep returns jobs with expired leases to the
+queue (with exponential backoff) or fails them once they run out of attempts,
+and marks nodes that stopped sending heartbeats as inactive.
+"""
+from typing import List, Dict
+from datetime import datetime, timedelta
+import logging
+from sqlalchemy import update, select, bindparam, or_
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.background import periodic_task
+from app.models.node import Node
+from app.models.job import Job, JobStatus
+from app.services.job_queue import JobQueue
+from app.services.pipeline_service import PipelineService
+from app.services.scheduler_service import ACTIVE_JOB_STATUSES
+
+logger = logging.getLogger(__name__)
+
+class JobLeaseService:
+    """Lease renewal and recovery of lost jobs"""
+
+    @staticmethod
+    def lease_expiry(now: datetime = None) -> datetime:
+        """When a lease taken or renewed at `now` runs out"""
+        return (now or datetime.utcnow()) + timedelta(seconds=settings.JOB_LEASE_SECONDS)
+
+    @staticmethod
+    def backoff(attempts: int) -> timedelta:
+        """Delay before a job is offered again after its `attempts`-th lost lease"""
+        delay = settings.JOB_RETRY_BACKOFF * (2 ** max(attempts - 1, 0))
+        return timedelta(seconds=min(delay, settings.JOB_RETRY_BACKOFF_MAX))
+
+    @staticmethod
+    def renew(job: Job):
+        """Extend a job's lease (caller commits)"""
+        job.lease_expires_at = JobLeaseService.lease_expiry()
+
+    @staticmethod
+    def renew_for_nodes(db: Session, heartbeats: Dict[str, datetime]):
+        """
+        Extend the leases of all active jobs on the given nodes, from each
+        node's heartbeat time, in one executemany UPDATE (caller commits)
+        """
+        if not heartbeats:
+            return
+        jobs = Job.__table__
+        nodes = Node.__table__
+        stmt = update(jobs).where(
+            jobs.c.node_id == select(nodes.c.id).where(
+                nodes.c.node_id == bindparam("b_node_id")
+            ).scalar_subquery(),
+            # Not in_(): expanding IN parameters cannot be used with executemany
+            or_(*(jobs.c.status == status for status in ACTIVE_JOB_STATUSES))
+        ).values(lease_expires_at=bindparam("b_lease_expires_at"))
+        db.execute(stmt, [
+            {"b_node_id": node_id, "b_lease_expires_at": JobLeaseService.lease_expiry(seen)}
+            for node_id, seen in heartbeats.items()
+        ])
+
+    @staticmethod
+    def sweep_expired(db: Session, batch_size: int = 500) -> int:
+        """
+        Requeue or fail jobs whose lease has expired.
+        Returns the number of jobs reclaimed.
+        """
+        now = datetime.utcnow()
+        reclaimed = 0
+        while True:
+            # Served by ix_jobs_status_lease_expires_at
+            expired = db.query(Job).filter(
+                Job.status.in_(ACTIVE_JOB_STATUSES),
+                Job.lease_expires_at < now
+            ).order_by(Job.lease_expires_at).with_for_update(skip_locked=True).limit(batch_size).all()
+            if not expired:
+                break
+
+            requeued: List[Job] = []
+            for job in expired:
+                lost_on = job.node_id
+                job.node_id = None
+                job.lease_expires_at = None
+                job.started_at = None
+                job.progress = 0.0
+                if job.attempts >= settings.JOB_MAX_ATTEMPTS:
+                    job.status = JobStatus.FAILED
+                    job.completed_at = now
+                    job.error = f"Lease expired {job.attempts} times (last on node {lost_on})"
+                    PipelineService.cancel_dependents(db, job)
+                else:
+                    job.status = JobStatus.PENDING
+                    job.queued_at = now
+                    job.available_at = now + JobLeaseService.backoff(job.attempts)
+                    requeued.append(job)
+            db.commit()
+
+            for job in requeued:
+                JobQueue.enqueue(job)
+            reclaimed += len(expired)
+            logger.info(
+                f"Reclaimed {len(expired)} jobs with expired leases "
+                f"({len(requeued)} requeued, {len(expired) - len(requeued)} failed)"
+            )
+            if len(expired) < batch_size:
+                break
+
+        return reclaimed
+
+    @staticmethod
+    def deactivate_stale_nodes(db: Session) -> int:
+        """Mark nodes without a recent heartbeat inactive. Returns the number changed."""
+        cutoff = datetime.utcnow() - timedelta(seconds=settings.NODE_HEARTBEAT_TIMEOUT)
+        count = db.query(Node).filter(
+            Node.is_active == True,
+            Node.last_heartbeat < cutoff
+        ).update({Node.is_active: False}, synchronize_session=False)
+        db.commit()
+        if count:
+            logger.info(f"Deactivated {count} nodes with no heartbeat since {cutoff.isoformat()}")
+        return count
+
+@periodic_task("job_lease_sweep", settings.JOB_LEASE_SWEEP_INTERVAL)
+def sweep_job_leases(db: Session):
+    JobLeaseService.sweep_expired(db)
+    JobLeaseService.deactivate_stale_nodes(db)
@@ -0,0 +1,91 @@
+"""
+Job Log Service
+Nodes stream job output in numbered chunks while the job runs. Each chunk is
+stored as its own object in MinIO (job-logs/<job_id>/<seq>.log) and only a
+bounded tail is kept on the job row, so chatty jobs neither bloat the jobs
+table nor have to be held in memory anywhere.
+"""
+from typing import Iterator, Optional
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.models.job import Job
+from app.services.storage_service import storage_service
+
+LOG_BUCKET = "job-logs"
+
+class JobLogService:
+    """Chunked job log storage with a live tail"""
+
+    @staticmethod
+    def object_name(job_id: str, seq: int) -> str:
+        return f"{job_id}/{seq:08d}.log"
+
+    @staticmethod
+    def trim_tail(text: str, max_bytes: int) -> str:
+        """Last `max_bytes` of `text`, starting at a line boundary where possible"""
+        data = text.encode("utf-8")
+        if len(data) <= max_bytes:
+            return text
+        data = data[-max_bytes:]
+        newline = data.find(b"\n")
+        if 0 <= newline < len(data) - 1:
+            data = data[newline + 1:]
+        return data.decode("utf-8", errors="ignore")
+
+    @staticmethod
+    def append(db: Session, job: Job, seq: int, data: bytes) -> bool:
+        """
+        Store log chunk `seq` for a job and extend its tail (caller commits).
+        Chunks must arrive in order; a chunk that was already stored (a retry
+        after a lost response) is ignored. Returns False for such duplicates.
+        """
+        if seq < (job.log_chunks or 0):
+            return False
+        if seq > (job.log_chunks or 0):
+            raise ValueError(f"Expected log chunk {job.log_chunks or 0}, got {seq}")
+
+        storage_service.upload_to_minio(
+            LOG_BUCKET, JobLogService.object_name(job.job_id, seq), data, content_type="text/plain"
+        )
+
+        job.log_object_prefix = f"{LOG_BUCKET}/{job.job_id}/"
+        job.log_chunks = seq + 1
+        job.log_bytes = (job.log_bytes or 0) + len(data)
+        job.log_tail = JobLogService.trim_tail(
+            (job.log_tail or "") + data.decode("utf-8", errors="replace"),
+            settings.JOB_LOG_TAIL_BYTES
+        )
+        return True
+
+    @staticmethod
+    def tail(job: Job, since: Optional[int] = None) -> dict:
+        """
+        The stored tail of a job's log. With `since` (a byte offset from a
+        previous call), only what was written after it.
+        """
+        text = job.log_tail or ""
+        total = job.log_bytes or 0
+        offset = max(total - len(text.encode("utf-8")), 0)
+        if since is not None and since > offset:
+            text = text.encode("utf-8")[since - offset:].decode("utf-8", errors="ignore")
+            offset = min(since, total)
+        return {
+            "job_id": job.job_id,
+            "status": job.status,
+            "progress": job.progress,
+            "log_bytes": total,
+            "offset": offset,
+            "text": text,
+        }
+
+    @staticmethod
+    def iter_log(job: Job) -> Iterator[bytes]:
+        """The full log, chunk by chunk, from object storage"""
+        # Read the pointer now; the generator outlives the request's session
+        job_id, chunks = job.job_id, job.log_chunks or 0
+
+        def chunks_from_storage():
+            for seq in range(chunks):
+                yield storage_service.get_from_minio(LOG_BUCKET, JobLogService.object_name(job_id, seq))
+
+        return chunks_from_storage()
@@ -0,0 +1,406 @@
+"""
+Redis-backed job queue
+Pending job ids are kept in one sorted set per resource class and priority
+class. Priority classes are served strictly in order. Within a queue, jobs
+are ordered by weighted fair queuing between tenants (the submitting group,
+or the user when no group is given): each job is scored with a virtual finish
+time, so a tenant with thousands of queued jobs is interleaved with everyone
+else instead of blocking them.
+
+Jobs waiting out a retry backoff are kept in a separate delayed set per
+queue, scored by when the backoff ends, so they never sit at the head of a
+queue where pollers would have to pass over them. Each pop first moves the
+queue's due jobs into it.
+
+Postgres stays the source of truth: the queue only decides which rows a
+poller looks at, and reconciliation re-adds ids that went missing (Redis
+restarts, failed pushes, requeued jobs).
+"""
+from typing import List, Tuple, Optional, Dict
+import json
+import time
+from datetime import datetime, timezone
+import logging
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.core.background import periodic_task
+from app.core.job_notifier import job_notifier
+from app.models.node import Node
+from app.models.job import Job, JobStatus, JobType
+from app.services.system_service import SystemService
+
+logger = logging.getLogger(__name__)
+
+QUEUE_PREFIX = "job_queue"
+WEIGHTS_KEY = f"{QUEUE_PREFIX}:weights"
+# Docker images needed by pending jobs, per resource class, most demanded first
+IMAGE_DEMAND_KEY = f"{QUEUE_PREFIX}:image_demand"
+
+# System setting holding the fair-share weights, e.g. {"group:3": 4, "user:7": 0.5}
+WEIGHTS_SETTING = "job_fair_share_weights"
+
+# Resource classes, in the order a node should drain them
+GPU_CLASS = "gpu"
+CPU_CLASS = "cpu"
+
+# Priority classes; higher values are dispatched first
+PRIORITY_HIGH = 2
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 0
+PRIORITY_NAMES = {PRIORITY_HIGH: "high", PRIORITY_NORMAL: "normal", PRIORITY_LOW: "low"}
+
+# Default priority per job type: interactive inference ahead of batch work,
+# long finetunes behind everything else
+JOB_TYPE_PRIORITY = {
+    JobType.INFERENCE: PRIORITY_HIGH,
+    JobType.TEST: PRIORITY_NORMAL,
+    JobType.QUANTIZE: PRIORITY_NORMAL,
+    JobType.MERGE: PRIORITY_NORMAL,
+    JobType.FINETUNE: PRIORITY_LOW,
+}
+
+# Samples kept per queue for wait-time percentiles
+WAIT_SAMPLES = 1000
+
+# Most due jobs moved from a queue's delayed set per pop
+PROMOTE_BATCH = 100
+
+# KEYS: queue, virtual clock, tenant finish tags, tenant weights
+# ARGV: job id, tenant
+# A job's virtual finish time is max(queue clock, tenant's last finish) plus
+# 1/weight, so each tenant advances at a rate inversely proportional to its
+# weight and a tenant that was idle starts level with the clock.
+_ENQUEUE_SCRIPT = redis_client.register_script("""
+if redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+local clock = tonumber(redis.call('GET', KEYS[2]) or '0')
+local last = tonumber(redis.call('HGET', KEYS[3], ARGV[2]) or '0')
+local weight = tonumber(redis.call('HGET', KEYS[4], ARGV[2]) or '1')
+if weight <= 0 then
+    weight = 1
+end
+local finish = math.max(clock, last) + 1 / weight
+redis.call('HSET', KEYS[3], ARGV[2], tostring(finish))
+redis.call('ZADD', KEYS[1], finish, ARGV[1])
+return 1
+""")
+
+# KEYS: queue, virtual clock, tenant finish tags, tenant weights,
+#       delayed set, delayed job tenants
+# ARGV: count, now, promote batch
+# Moves jobs whose backoff has ended into the queue (scored as by the enqueue
+# script), then pops the lowest finish times and advances the virtual clock
+_POP_SCRIPT = redis_client.register_script("""
+local due = redis.call('ZRANGEBYSCORE', KEYS[5], '-inf', ARGV[2], 'LIMIT', 0, ARGV[3])
+for _, job_id in ipairs(due) do
+    local tenant = redis.call('HGET', KEYS[6], job_id) or 'system'
+    redis.call('ZREM', KEYS[5], job_id)
+    redis.call('HDEL', KEYS[6], job_id)
+    if not redis.call('ZSCORE', KEYS[1], job_id) then
+        local clock = tonumber(redis.call('GET', KEYS[2]) or '0')
+        local last = tonumber(redis.call('HGET', KEYS[3], tenant) or '0')
+        local weight = tonumber(redis.call('HGET', KEYS[4], tenant) or '1')
+        if weight <= 0 then
+            weight = 1
+        end
+        local finish = math.max(clock, last) + 1 / weight
+        redis.call('HSET', KEYS[3], tenant, tostring(finish))
+        redis.call('ZADD', KEYS[1], finish, job_id)
+    end
+end
+local items = redis.call('ZPOPMIN', KEYS[1], ARGV[1])
+if #items > 0 then
+    local clock = tonumber(redis.call('GET', KEYS[2]) or '0')
+    local last = tonumber(items[#items])
+    if last > clock then
+        redis.call('SET', KEYS[2], tostring(last))
+    end
+end
+return items
+""")
+
+class JobQueue:
+    """Per-resource-class, per-priority dispatch queues with fair share between tenants"""
+
+    @staticmethod
+    def key(queue: str) -> str:
+        return f"{QUEUE_PREFIX}:{queue}"
+
+    @staticmethod
+    def resource_class(job: Job) -> str:
+        return GPU_CLASS if job.gpus else CPU_CLASS
+
+    @staticmethod
+    def default_priority(job_type: JobType) -> int:
+        return JOB_TYPE_PRIORITY.get(job_type, PRIORITY_NORMAL)
+
+    @staticmethod
+    def queue_name(resource_class: str, priority: int) -> str:
+        return f"{resource_class}:{PRIORITY_NAMES.get(priority, PRIORITY_NAMES[PRIORITY_NORMAL])}"
+
+    @staticmethod
+    def job_queue(job: Job) -> str:
+        """Queue a job belongs in"""
+        priority = job.priority if job.priority is not None else JobQueue.default_priority(job.type)
+        return JobQueue.queue_name(JobQueue.resource_class(job), priority)
+
+    @staticmethod
+    def node_queues(node: Optional[Node] = None) -> List[str]:
+        """
+        Queues a node may pop from, highest priority first and the most
+        specific resource class first within a priority. Without a node,
+        every queue.
+        """
+        resource_classes = [GPU_CLASS, CPU_CLASS] if node is None or node.gpu_enabled else [CPU_CLASS]
+        return [
+            JobQueue.queue_name(resource_class, priority)
+            for priority in sorted(PRIORITY_NAMES, reverse=True)
+            for resource_class in resource_classes
+        ]
+
+    @staticmethod
+    def tenant(job: Job) -> str:
+        """Who a job's fair share is accounted to"""
+        if job.group_id:
+            return f"group:{job.group_id}"
+        if job.user_id:
+            return f"user:{job.user_id}"
+        return "system"
+
+    @staticmethod
+    def _backoff_until(job: Job) -> Optional[float]:
+        """When a retried job's backoff ends (epoch seconds), if it has not yet"""
+        if job.available_at is None:
+            return None
+        when = job.available_at
+        if when.tzinfo is None:
+            # Naive timestamps in this app are UTC
+            when = when.replace(tzinfo=timezone.utc)
+        when = when.timestamp()
+        return when if when > time.time() else None
+
+    @staticmethod
+    def _enqueue(job: Job, client):
+        key = JobQueue.key(JobQueue.job_queue(job))
+        backoff_until = JobQueue._backoff_until(job)
+        if backoff_until is not None:
+            # Held back until due; the fair-share score is assigned then
+            client.zadd(f"{key}:delayed", {job.job_id: backoff_until})
+            client.hset(f"{key}:delayed_tenants", job.job_id, JobQueue.tenant(job))
+            return
+        _ENQUEUE_SCRIPT(
+            keys=[key, f"{key}:clock", f"{key}:tenants", WEIGHTS_KEY],
+            args=[job.job_id, JobQueue.tenant(job)],
+            client=client
+        )
+
+    @staticmethod
+    def enqueue(job: Job) -> bool:
+        """Add a pending job to its queue. Returns False if Redis is unavailable."""
+        try:
+            JobQueue._enqueue(job, redis_client)
+            job_notifier.notify()
+            return True
+        except Exception as e:
+            logger.warning(f"Failed to enqueue job {job.job_id}: {e}")
+            return False
+
+    @staticmethod
+    def pop(queues: List[str], count: int) -> Optional[List[Tuple[str, str, float]]]:
+        """
+        Pop up to `count` job ids, draining the given queues strictly in the
+        order given: a queue is only popped from once the ones before it are
+        empty. Ages are not compared across queues.
+
+        Returns (queue, job_id, score) tuples, or None if Redis is
+        unavailable so callers can fall back to scanning the database.
+        """
+        popped = []
+        now = time.time()
+        try:
+            for queue in queues:
+                remaining = count - len(popped)
+                if remaining <= 0:
+                    break
+                key = JobQueue.key(queue)
+                items = _POP_SCRIPT(
+                    keys=[key, f"{key}:clock", f"{key}:tenants", WEIGHTS_KEY, f"{key}:delayed", f"{key}:delayed_tenants"],
+                    args=[remaining, repr(now), PROMOTE_BATCH],
+                    client=redis_client
+                )
+                for i in range(0, len(items), 2):
+                    popped.append((queue, items[i], float(items[i + 1])))
+        except Exception as e:
+            logger.warning(f"Job queue unavailable, falling back to database scan: {e}")
+            if popped:
+                JobQueue.requeue(popped)
+            return None
+        return popped
+
+    @staticmethod
+    def requeue(entries: List[Tuple[str, str, float]]):
+        """Put popped entries back with their original scores"""
+        if not entries:
+            return
+        try:
+            pipe = redis_client.pipeline()
+            for queue, job_id, score in entries:
+                pipe.zadd(JobQueue.key(queue), {job_id: score}, nx=True)
+            pipe.execute()
+        except Exception as e:
+            # Reconciliation will pick these up
+            logger.warning(f"Failed to requeue {len(entries)} jobs: {e}")
+
+    @staticmethod
+    def reconcile(db: Session, batch_size: int = 1000) -> int:
+        """
+        Re-add pending jobs that are missing from the queues.
+        Returns the number of ids restored.
+        """
+        restored = 0
+        last_id = 0
+        while True:
+            jobs = db.query(Job).filter(
+                Job.status == JobStatus.PENDING,
+                Job.id > last_id
+            ).order_by(Job.id).limit(batch_size).all()
+            if not jobs:
+                break
+            last_id = jobs[-1].id
+
+            pipe = redis_client.pipeline()
+            for job in jobs:
+                key = JobQueue.key(JobQueue.job_queue(job))
+                pipe.zscore(key, job.job_id)
+                pipe.zscore(f"{key}:delayed", job.job_id)
+            scores = pipe.execute()
+
+            missing = [
+                job for job, ready, delayed in zip(jobs, scores[0::2], scores[1::2])
+                if ready is None and delayed is None
+            ]
+            if missing:
+                pipe = redis_client.pipeline()
+                for job in missing:
+                    JobQueue._enqueue(job, pipe)
+                pipe.execute()
+                restored += len(missing)
+
+        if restored:
+            job_notifier.notify()
+            logger.info(f"Job queue reconciliation restored {restored} jobs")
+        return restored
+
+    @staticmethod
+    def set_weights(weights: Dict[str, float]):
+        """Replace the fair-share weights (tenant -> weight, default 1)"""
+        pipe = redis_client.pipeline()
+        pipe.delete(WEIGHTS_KEY)
+        if weights:
+            pipe.hset(WEIGHTS_KEY, mapping={tenant: float(weight) for tenant, weight in weights.items()})
+        pipe.execute()
+
+    @staticmethod
+    def refresh_image_demand(db: Session) -> Dict[str, List[str]]:
+        """
+        Count the Docker images pending jobs need and publish them, most
+        demanded first, so nodes can pull them before the jobs arrive
+        """
+        rows = db.query(Job.docker_image, Job.gpus, func.count(Job.id)).filter(
+            Job.status == JobStatus.PENDING,
+            Job.docker_image.isnot(None)
+        ).group_by(Job.docker_image, Job.gpus).all()
+
+        counts = {GPU_CLASS: {}, CPU_CLASS: {}}
+        for image, gpus, count in rows:
+            by_image = counts[GPU_CLASS if gpus else CPU_CLASS]
+            by_image[image] = by_image.get(image, 0) + count
+        demand = {
+            resource_class: sorted(by_image, key=by_image.get, reverse=True)
+            for resource_class, by_image in counts.items()
+        }
+        redis_client.set(IMAGE_DEMAND_KEY, json.dumps(demand), ex=settings.JOB_IMAGE_DEMAND_INTERVAL * 3)
+        return demand
+
+    @staticmethod
+    def prefetch_images(gpu_enabled: bool, limit: int) -> List[str]:
+        """Images a node should have pulled: what its queues need most"""
+        try:
+            cached = redis_client.get(IMAGE_DEMAND_KEY)
+        except Exception:
+            return []
+        if not cached:
+            return []
+        demand = json.loads(cached)
+        images = (demand.get(GPU_CLASS, []) if gpu_enabled else []) + demand.get(CPU_CLASS, [])
+        return list(dict.fromkeys(images))[:limit]
+
+    @staticmethod
+    def eligible_since(job: Job) -> Optional[datetime]:
+        """When a job became claimable: after its retry backoff, else when it was queued"""
+        when = job.available_at or job.queued_at or job.created_at
+        if when is not None and when.tzinfo is None:
+            # Naive timestamps in this app are UTC
+            when = when.replace(tzinfo=timezone.utc)
+        return when
+
+    @staticmethod
+    def record_waits(jobs: List[Job]):
+        """Record how long claimed jobs waited to be dispatched"""
+        now = datetime.now(timezone.utc)
+        try:
+            pipe = redis_client.pipeline()
+            for job in jobs:
+                since = JobQueue.eligible_since(job)
+                if since is None:
+                    continue
+                wait = max((now - since).total_seconds(), 0.0)
+                key = f"{QUEUE_PREFIX}:wait:{JobQueue.job_queue(job)}"
+                pipe.hincrby(key, "count", 1)
+                pipe.hincrbyfloat(key, "total", wait)
+                pipe.lpush(f"{key}:samples", wait)
+                pipe.ltrim(f"{key}:samples", 0, WAIT_SAMPLES - 1)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to record queue wait times: {e}")
+
+    @staticmethod
+    def depth() -> dict:
+        """Queue length per queue, not counting jobs still backing off"""
+        try:
+            return {queue: redis_client.zcard(JobQueue.key(queue)) for queue in JobQueue.node_queues()}
+        except Exception:
+            return {}
+
+    @staticmethod
+    def wait_stats() -> dict:
+        """Wait time per queue in seconds: count and mean overall, p50/p95 over recent jobs"""
+        stats = {}
+        try:
+            for queue in JobQueue.node_queues():
+                key = f"{QUEUE_PREFIX}:wait:{queue}"
+                totals = redis_client.hgetall(key)
+                samples = sorted(float(s) for s in redis_client.lrange(f"{key}:samples", 0, -1))
+                count = int(totals.get("count", 0))
+                stats[queue] = {
+                    "count": count,
+                    "mean": float(totals.get("total", 0)) / count if count else None,
+                    "p50": samples[len(samples) // 2] if samples else None,
+                    "p95": samples[min(int(len(samples) * 0.95), len(samples) - 1)] if samples else None,
+                }
+        except Exception:
+            return {}
+        return stats
+
+@periodic_task("job_queue_reconcile", settings.JOB_QUEUE_RECONCILE_INTERVAL)
+def reconcile_job_queue(db: Session):
+    # Weights live in system settings; keep Redis in step (e.g. after a restart)
+    JobQueue.set_weights(SystemService.get_setting_value(db, WEIGHTS_SETTING, {}) or {})
+    JobQueue.reconcile(db)
+
+@periodic_task("job_image_demand", settings.JOB_IMAGE_DEMAND_INTERVAL)
+def refresh_job_image_demand(db: Session):
+    JobQueue.refresh_image_demand(db)
@@ -0,0 +1,290 @@
+"""
+Node Service for heartbeat and resource bookkeeping
+Heartbeats are buffered in Redis and written to the nodes table in bulk by a
+periodic flush, so a large fleet does not turn into one row-rewriting
+transaction per heartbeat. Liveness (last heartbeat per node) is read from
+Redis. If Redis is unavailable, or no process has run the flush recently
+(e.g. a serverless deployment, where periodic tasks never start),
+heartbeats are written straight to the database as before.
+"""
+from typing import Optional, Dict, Any, List
+from datetime import datetime
+import copy
+import json
+import logging
+import time
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.core.background import periodic_task, task_recent
+from app.models.node import Node
+from app.models.job import Job
+from app.services.job_lease_service import JobLeaseService
+from app.services.job_queue import JobQueue
+from app.services.scheduler_service import ACTIVE_JOB_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Sorted set: node_id scored by the time of its last heartbeat
+LAST_SEEN_KEY = "node_heartbeats"
+# Latest merged resources per node, as JSON
+RESOURCES_PREFIX = "node_resources"
+# Name of the periodic flush below
+FLUSH_TASK = "node_heartbeat_flush"
+# Nodes with a heartbeat / resources not yet written to the database
+DIRTY_KEY = "node_heartbeats:dirty"
+DIRTY_RESOURCES_KEY = "node_heartbeats:dirty_resources"
+# Most running job IDs checked per heartbeat
+MAX_RUNNING_JOBS = 256
+
+class NodeService:
+    """Service for node heartbeats and reported resources"""
+
+    @staticmethod
+    def merge_resources(base: Optional[Dict[str, Any]], delta: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Apply a heartbeat resource delta to a node's stored resources.
+        Nested dicts are merged; a None value removes the key.
+        """
+        merged = copy.deepcopy(base) if base else {}
+        for key, value in delta.items():
+            if value is None:
+                merged.pop(key, None)
+            elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+                merged[key] = NodeService.merge_resources(merged[key], value)
+            else:
+                merged[key] = value
+        return merged
+
+    @staticmethod
+    def _resources_key(node_id: str) -> str:
+        return f"{RESOURCES_PREFIX}:{node_id}"
+
+    @staticmethod
+    def apply_heartbeat(base: Optional[Dict[str, Any]], heartbeat_data: dict) -> tuple:
+        """
+        Work out a node's resources after a heartbeat.
+        Returns (resources, resync): resources is None when unchanged, and
+        resync is True when a delta arrived with nothing to apply it to.
+        """
+        if "resources" in heartbeat_data:
+            return heartbeat_data["resources"], False
+        delta = heartbeat_data.get("resources_delta")
+        if not delta:
+            return None, False
+        if base is None:
+            return None, True
+        return NodeService.merge_resources(base, delta), False
+
+    @staticmethod
+    def cache_node(node_id: str, resources: Optional[Dict[str, Any]]):
+        """Seed the heartbeat buffer for a newly registered node"""
+        try:
+            pipe = redis_client.pipeline()
+            pipe.zadd(LAST_SEEN_KEY, {node_id: time.time()})
+            if resources is not None:
+                pipe.set(NodeService._resources_key(node_id), json.dumps(resources))
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"Failed to cache node {node_id}: {e}")
+
+    @staticmethod
+    def record_heartbeat(db: Session, node_id: str, heartbeat_data: dict) -> Optional[dict]:
+        """
+        Record a node heartbeat. Returns the response for the node, or None
+        if the node is not registered.
+        """
+        if not task_recent(FLUSH_TASK):
+            # Nothing is flushing the buffer (e.g. serverless): write through
+            result = NodeService._write_heartbeat(db, node_id, heartbeat_data, cache=True)
+        else:
+            try:
+                result = NodeService._buffer_heartbeat(db, node_id, heartbeat_data)
+            except Exception as e:
+                logger.warning(f"Heartbeat buffer unavailable, writing directly: {e}")
+                db.rollback()
+                result = NodeService._write_heartbeat(db, node_id, heartbeat_data)
+
+        if result is not None:
+            # Images queued jobs need, so the node can pull them ahead of time
+            images = JobQueue.prefetch_images(bool(heartbeat_data.get("gpu_enabled")), settings.NODE_PREFETCH_IMAGES)
+            if images:
+                result["prefetch_images"] = images
+            # Jobs cancelled, failed or reassigned on our side since the node started them
+            stopped = NodeService.stopped_jobs(db, node_id, heartbeat_data.get("running_jobs"))
+            if stopped:
+                result["cancel_jobs"] = stopped
+        return result
+
+    @staticmethod
+    def stopped_jobs(db: Session, node_id: str, job_ids: Any) -> List[str]:
+        """Of the jobs a node says it is running, those no longer active on that node"""
+        if not isinstance(job_ids, list):
+            return []
+        job_ids = [job_id for job_id in job_ids if isinstance(job_id, str)][:MAX_RUNNING_JOBS]
+        if not job_ids:
+            return []
+        active = {
+            job_id for (job_id,) in db.query(Job.job_id).join(Node, Job.node_id == Node.id).filter(
+                Job.job_id.in_(job_ids),
+                Job.status.in_(ACTIVE_JOB_STATUSES),
+                Node.node_id == node_id
+            )
+        }
+        return [job_id for job_id in job_ids if job_id not in active]
+
+    @staticmethod
+    def _buffer_heartbeat(db: Session, node_id: str, heartbeat_data: dict) -> Optional[dict]:
+        pipe = redis_client.pipeline()
+        pipe.zscore(LAST_SEEN_KEY, node_id)
+        pipe.get(NodeService._resources_key(node_id))
+        last_seen, cached = pipe.execute()
+
+        reseed = False
+        if last_seen is None or cached is None:
+            # Unknown to the buffer (new worker state, Redis restart, node
+            # registered without resources): check the database once
+            node = db.query(Node).filter(Node.node_id == node_id).first()
+            if not node:
+                return None
+            base = node.resources
+            reseed = base is not None
+        else:
+            base = json.loads(cached)
+
+        resources, resync = NodeService.apply_heartbeat(base, heartbeat_data)
+
+        pipe = redis_client.pipeline()
+        pipe.zadd(LAST_SEEN_KEY, {node_id: time.time()})
+        pipe.sadd(DIRTY_KEY, node_id)
+        if resources is not None:
+            pipe.set(NodeService._resources_key(node_id), json.dumps(resources))
+            pipe.sadd(DIRTY_RESOURCES_KEY, node_id)
+        elif reseed:
+            pipe.set(NodeService._resources_key(node_id), json.dumps(base))
+        pipe.execute()
+
+        if resync:
+            return {"status": "ok", "resync": True}
+        return {"status": "ok"}
+
+    @staticmethod
+    def _write_heartbeat(db: Session, node_id: str, heartbeat_data: dict, cache: bool = False) -> Optional[dict]:
+        node = db.query(Node).filter(Node.node_id == node_id).first()
+        if not node:
+            return None
+
+        node.last_heartbeat = datetime.utcnow()
+        resources, resync = NodeService.apply_heartbeat(node.resources, heartbeat_data)
+        if resources is not None:
+            node.resources = resources
+        node.is_active = True
+        JobLeaseService.renew_for_nodes(db, {node_id: node.last_heartbeat})
+        db.commit()
+        if cache:
+            # Keep liveness reads from the buffer current
+            NodeService.cache_node(node_id, node.resources)
+
+        if resync:
+            return {"status": "ok", "resync": True}
+        return {"status": "ok"}
+
+    @staticmethod
+    def flush_heartbeats(db: Session, batch_size: int = 500) -> int:
+        """
+        Write buffered heartbeats to the nodes table in bulk.
+        Returns the number of nodes updated.
+        """
+        table = Node.__table__
+        seen_update = update(table).where(
+            table.c.node_id == bindparam("b_node_id")
+        ).values(last_heartbeat=bindparam("b_last_heartbeat"), is_active=True)
+        resources_update = update(table).where(
+            table.c.node_id == bindparam("b_node_id")
+        ).values(resources=bindparam("b_resources"))
+
+        flushed = 0
+        while True:
+            node_ids = redis_client.spop(DIRTY_KEY, batch_size)
+            if not node_ids:
+                break
+
+            # Read the latest values and clear the resource flags in one
+            # transaction, so a heartbeat arriving meanwhile is flushed next time
+            pipe = redis_client.pipeline(transaction=True)
+            for node_id in node_ids:
+                pipe.sismember(DIRTY_RESOURCES_KEY, node_id)
+            pipe.srem(DIRTY_RESOURCES_KEY, *node_ids)
+            for node_id in node_ids:
+                pipe.zscore(LAST_SEEN_KEY, node_id)
+            pipe.mget([NodeService._resources_key(node_id) for node_id in node_ids])
+            results = pipe.execute()
+            count = len(node_ids)
+            dirty_resources = results[:count]
+            scores = results[count + 1:2 * count + 1]
+            cached = results[-1]
+
+            seen_rows = [
+                {"b_node_id": node_id, "b_last_heartbeat": datetime.utcfromtimestamp(score)}
+                for node_id, score in zip(node_ids, scores) if score is not None
+            ]
+            resource_rows = [
+                {"b_node_id": node_id, "b_resources": json.loads(value)}
+                for node_id, dirty, value in zip(node_ids, dirty_resources, cached)
+                if dirty and value is not None
+            ]
+
+            try:
+                if seen_rows:
+                    db.execute(seen_update, seen_rows)
+                    # A heartbeat renews the leases of the node's jobs
+                    JobLeaseService.renew_for_nodes(db, {
+                        row["b_node_id"]: row["b_last_heartbeat"] for row in seen_rows
+                    })
+                if resource_rows:
+                    db.execute(resources_update, resource_rows)
+                db.commit()
+            except Exception:
+                db.rollback()
+                # Keep them for the next flush
+                pipe = redis_client.pipeline()
+                pipe.sadd(DIRTY_KEY, *node_ids)
+                if resource_rows:
+                    pipe.sadd(DIRTY_RESOURCES_KEY, *[row["b_node_id"] for row in resource_rows])
+                pipe.execute()
+                raise
+            flushed += len(node_ids)
+
+        return flushed
+
+    @staticmethod
+    def last_seen(node_ids: List[str]) -> Dict[str, datetime]:
+        """Last heartbeat per node from the buffer; nodes it does not know are omitted"""
+        if not node_ids:
+            return {}
+        try:
+            pipe = redis_client.pipeline()
+            for node_id in node_ids:
+                pipe.zscore(LAST_SEEN_KEY, node_id)
+            scores = pipe.execute()
+        except Exception:
+            return {}
+        return {
+            node_id: datetime.utcfromtimestamp(score)
+            for node_id, score in zip(node_ids, scores) if score is not None
+        }
+
+    @staticmethod
+    def online_count(max_age: Optional[float] = None) -> Optional[int]:
+        """Nodes that sent a heartbeat in the last `max_age` seconds, or None if unknown"""
+        if max_age is None:
+            max_age = settings.NODE_HEARTBEAT_TIMEOUT
+        try:
+            return redis_client.zcount(LAST_SEEN_KEY, time.time() - max_age, "+inf")
+        except Exception:
+            return None
+
+@periodic_task(FLUSH_TASK, settings.NODE_HEARTBEAT_FLUSH_INTERVAL)
+def flush_node_heartbeats(db: Session):
+    NodeService.flush_heartbeats(db)
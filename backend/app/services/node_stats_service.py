@@ -0,0 +1,193 @@
+"""
+Node Stats Service
+Records the timings nodes report for each job and keeps rolling per-node
+statistics over their recent jobs: throughput, runtime and download-time
+percentiles and failure rate. A periodic task stores them on each node
+(`nodes.performance`) and flags flaky nodes, which the scheduler limits to
+one job at a time, and nodes whose downloads are far slower than the rest
+of the fleet.
+"""
+from typing import Any, Dict, List, Optional
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+import logging
+from sqlalchemy import update, bindparam
+from sqlalchemy.orm import Session
+from app.core.config import settings
+from app.core.background import periodic_task
+from app.models.node import Node
+from app.models.job import Job, JobStatus
+
+logger = logging.getLogger(__name__)
+
+# Node-reported timestamps further than this from the coordinator's clock are ignored
+MAX_CLOCK_SKEW = timedelta(days=1)
+
+# Jobs that count towards a node's statistics
+COUNTED_STATUSES = [JobStatus.COMPLETED, JobStatus.FAILED]
+
+class NodeStatsService:
+    """Job timings and rolling per-node performance"""
+
+    @staticmethod
+    def _timestamp(value: Any, now: datetime) -> Optional[datetime]:
+        """A node-reported Unix timestamp as naive UTC, or None if unusable"""
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return None
+        try:
+            moment = datetime.utcfromtimestamp(value)
+        except (OverflowError, OSError, ValueError):
+            return None
+        return moment if abs(moment - now) <= MAX_CLOCK_SKEW else None
+
+    @staticmethod
+    def record_timings(job: Job, timings: Optional[Dict[str, Any]]):
+        """
+        Store the lifecycle timestamps a node reported for a job (caller
+        commits). `timings` holds Unix times for received, inputs_ready,
+        container_started and finished; durations are computed from pairs
+        of them, so they are on the node's clock only.
+        """
+        if not isinstance(timings, dict):
+            return
+        now = datetime.utcnow()
+        stamps = {key: NodeStatsService._timestamp(timings.get(key), now) for key in (
+            "received", "inputs_ready", "container_started", "finished"
+        )}
+
+        if stamps["inputs_ready"]:
+            job.inputs_ready_at = stamps["inputs_ready"]
+        if stamps["container_started"]:
+            job.container_started_at = stamps["container_started"]
+        if stamps["received"] and stamps["inputs_ready"]:
+            job.download_seconds = max((stamps["inputs_ready"] - stamps["received"]).total_seconds(), 0.0)
+        started = stamps["container_started"] or stamps["inputs_ready"]
+        if started and stamps["finished"]:
+            job.run_seconds = max((stamps["finished"] - started).total_seconds(), 0.0)
+
+    @staticmethod
+    def _distribution(values: List[float]) -> Optional[Dict[str, float]]:
+        if not values:
+            return None
+        ordered = sorted(values)
+        return {
+            "mean": sum(ordered) / len(ordered),
+            "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)],
+        }
+
+    @staticmethod
+    def _completed_at(value: datetime) -> datetime:
+        if value.tzinfo:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    @staticmethod
+    def summarize(rows: List[Any], now: datetime) -> Dict[str, Any]:
+        """
+        Statistics over a node's recent finished jobs. `rows` have status,
+        completed_at, queue_seconds, download_seconds and run_seconds.
+        """
+        completed = [row for row in rows if row.status == JobStatus.COMPLETED]
+        failed = len(rows) - len(completed)
+        oldest = min(NodeStatsService._completed_at(row.completed_at) for row in rows) if rows else now
+        # At least a minute, so a single recent job does not read as a huge rate
+        span = max((now - oldest).total_seconds(), 60.0)
+        failure_rate = failed / len(rows) if rows else 0.0
+        return {
+            "jobs": len(rows),
+            "completed": len(completed),
+            "failed": failed,
+            "failure_rate": failure_rate,
+            "throughput_per_hour": len(completed) * 3600 / span,
+            "run_seconds": NodeStatsService._distribution(
+                [row.run_seconds for row in completed if row.run_seconds is not None]
+            ),
+            "download_seconds": NodeStatsService._distribution(
+                [row.download_seconds for row in rows if row.download_seconds is not None]
+            ),
+            "queue_seconds": NodeStatsService._distribution(
+                [row.queue_seconds for row in rows if row.queue_seconds is not None]
+            ),
+            "flaky": len(rows) >= settings.NODE_STATS_MIN_JOBS and failure_rate >= settings.NODE_FLAKY_FAILURE_RATE,
+            "slow_downloads": False,
+            "updated_at": now.isoformat(),
+        }
+
+    @staticmethod
+    def _recent_rows(db: Session, now: datetime, node_id: Optional[int] = None):
+        query = db.query(
+            Job.node_id, Job.status, Job.completed_at,
+            Job.queue_seconds, Job.download_seconds, Job.run_seconds
+        ).filter(
+            Job.completed_at >= now - timedelta(hours=settings.NODE_STATS_WINDOW_HOURS),
+            Job.status.in_(COUNTED_STATUSES)
+        )
+        if node_id is not None:
+            # Served by ix_jobs_node_id_completed_at
+            return query.filter(Job.node_id == node_id).order_by(
+                Job.completed_at.desc()
+            ).limit(settings.NODE_STATS_MAX_JOBS).all()
+        # Served by ix_jobs_completed_at
+        return query.filter(Job.node_id.isnot(None)).order_by(Job.completed_at.desc()).all()
+
+    @staticmethod
+    def node_stats(db: Session, node: Node) -> Dict[str, Any]:
+        """Current statistics for one node, computed from its recent jobs"""
+        now = datetime.utcnow()
+        stats = NodeStatsService.summarize(NodeStatsService._recent_rows(db, now, node.id), now)
+        # Comparing with the fleet needs everyone's numbers; use the last refresh
+        stats["slow_downloads"] = bool((node.performance or {}).get("slow_downloads"))
+        return stats
+
+    @staticmethod
+    def refresh(db: Session) -> int:
+        """
+        Recompute every node's statistics and store them on the node.
+        Returns the number of nodes with recent jobs.
+        """
+        now = datetime.utcnow()
+        per_node = defaultdict(list)
+        for row in NodeStatsService._recent_rows(db, now):
+            rows = per_node[row.node_id]
+            # Newest first; keep each node's most recent jobs only
+            if len(rows) < settings.NODE_STATS_MAX_JOBS:
+                rows.append(row)
+
+        stats = {node_id: NodeStatsService.summarize(rows, now) for node_id, rows in per_node.items()}
+
+        # Downloads are comparable across nodes (runtimes depend on the job
+        # mix): flag nodes far slower than the fleet's median
+        medians = sorted(
+            node_stats["download_seconds"]["p50"]
+            for node_stats in stats.values() if node_stats["download_seconds"]
+        )
+        if medians:
+            fleet = medians[len(medians) // 2]
+            for node_stats in stats.values():
+                downloads = node_stats["download_seconds"]
+                node_stats["slow_downloads"] = bool(
+                    downloads and fleet > 0 and downloads["p50"] > settings.NODE_SLOW_DOWNLOAD_FACTOR * fleet
+                )
+
+        table = Node.__table__
+        if stats:
+            db.execute(
+                update(table).where(table.c.id == bindparam("b_id")).values(performance=bindparam("b_performance")),
+                [{"b_id": node_id, "b_performance": node_stats} for node_id, node_stats in stats.items()]
+            )
+        # Nodes without recent jobs have nothing to report
+        db.query(Node).filter(
+            Node.performance.isnot(None),
+            Node.id.notin_(list(stats)) if stats else True
+        ).update({Node.performance: None}, synchronize_session=False)
+        db.commit()
+
+        flaky = [node_id for node_id, node_stats in stats.items() if node_stats["flaky"]]
+        if flaky:
+            logger.info(f"Nodes flagged as flaky: {flaky}")
+        return len(stats)
+
+@periodic_task("node_performance", settings.NODE_STATS_INTERVAL)
+def refresh_node_performance(db: Session):
+    NodeStatsService.refresh(db)
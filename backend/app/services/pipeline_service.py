@@ -0,0 +1,321 @@
+"""
+Pipeline Service
+Creates job graphs and moves their jobs along as parents finish. A job with
+dependencies is created WAITING and is not queued. When its last parent
+completes, the parents' output CIDs are appended to its inputs and it is
+queued, held for a short while for the node that ran the parent, which
+already has those outputs in its IPFS store. When a parent fails or is
+cancelled, everything downstream of it is cancelled.
+"""
+from typing import Dict, List, Optional
+import uuid
+import logging
+from datetime import datetime, timedelta
+from sqlalchemy import exists
+from sqlalchemy.orm import Session, aliased
+from app.core.config import settings
+from app.core.background import periodic_task
+from app.models.job import Job, JobStatus
+from app.models.pipeline import Pipeline, JobDependency
+from app.schemas.pipeline import PipelineCreate
+from app.services.job_queue import JobQueue
+from app.services.scheduler_service import ACTIVE_JOB_STATUSES, FINISHED_JOB_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Waiting jobs examined per sweep
+RELEASE_BATCH_SIZE = 500
+
+class PipelineService:
+    """Job dependency graphs"""
+
+    @staticmethod
+    def validate(spec: PipelineCreate):
+        """Check names, references and that the graph has no cycles. Raises ValueError."""
+        if len(spec.jobs) > settings.PIPELINE_MAX_JOBS:
+            raise ValueError(f"Pipelines are limited to {settings.PIPELINE_MAX_JOBS} jobs")
+
+        names = [entry.name for entry in spec.jobs]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"Duplicate job names: {', '.join(duplicates)}")
+
+        parents = {}
+        for entry in spec.jobs:
+            parents[entry.name] = set()
+            for dependency in entry.depends_on:
+                if dependency.job not in names:
+                    raise ValueError(f"Job {entry.name} depends on unknown job {dependency.job}")
+                if dependency.job in parents[entry.name]:
+                    raise ValueError(f"Job {entry.name} depends on {dependency.job} more than once")
+                parents[entry.name].add(dependency.job)
+
+        # Kahn's algorithm: whatever cannot be ordered is on a cycle
+        remaining = {name: set(deps) for name, deps in parents.items()}
+        while True:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                break
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        if remaining:
+            raise ValueError(f"Dependency cycle between: {', '.join(sorted(remaining))}")
+
+    @staticmethod
+    def create(db: Session, spec: PipelineCreate, user_id: Optional[int]) -> Pipeline:
+        """
+        Create a pipeline and its jobs. Jobs without dependencies are queued
+        right away; the rest wait for their parents.
+        """
+        PipelineService.validate(spec)
+
+        pipeline = Pipeline(
+            pipeline_id=f"pipe-{uuid.uuid4().hex[:8]}",
+            name=spec.name,
+            user_id=user_id,
+            group_id=spec.group_id
+        )
+        db.add(pipeline)
+        db.flush()
+
+        now = datetime.utcnow()
+        jobs: Dict[str, Job] = {}
+        for entry in spec.jobs:
+            job = Job(
+                **entry.job.model_dump(),
+                job_id=f"job-{uuid.uuid4().hex[:8]}",
+                user_id=user_id,
+                group_id=spec.group_id,
+                priority=JobQueue.default_priority(entry.job.type),
+                pipeline_id=pipeline.id,
+                stage=entry.name,
+                status=JobStatus.WAITING if entry.depends_on else JobStatus.PENDING,
+                queued_at=None if entry.depends_on else now
+            )
+            db.add(job)
+            jobs[entry.name] = job
+        db.flush()
+
+        for entry in spec.jobs:
+            for dependency in entry.depends_on:
+                db.add(JobDependency(
+                    job_id=jobs[entry.name].id,
+                    depends_on_id=jobs[dependency.job].id,
+                    input_path=dependency.path,
+                    output_file=dependency.file
+                ))
+        db.commit()
+        db.refresh(pipeline)
+
+        # Reconciliation retries if Redis is down
+        for job in jobs.values():
+            if job.status == JobStatus.PENDING:
+                JobQueue.enqueue(job)
+        return pipeline
+
+    @staticmethod
+    def dependencies(db: Session, pipeline: Pipeline) -> Dict[str, List[str]]:
+        """Job name -> names of the jobs it depends on"""
+        names = {job.id: job.stage for job in pipeline.jobs}
+        graph = {name: [] for name in names.values()}
+        edges = db.query(JobDependency).filter(JobDependency.job_id.in_(list(names))).all() if names else []
+        for edge in edges:
+            graph[names[edge.job_id]].append(names.get(edge.depends_on_id))
+        return graph
+
+    @staticmethod
+    def status(pipeline: Pipeline) -> str:
+        """Overall state of a pipeline, derived from its jobs"""
+        statuses = {job.status for job in pipeline.jobs}
+        if JobStatus.FAILED in statuses:
+            return "failed"
+        if JobStatus.CANCELLED in statuses:
+            return "cancelled"
+        if statuses <= {JobStatus.COMPLETED}:
+            return "completed"
+        if statuses & set(ACTIVE_JOB_STATUSES) or JobStatus.COMPLETED in statuses:
+            return "running"
+        return "waiting"
+
+    @staticmethod
+    def to_response(db: Session, pipeline: Pipeline) -> dict:
+        return {
+            "id": pipeline.id,
+            "pipeline_id": pipeline.pipeline_id,
+            "name": pipeline.name,
+            "user_id": pipeline.user_id,
+            "group_id": pipeline.group_id,
+            "status": PipelineService.status(pipeline),
+            "jobs": pipeline.jobs,
+            "dependencies": PipelineService.dependencies(db, pipeline),
+            "created_at": pipeline.created_at,
+        }
+
+    @staticmethod
+    def output_cid(parent: Job, output_file: Optional[str]) -> Optional[str]:
+        """CID of a parent's whole output package, or of one file in it"""
+        if not output_file:
+            return parent.output_cid or (parent.output_manifest or {}).get("cid")
+        for file_info in (parent.output_manifest or {}).get("files") or []:
+            if file_info.get("path") == output_file:
+                # Files inside tar packages have no CID of their own
+                return file_info.get("cid")
+        return None
+
+    @staticmethod
+    def _release(db: Session, child: Job, now: datetime) -> Optional[bool]:
+        """
+        Queue a locked waiting job if all its parents completed (caller
+        commits). Returns True if released, False if it was cancelled or
+        failed instead, None if it must keep waiting.
+        """
+        edges = db.query(JobDependency, Job).join(
+            Job, Job.id == JobDependency.depends_on_id
+        ).filter(JobDependency.job_id == child.id).all()
+
+        for _, parent in edges:
+            if parent.status in (JobStatus.FAILED, JobStatus.CANCELLED):
+                PipelineService._cancel(child, parent, now)
+                return False
+        if any(parent.status != JobStatus.COMPLETED for _, parent in edges):
+            return None
+
+        inputs = list(child.input_files or [])
+        for edge, parent in edges:
+            cid = PipelineService.output_cid(parent, edge.output_file)
+            if not cid:
+                child.status = JobStatus.FAILED
+                child.completed_at = now
+                child.error = (
+                    f"Dependency {parent.stage or parent.job_id} has no output "
+                    f"{edge.output_file or ''}".rstrip()
+                )
+                return False
+            inputs.append({"cid": cid, "path": edge.input_path})
+        child.input_files = inputs
+        child.status = JobStatus.PENDING
+        child.queued_at = now
+
+        # The node that ran the most recently finished parent holds its outputs
+        latest = max(
+            (parent for _, parent in edges if parent.node_id),
+            key=lambda parent: (parent.completed_at is not None, parent.completed_at or now),
+            default=None
+        )
+        if latest is not None:
+            child.preferred_node_id = latest.node_id
+            child.affinity_until = now + timedelta(seconds=settings.PIPELINE_AFFINITY_SECONDS)
+        return True
+
+    @staticmethod
+    def _settle(db: Session, children: List[Job]) -> int:
+        """Release or cancel locked waiting jobs, commit and queue them"""
+        now = datetime.utcnow()
+        released = []
+        stopped = []
+        for child in children:
+            outcome = PipelineService._release(db, child, now)
+            if outcome:
+                released.append(child)
+            elif outcome is False:
+                stopped.append(child)
+        for child in stopped:
+            PipelineService.cancel_dependents(db, child)
+        db.commit()
+
+        for job in released:
+            JobQueue.enqueue(job)
+        if released or stopped:
+            logger.info(f"Released {len(released)} waiting jobs, stopped {len(stopped)}")
+        return len(released)
+
+    @staticmethod
+    def release_dependents(db: Session, job: Job) -> int:
+        """
+        Queue the waiting jobs whose last parent was `job`. Call after the
+        parent's completion is committed. Returns the number released.
+
+        Children are locked, so when parents complete concurrently each
+        check waits for the other and the last one sees every parent done.
+        """
+        children = db.query(Job).join(
+            JobDependency, JobDependency.job_id == Job.id
+        ).filter(
+            JobDependency.depends_on_id == job.id,
+            Job.status == JobStatus.WAITING
+        ).order_by(Job.id).with_for_update(of=Job).all()
+        if not children:
+            return 0
+        return PipelineService._settle(db, children)
+
+    @staticmethod
+    def _cancel(child: Job, parent: Job, now: datetime):
+        child.status = JobStatus.CANCELLED
+        child.completed_at = now
+        child.error = f"Dependency {parent.stage or parent.job_id} {parent.status.value}"
+
+    @staticmethod
+    def cancel_dependents(db: Session, job: Job) -> int:
+        """
+        Cancel every waiting job downstream of a failed or cancelled job
+        (caller commits). Returns the number cancelled.
+        """
+        now = datetime.utcnow()
+        cancelled = 0
+        frontier = [job]
+        while frontier:
+            parent = frontier.pop()
+            children = db.query(Job).join(
+                JobDependency, JobDependency.job_id == Job.id
+            ).filter(
+                JobDependency.depends_on_id == parent.id,
+                Job.status == JobStatus.WAITING
+            ).all()
+            for child in children:
+                PipelineService._cancel(child, parent, now)
+                frontier.append(child)
+            cancelled += len(children)
+        return cancelled
+
+    @staticmethod
+    def cancel(db: Session, pipeline: Pipeline) -> int:
+        """Cancel every job of a pipeline that has not started yet. Returns the number cancelled."""
+        now = datetime.utcnow()
+        cancelled = 0
+        for job in pipeline.jobs:
+            if job.status in (JobStatus.WAITING, JobStatus.PENDING, JobStatus.ASSIGNED):
+                job.status = JobStatus.CANCELLED
+                job.completed_at = now
+                job.lease_expires_at = None
+                job.error = "Pipeline cancelled"
+                cancelled += 1
+        db.commit()
+        return cancelled
+
+    @staticmethod
+    def release_ready(db: Session) -> int:
+        """
+        Settle waiting jobs whose parents have all finished. Completions
+        release their children directly; this catches any that were missed
+        (a crash between the two commits, parents failed by the lease sweep).
+        """
+        parent = aliased(Job)
+        unfinished = exists().where(
+            JobDependency.job_id == Job.id,
+            JobDependency.depends_on_id == parent.id,
+            parent.status.notin_(FINISHED_JOB_STATUSES)
+        )
+        children = db.query(Job).filter(
+            Job.status == JobStatus.WAITING,
+            ~unfinished
+        ).order_by(Job.id).with_for_update(skip_locked=True).limit(RELEASE_BATCH_SIZE).all()
+        if not children:
+            db.rollback()
+            return 0
+        return PipelineService._settle(db, children)
+
+@periodic_task("pipeline_release", settings.PIPELINE_RELEASE_INTERVAL)
+def release_waiting_jobs(db: Session):
+    PipelineService.release_ready(db)
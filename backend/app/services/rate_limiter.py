@@ -0,0 +1,164 @@
+"""
+Rate limiting for API services
+Enforces a service's rate_limit_per_minute, _per_hour and _per_day for each
+subscription with token buckets kept in Redis. A bucket holds up to the
+window's limit and refills at limit / window per second, so a subscriber
+may burst up to the limit and then continues at the average rate. One Lua
+script checks and charges all three buckets atomically in one round trip; a
+request is only charged if every window has room. Limits of 0 or less are
+not enforced.
+
+When Redis is unreachable each API worker falls back to its own in-memory
+buckets (so the effective limit is multiplied by the number of workers)
+and retries Redis after RATE_LIMIT_REDIS_RETRY seconds.
+"""
+from typing import Dict, List, Optional, Tuple
+from collections import OrderedDict
+import logging
+import math
+import threading
+import time
+import redis
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.services.api_key_cache import CachedService
+
+logger = logging.getLogger(__name__)
+
+# (header suffix, window in seconds, service column)
+WINDOWS = (
+    ("Minute", 60, "rate_limit_per_minute"),
+    ("Hour", 3600, "rate_limit_per_hour"),
+    ("Day", 86400, "rate_limit_per_day"),
+)
+
+# KEYS: one bucket per window. ARGV: now, then limit and window seconds per key.
+# Returns allowed, retry after, then tokens left and seconds until full per key.
+# Fractions are returned as strings: Redis truncates Lua numbers to integers.
+TOKEN_BUCKET_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tokens = {}
+local allowed = 1
+local retry_after = 0
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local rate = limit / tonumber(ARGV[i * 2 + 1])
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(bucket[1]) or limit
+    local elapsed = math.max(0, now - (tonumber(bucket[2]) or now))
+    level = math.min(limit, level + elapsed * rate)
+    if level < 1 then
+        allowed = 0
+        retry_after = math.max(retry_after, (1 - level) / rate)
+    end
+    tokens[i] = level
+end
+local result = {allowed, tostring(retry_after)}
+for i, key in ipairs(KEYS) do
+    local limit = tonumber(ARGV[i * 2])
+    local window = tonumber(ARGV[i * 2 + 1])
+    local level = tokens[i] - allowed
+    redis.call('HSET', key, 'tokens', tostring(level), 'ts', ARGV[1])
+    -- An untouched bucket is full again after one window
+    redis.call('PEXPIRE', key, math.ceil(window * 1000))
+    table.insert(result, math.floor(level))
+    table.insert(result, tostring((limit - level) * window / limit))
+end
+return result
+"""
+
+# (header suffix, window in seconds, limit)
+Limit = Tuple[str, int, int]
+
+class RateLimitResult:
+    def __init__(self, allowed: bool, retry_after: Optional[float] = None,
+                 windows: Optional[List[Tuple[str, int, int, float]]] = None):
+        self.allowed = allowed
+        self.retry_after = retry_after  # Seconds until a request would be allowed, when refused
+        self.windows = windows or []  # (header suffix, limit, remaining, seconds until full)
+
+    def headers(self) -> Dict[str, str]:
+        """Retry-After and X-RateLimit-* headers. The unsuffixed ones describe the tightest window."""
+        headers = {}
+        if self.windows:
+            _, limit, remaining, reset = min(self.windows, key=lambda window: (window[2], -window[3]))
+            headers["X-RateLimit-Limit"] = str(limit)
+            headers["X-RateLimit-Remaining"] = str(remaining)
+            headers["X-RateLimit-Reset"] = str(math.ceil(reset))
+            for suffix, limit, remaining, _ in self.windows:
+                headers[f"X-RateLimit-Limit-{suffix}"] = str(limit)
+                headers[f"X-RateLimit-Remaining-{suffix}"] = str(remaining)
+        if not self.allowed and self.retry_after is not None:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+class RateLimiter:
+    def __init__(self):
+        self._script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._redis_retry_at = 0.0
+        self._lock = threading.Lock()
+        # Fallback buckets: key -> (tokens, updated at), least recently used first
+        self._local: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    @staticmethod
+    def limits(service: CachedService) -> List[Limit]:
+        limits = []
+        for suffix, window, column in WINDOWS:
+            limit = getattr(service, column)
+            if limit and limit > 0:
+                limits.append((suffix, window, limit))
+        return limits
+
+    def hit(self, subscription_id: int, service: CachedService) -> RateLimitResult:
+        """Charge one request to a subscription's buckets if every window has room"""
+        limits = self.limits(service)
+        if not limits:
+            return RateLimitResult(True)
+        # The hash tag keeps a subscription's buckets on one Redis Cluster slot
+        keys = [f"rate_limit:{{{subscription_id}}}:{suffix.lower()}" for suffix, _, _ in limits]
+        now = time.time()
+        if time.monotonic() >= self._redis_retry_at:
+            try:
+                return self._hit_redis(keys, limits, now)
+            except redis.RedisError as e:
+                logger.warning(f"Rate limiting locally for {settings.RATE_LIMIT_REDIS_RETRY}s, Redis failed: {e}")
+                self._redis_retry_at = time.monotonic() + settings.RATE_LIMIT_REDIS_RETRY
+        return self._hit_local(keys, limits, now)
+
+    def _hit_redis(self, keys: List[str], limits: List[Limit], now: float) -> RateLimitResult:
+        args = [repr(now)]
+        for _, window, limit in limits:
+            args += [limit, window]
+        result = self._script(keys=keys, args=args, client=redis_client)
+        windows = [
+            (suffix, limit, max(int(result[2 + i * 2]), 0), float(result[3 + i * 2]))
+            for i, (suffix, _, limit) in enumerate(limits)
+        ]
+        return RateLimitResult(bool(int(result[0])), float(result[1]), windows)
+
+    def _hit_local(self, keys: List[str], limits: List[Limit], now: float) -> RateLimitResult:
+        """The same algorithm as the Lua script, on this worker's buckets"""
+        with self._lock:
+            levels = []
+            retry_after = 0.0
+            for key, (_, window, limit) in zip(keys, limits):
+                level, updated = self._local.get(key, (limit, now))
+                level = min(limit, level + max(0.0, now - updated) * limit / window)
+                if level < 1:
+                    retry_after = max(retry_after, (1 - level) * window / limit)
+                levels.append(level)
+            allowed = retry_after == 0
+
+            windows = []
+            for key, level, (suffix, window, limit) in zip(keys, levels, limits):
+                if allowed:
+                    level -= 1
+                self._local[key] = (level, now)
+                self._local.move_to_end(key)
+                windows.append((suffix, limit, max(math.floor(level), 0), (limit - level) * window / limit))
+            while len(self._local) > settings.RATE_LIMIT_LOCAL_MAX_BUCKETS:
+                self._local.popitem(last=False)
+        return RateLimitResult(allowed, retry_after, windows)
+
+# Global limiter instance
+rate_limiter = RateLimiter()
@@ -0,0 +1,278 @@
+"""
+Scheduler Service
+Matches job resource requirements against a node's free capacity and picks
+the jobs that pack the node most tightly.
+
+Capacity comes from the `resources` JSON nodes report through ResourceMonitor
+(registration and heartbeats), along with digests of the input CIDs each
+node has cached, which let placement favour jobs a node can start without
+downloading their inputs. Free capacity is the node's total minus what
+its assigned and running jobs have reserved. Memory is also capped by what
+the node last reported as available, so work running outside AIForge is
+respected. Reported CPU usage already includes the node's running jobs, so
+it only caps jobs that declare a CPU limit; jobs that do not are assumed to
+need a fraction of a core and are only checked against unreserved cores.
+Nodes flagged as flaky by their recent job statistics (NodeStatsService)
+are limited to one job at a time.
+"""
+from typing import Dict, Any, List, Tuple
+import hashlib
+from sqlalchemy.orm import Session
+from app.models.node import Node
+from app.models.job import Job, JobStatus
+
+# Requirements assumed for jobs that do not declare them. The CPU request
+# is a fraction of a core so a busy node still takes undeclared jobs.
+DEFAULT_CPU_REQUEST = 0.25
+DEFAULT_MEMORY_REQUEST = 0
+
+ACTIVE_JOB_STATUSES = [JobStatus.ASSIGNED, JobStatus.RUNNING]
+FINISHED_JOB_STATUSES = [JobStatus.COMPLETED, JobStatus.FAILED, JobStatus.CANCELLED]
+
+# Input bytes a node already holds that are worth as much as a perfect fit.
+# Placement prefers jobs whose inputs the node has cached.
+LOCALITY_BYTES_PER_POINT = 1024 ** 3
+
+_MEMORY_UNITS = {
+    "": 1,
+    "b": 1,
+    "k": 1024,
+    "kb": 1024,
+    "ki": 1024,
+    "m": 1024 ** 2,
+    "mb": 1024 ** 2,
+    "mi": 1024 ** 2,
+    "g": 1024 ** 3,
+    "gb": 1024 ** 3,
+    "gi": 1024 ** 3,
+    "t": 1024 ** 4,
+    "tb": 1024 ** 4,
+    "ti": 1024 ** 4,
+}
+
+class SchedulerService:
+    """Resource-aware job placement"""
+
+    @staticmethod
+    def parse_memory(value: Any) -> int:
+        """Parse a Docker-style memory limit ("512m", "4G", "1.5GB") into bytes"""
+        if value is None or value == "":
+            return 0
+        if isinstance(value, (int, float)):
+            return int(value)
+        text = str(value).strip().lower()
+        number = text.rstrip("abcdefghijklmnopqrstuvwxyz")
+        unit = text[len(number):]
+        try:
+            return int(float(number) * _MEMORY_UNITS[unit])
+        except (ValueError, KeyError):
+            return 0
+
+    @staticmethod
+    def job_requirements(job: Job) -> Dict[str, Any]:
+        """Resources a job needs to run"""
+        config = job.config or {}
+        return {
+            "cpu": float(job.cpu_limit) if job.cpu_limit else DEFAULT_CPU_REQUEST,
+            "cpu_declared": bool(job.cpu_limit),
+            "memory": SchedulerService.parse_memory(job.memory_limit) or DEFAULT_MEMORY_REQUEST,
+            "gpus": int(job.gpus or 0),
+            # Per-GPU memory, optional, declared in the job config
+            "gpu_memory_mb": int(config.get("gpu_memory_mb") or 0),
+        }
+
+    @staticmethod
+    def node_capacity(node: Node) -> Dict[str, Any]:
+        """
+        Total and currently available resources as last reported by the node.
+        Unknown values are None, which the fit check treats as unconstrained.
+        """
+        resources = node.resources or {}
+        cpu = resources.get("cpu") or {}
+        memory = resources.get("memory") or {}
+        gpu = resources.get("gpu") or {}
+        gpus = gpu.get("gpus") or []
+
+        cpu_total = cpu.get("logical_cores") or cpu.get("cores")
+        cpu_available = None
+        if cpu_total and cpu.get("usage_percent") is not None:
+            cpu_available = cpu_total * max(0.0, 1.0 - cpu["usage_percent"] / 100.0)
+
+        if not node.gpu_enabled:
+            gpu_count = 0
+        elif gpus or gpu.get("count") is not None:
+            gpu_count = gpu.get("count", len(gpus))
+        else:
+            gpu_count = None
+
+        return {
+            "cpu": cpu_total,
+            "cpu_available": cpu_available,
+            "memory": memory.get("total"),
+            "memory_available": memory.get("available"),
+            "gpus": gpu_count,
+            "gpu_memory_mb": [g.get("memory_total_mb", 0) for g in gpus],
+            "gpu_memory_free_mb": [g.get("memory_free_mb", 0) for g in gpus],
+        }
+
+    @staticmethod
+    def free_resources(capacity: Dict[str, Any], reserved: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Free resources after subtracting reservations of active jobs"""
+        def remaining(total, available, used):
+            if total is None:
+                return None
+            free = total - used
+            if available is not None:
+                free = min(free, available)
+            return max(free, 0)
+
+        gpu_memory_free = list(capacity["gpu_memory_free_mb"]) or list(capacity["gpu_memory_mb"])
+        # Devices held by active jobs are assumed to be the ones with the
+        # least free memory, so drop those from the front
+        gpu_memory_free.sort()
+        reserved_gpus = sum(r["gpus"] for r in reserved)
+
+        return {
+            "cpu": remaining(capacity["cpu"], None, sum(r["cpu"] for r in reserved)),
+            # Idle CPU as reported, which already accounts for running jobs
+            "cpu_available": capacity["cpu_available"],
+            "memory": remaining(capacity["memory"], capacity["memory_available"], sum(r["memory"] for r in reserved)),
+            "gpus": remaining(capacity["gpus"], None, reserved_gpus),
+            "gpu_memory_mb": gpu_memory_free[reserved_gpus:],
+        }
+
+    @staticmethod
+    def fits(requirements: Dict[str, Any], free: Dict[str, Any]) -> bool:
+        """Whether a job fits in the given free resources"""
+        if free["cpu"] is not None and requirements["cpu"] > free["cpu"] + 1e-9:
+            return False
+        if (requirements.get("cpu_declared") and free.get("cpu_available") is not None
+                and requirements["cpu"] > free["cpu_available"] + 1e-9):
+            return False
+        if free["memory"] is not None and requirements["memory"] > free["memory"]:
+            return False
+        if requirements["gpus"]:
+            if free["gpus"] is not None and requirements["gpus"] > free["gpus"]:
+                return False
+            if requirements["gpu_memory_mb"] and free["gpu_memory_mb"]:
+                suitable = [m for m in free["gpu_memory_mb"] if m >= requirements["gpu_memory_mb"]]
+                if len(suitable) < requirements["gpus"]:
+                    return False
+        return True
+
+    @staticmethod
+    def reserve(free: Dict[str, Any], requirements: Dict[str, Any]) -> Dict[str, Any]:
+        """Free resources after placing a job"""
+        gpu_memory = sorted(free["gpu_memory_mb"])
+        for _ in range(min(requirements["gpus"], len(gpu_memory))):
+            # Give the job the smallest devices that satisfy it
+            index = next(
+                (i for i, m in enumerate(gpu_memory) if m >= requirements["gpu_memory_mb"]),
+                len(gpu_memory) - 1
+            )
+            gpu_memory.pop(index)
+        return {
+            "cpu": None if free["cpu"] is None else free["cpu"] - requirements["cpu"],
+            "cpu_available": None if free.get("cpu_available") is None else free["cpu_available"] - requirements["cpu"],
+            "memory": None if free["memory"] is None else free["memory"] - requirements["memory"],
+            "gpus": None if free["gpus"] is None else free["gpus"] - requirements["gpus"],
+            "gpu_memory_mb": gpu_memory,
+        }
+
+    @staticmethod
+    def fit_score(requirements: Dict[str, Any], free: Dict[str, Any]) -> float:
+        """
+        How tightly a job fills the node's free resources (0..1).
+
+        This is the job's dominant share of what is free: choosing the
+        highest-scoring job that fits is a best-fit packing heuristic, which
+        keeps large nodes available for large jobs.
+        """
+        shares = []
+        for resource in ("cpu", "memory", "gpus"):
+            if free[resource]:
+                shares.append(requirements[resource] / free[resource])
+        return max(shares) if shares else 0.0
+
+    @staticmethod
+    def cid_digest(cid: str) -> str:
+        """Short CID digest nodes use to report their cache (see node-client InputCache)"""
+        return hashlib.sha256(cid.encode()).hexdigest()[:12]
+
+    @staticmethod
+    def cached_inputs(node: Node) -> Dict[str, int]:
+        """Input CID digest -> size in bytes for what the node reports as cached"""
+        cache = (node.resources or {}).get("input_cache") or {}
+        return cache.get("digests") or {}
+
+    @staticmethod
+    def cached_bytes(job: Job, cached: Dict[str, int]) -> int:
+        """Bytes of the job's inputs the node would not have to download"""
+        if not cached:
+            return 0
+        digests = {
+            SchedulerService.cid_digest(file_info["cid"])
+            for file_info in job.input_files or []
+            if isinstance(file_info, dict) and file_info.get("cid")
+        }
+        return sum(cached.get(digest, 0) for digest in digests)
+
+    @staticmethod
+    def placement_score(requirements: Dict[str, Any], free: Dict[str, Any]) -> float:
+        """Fit score plus a bonus for inputs already cached on the node"""
+        return (
+            SchedulerService.fit_score(requirements, free)
+            + requirements.get("cached_bytes", 0) / LOCALITY_BYTES_PER_POINT
+        )
+
+    @staticmethod
+    def select_jobs(
+        candidates: List[Tuple[Any, Dict[str, Any]]],
+        free: Dict[str, Any],
+        slots: int
+    ) -> List[Any]:
+        """
+        Pick up to `slots` candidates to place on a node.
+
+        `candidates` are (item, requirements) pairs in queue order. Each round
+        takes the best-scoring candidate that still fits (tightest fit, plus
+        cached input bytes if requirements carry "cached_bytes"); ties go to
+        the earlier candidate so queue order is preserved among equals.
+        """
+        remaining = list(candidates)
+        selected = []
+        while remaining and len(selected) < slots:
+            best_index = None
+            best_score = -1.0
+            for index, (_, requirements) in enumerate(remaining):
+                if not SchedulerService.fits(requirements, free):
+                    continue
+                score = SchedulerService.placement_score(requirements, free)
+                if score > best_score + 1e-9:
+                    best_index = index
+                    best_score = score
+            if best_index is None:
+                break
+            item, requirements = remaining.pop(best_index)
+            selected.append(item)
+            free = SchedulerService.reserve(free, requirements)
+        return selected
+
+    @staticmethod
+    def node_state(db: Session, node: Node) -> Dict[str, Any]:
+        """Free resources and free job slots on a node"""
+        active_jobs = db.query(Job).filter(
+            Job.node_id == node.id,
+            Job.status.in_(ACTIVE_JOB_STATUSES)
+        ).all()
+        reserved = [SchedulerService.job_requirements(job) for job in active_jobs]
+        capacity = SchedulerService.node_capacity(node)
+        # Nodes failing much of their recent work get one job at a time
+        # until they recover, so they cannot fail a whole batch at once
+        max_jobs = node.max_concurrent_jobs
+        if (node.performance or {}).get("flaky"):
+            max_jobs = min(max_jobs, 1)
+        return {
+            "free": SchedulerService.free_resources(capacity, reserved),
+            "slots": max(max_jobs - len(active_jobs), 0),
+        }
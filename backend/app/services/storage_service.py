@@ -34,7 +34,7 @@ class StorageService:
         if not self.minio_client:
             return
         
-        buckets = ['models', 'datasets', 'checkpoints', 'temp', 'chat-attachments']
+        buckets = ['models', 'datasets', 'checkpoints', 'temp', 'chat-attachments', 'job-logs']
         for bucket in buckets:
             try:
                 if not self.minio_client.bucket_exists(bucket):
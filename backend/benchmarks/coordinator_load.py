@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+"""
+Load test for the coordinator's node-facing API with a simulated fleet.
+
+Runs the FastAPI app in-process and drives it with thousands of async node
+clients over httpx's ASGI transport. Each simulated node registers, sends
+heartbeats, polls for jobs up to its free slots, reports each job as
+running and completes it after a short simulated run. The queue is seeded
+with --jobs pending jobs up front; the run ends when all of them are
+completed or after --duration seconds.
+
+By default the app runs against a throwaway SQLite database and fakeredis
+(with lupa installed, the queue's Lua scripts run too; without it dispatch
+falls back to scanning the jobs table). Pass --database-url and
+--redis-url to test against a real Postgres and Redis; the database must
+already be migrated (alembic upgrade head) and should be disposable, as
+jobs and nodes are added to it.
+
+Reports, per endpoint, request count, errors, throughput and p50/p99
+latency; the database pool's peak checkouts and how often it was
+exhausted; event loop lag; and how many jobs were handed to more than
+one node (which must be zero: leases are far longer than the run).
+
+The run fails (exit status 1) if a periodic task (heartbeat flush, lease
+sweep, ...) raised, or if heartbeats did not reach nodes.last_heartbeat.
+
+The simulated nodes share the app's process and event loop, so a large
+fleet is bounded by one CPU: request latencies cover only the time a
+request spends in the app, while loop lag shows how long requests waited
+to be started. Compare runs on the same machine rather than reading the
+numbers as production capacity.
+
+Needs httpx, and fakeredis (plus lupa) unless --redis-url is given.
+
+Usage: python benchmarks/coordinator_load.py [--nodes 1000] [--jobs 5000] [--duration 120]
+           [--database-url postgresql://...] [--redis-url redis://...]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+GIB = 1024 ** 3
+
+# Tables the node-facing endpoints and periodic tasks touch, created when running on SQLite
+SQLITE_TABLES = [
+    "users", "groups", "group_memberships", "nodes", "pipelines", "jobs", "job_dependencies", "system_settings",
+    "inference_endpoints"
+]
+
+ENDPOINTS = ["register", "heartbeat", "poll", "status", "complete"]
+
+# How often the database pool and the event loop are sampled
+POOL_SAMPLE_INTERVAL = 0.05  # seconds
+LAG_SAMPLE_INTERVAL = 0.1  # seconds
+# How long nodes get to finish their jobs once the run stops
+STOP_GRACE = 10  # seconds
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = Counter()
+        self.assignments = defaultdict(list)  # job id -> node ids it was handed to
+        self.completed = 0
+        self.pool_samples = []
+        self.loop_lag = []
+        self.task_failures = Counter()  # periodic task name -> exceptions
+        self.first_heartbeat = {}  # node id -> when its first heartbeat was sent (UTC)
+
+    async def call(self, endpoint, request):
+        """Await a request, recording its latency. Returns the response, or None on error."""
+        start = time.perf_counter()
+        try:
+            response = await request
+        except Exception:
+            self.errors[endpoint] += 1
+            return None
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors[endpoint] += 1
+            return None
+        return response
+
+class TaskFailures(logging.Handler):
+    """Counts the exceptions the app's periodic tasks log (they are not raised anywhere)"""
+
+    def __init__(self, stats):
+        super().__init__(logging.ERROR)
+        self.stats = stats
+
+    def emit(self, record):
+        match = re.match(r"Background task (\S+) failed", record.getMessage())
+        if match:
+            self.stats.task_failures[match.group(1)] += 1
+
+def configure(args):
+    """Point the app at the chosen database and Redis before it is imported"""
+    scratch = None
+    if not args.database_url:
+        scratch = tempfile.mkdtemp(prefix="coordinator-load-")
+        args.database_url = f"sqlite:///{os.path.join(scratch, 'load.db')}"
+    os.environ["DATABASE_URL"] = args.database_url
+    if args.redis_url:
+        os.environ["REDIS_URL"] = args.redis_url
+
+    import app.main
+
+    if not args.redis_url:
+        try:
+            import fakeredis
+        except ImportError:
+            sys.exit("fakeredis is not installed; pip install fakeredis (and lupa) or pass --redis-url")
+        # Replace the shared client everywhere it was imported by name
+        fake = fakeredis.FakeRedis(decode_responses=True)
+        for name, module in list(sys.modules.items()):
+            if name.startswith("app.") and getattr(module, "redis_client", None) is not None:
+                module.redis_client = fake
+
+    from app.core.database import Base, engine
+    import app.models  # noqa: F401  (registers every table)
+    if args.database_url.startswith("sqlite"):
+        Base.metadata.create_all(engine, tables=[Base.metadata.tables[name] for name in SQLITE_TABLES])
+    return app.main.app, engine, scratch
+
+def seed_jobs(count, rng):
+    """Insert pending jobs and queue them"""
+    import uuid
+    from app.core.database import SessionLocal
+    from app.models.job import Job, JobStatus, JobType
+    from app.services.job_queue import JobQueue
+
+    db = SessionLocal()
+    try:
+        ids = []
+        for start in range(0, count, 1000):
+            batch = [
+                Job(
+                    job_id=f"load-{uuid.uuid4().hex[:12]}",
+                    type=JobType.TEST,
+                    config={},
+                    docker_image="python:3.11-slim",
+                    memory_limit=f"{rng.choice([256, 512, 1024])}m",
+                    cpu_limit=rng.choice([0.5, 1.0]),
+                    status=JobStatus.PENDING
+                )
+                for _ in range(min(1000, count - start))
+            ]
+            db.add_all(batch)
+            db.commit()
+            for job in batch:
+                JobQueue.enqueue(job)
+            ids.extend(job.job_id for job in batch)
+        return ids
+    finally:
+        db.close()
+
+async def run_job(client, stats, node_id, job_id, rng, args):
+    await stats.call("status", client.put(
+        f"/api/nodes/{node_id}/jobs/{job_id}/status",
+        json={"status": "running", "progress": 0.0}
+    ))
+    await asyncio.sleep(rng.uniform(*args.job_seconds))
+    response = await stats.call("complete", client.post(
+        f"/api/nodes/{node_id}/jobs/{job_id}/complete",
+        json={"result": {"ok": True}, "output_cid": None}
+    ))
+    if response is not None:
+        stats.completed += 1
+
+async def run_node(client, stats, index, rng, args, stop):
+    # Stagger registrations over the ramp-up period
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+    resources = {
+        "cpu": {"logical_cores": args.cores, "usage_percent": 0},
+        "memory": {"total": args.memory_gb * GIB, "available": args.memory_gb * GIB},
+    }
+    response = None
+    while response is None and not stop.is_set():
+        response = await stats.call("register", client.post("/api/nodes/register", json={
+            "name": f"load-node-{index}",
+            "max_concurrent_jobs": args.slots,
+            "resources": resources,
+        }))
+        if response is None:
+            await asyncio.sleep(1)
+    if response is None:
+        return
+    node_id = response.json()["node_id"]
+
+    loop = asyncio.get_running_loop()
+    next_heartbeat = loop.time() + rng.uniform(0, args.heartbeat_interval)
+    running = set()
+    while not stop.is_set():
+        if loop.time() >= next_heartbeat:
+            sent = datetime.utcnow()
+            response = await stats.call("heartbeat", client.post(f"/api/nodes/{node_id}/heartbeat", json={
+                "status": "active",
+                "resources_delta": {"cpu": {"usage_percent": round(rng.uniform(0, 100), 1)}},
+            }))
+            if response is not None:
+                stats.first_heartbeat.setdefault(node_id, sent)
+            next_heartbeat = loop.time() + args.heartbeat_interval
+
+        free = args.slots - len(running)
+        if free > 0:
+            response = await stats.call("poll", client.get(
+                f"/api/nodes/{node_id}/jobs/poll", params={"max_jobs": free}
+            ))
+            for job in (response.json().get("jobs") or []) if response is not None else []:
+                stats.assignments[job["id"]].append(node_id)
+                task = asyncio.create_task(run_job(client, stats, node_id, job["id"], rng, args))
+                running.add(task)
+                task.add_done_callback(running.discard)
+
+        await asyncio.sleep(args.poll_interval * rng.uniform(0.5, 1.5))
+
+    if running:
+        await asyncio.gather(*running, return_exceptions=True)
+
+def sample_pool(engine, stats, stop):
+    """
+    Record the pool's checkouts. Runs in its own thread: the endpoints make
+    blocking database calls on the event loop, so a loop-based sampler would
+    stop exactly when the pool runs dry.
+    """
+    pool = engine.pool
+    while not stop.wait(POOL_SAMPLE_INTERVAL):
+        stats.pool_samples.append(pool.checkedout() if hasattr(pool, "checkedout") else 0)
+
+async def sample_loop_lag(stats, stop):
+    """
+    Record how late the event loop wakes up. This covers blocking calls in
+    endpoints and plain CPU saturation of the shared loop alike.
+    """
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        start = loop.time()
+        await asyncio.sleep(LAG_SAMPLE_INTERVAL)
+        stats.loop_lag.append(loop.time() - start - LAG_SAMPLE_INTERVAL)
+
+async def run(app, engine, args):
+    try:
+        import httpx
+    except ImportError:
+        sys.exit("httpx is not installed; pip install httpx")
+    from app.core.background import start_background_tasks, stop_background_tasks
+
+    rng = random.Random(args.seed)
+    job_ids = seed_jobs(args.jobs, rng)
+    print(f"Seeded {len(job_ids)} jobs; starting {args.nodes} nodes")
+
+    stats = Stats()
+    failures = TaskFailures(stats)
+    logging.getLogger("app.core.background").addHandler(failures)
+    stop = asyncio.Event()
+    sampler_stop = threading.Event()
+    sampler = threading.Thread(target=sample_pool, args=(engine, stats, sampler_stop), daemon=True)
+    sampler.start()
+    # The ASGI transport sends no lifespan events; start the periodic tasks
+    # (heartbeat flush, lease sweep, ...) as the server would
+    start_background_tasks()
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=None)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://coordinator", limits=limits, timeout=60) as client:
+        lag = asyncio.create_task(sample_loop_lag(stats, stop))
+        nodes = [
+            asyncio.create_task(run_node(client, stats, i, random.Random(args.seed * 100003 + i), args, stop))
+            for i in range(args.nodes)
+        ]
+        deadline = started + args.duration
+        while time.perf_counter() < deadline and stats.completed < len(job_ids):
+            await asyncio.sleep(0.5)
+        stop.set()
+        elapsed = time.perf_counter() - started
+        # Let running jobs report back, but do not wait on stalled requests forever
+        _, stalled = await asyncio.wait(nodes, timeout=STOP_GRACE)
+        for task in stalled:
+            task.cancel()
+        await asyncio.gather(*nodes, lag, return_exceptions=True)
+    sampler_stop.set()
+    sampler.join()
+    await stop_background_tasks()
+    logging.getLogger("app.core.background").removeHandler(failures)
+    stats.ended = datetime.utcnow()
+    return stats, elapsed, job_ids
+
+def job_counts(job_ids):
+    """Final job states and reassignments, from the database"""
+    from sqlalchemy import func
+    from app.core.database import SessionLocal
+    from app.models.job import Job
+
+    db = SessionLocal()
+    try:
+        counts = Counter()
+        reassigned = 0
+        for start in range(0, len(job_ids), 1000):
+            batch = job_ids[start:start + 1000]
+            for status, count in db.query(Job.status, func.count()).filter(Job.job_id.in_(batch)).group_by(Job.status):
+                counts[status.value] += count
+            reassigned += db.query(Job).filter(Job.job_id.in_(batch), Job.attempts > 1).count()
+        return counts, reassigned
+    finally:
+        db.close()
+
+def unflushed_heartbeats(stats):
+    """
+    Nodes whose heartbeats never reached nodes.last_heartbeat. Only nodes
+    that sent one at least two flush intervals before the end are checked.
+    Returns (checked, stale).
+    """
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.models.node import Node
+
+    cutoff = stats.ended - timedelta(seconds=2 * settings.NODE_HEARTBEAT_FLUSH_INTERVAL)
+    expected = {node_id: sent for node_id, sent in stats.first_heartbeat.items() if sent < cutoff}
+    db = SessionLocal()
+    try:
+        stale = 0
+        node_ids = list(expected)
+        for start in range(0, len(node_ids), 1000):
+            batch = node_ids[start:start + 1000]
+            for node_id, seen in db.query(Node.node_id, Node.last_heartbeat).filter(Node.node_id.in_(batch)):
+                # Registration sets last_heartbeat too; only a flushed heartbeat moves it past `sent`
+                if seen is None or seen.replace(tzinfo=None) < expected[node_id]:
+                    stale += 1
+        return len(expected), stale
+    finally:
+        db.close()
+
+def report(stats, elapsed, job_ids, engine, args):
+    print(f"\n{elapsed:.1f}s, {stats.completed}/{len(job_ids)} jobs completed "
+          f"({stats.completed / elapsed:.1f} jobs/s)\n")
+    print(f"{'endpoint':<10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = 0
+    for endpoint in ENDPOINTS:
+        latencies = stats.latencies[endpoint]
+        total += len(latencies)
+        print(f"{endpoint:<10} {len(latencies):>9} {stats.errors[endpoint]:>7} {len(latencies) / elapsed:>8.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+              f"{max(latencies, default=0) * 1000:>8.1f}")
+    print(f"{'total':<10} {total:>9} {sum(stats.errors.values()):>7} {total / elapsed:>8.1f}")
+
+    pool = engine.pool
+    capacity = pool.size() + max(getattr(pool, "_max_overflow", 0), 0) if hasattr(pool, "size") else 0
+    samples = stats.pool_samples
+    if capacity and samples:
+        exhausted = sum(1 for value in samples if value >= capacity) / len(samples)
+        print(f"\nDB pool: capacity {capacity}, peak {max(samples)} checked out, "
+              f"mean {sum(samples) / len(samples):.1f}, exhausted {exhausted:.1%} of the time")
+    if stats.loop_lag:
+        print(f"Event loop lag: p50 {percentile(stats.loop_lag, 0.5) * 1000:.0f} ms, "
+              f"p99 {percentile(stats.loop_lag, 0.99) * 1000:.0f} ms, max {max(stats.loop_lag) * 1000:.0f} ms")
+
+    handed_twice = sum(1 for nodes in stats.assignments.values() if len(nodes) > 1)
+    counts, reassigned = job_counts(job_ids)
+    print(f"\nJobs handed to more than one poll: {handed_twice}")
+    print(f"Jobs assigned more than once (attempts > 1): {reassigned}")
+    print("Final job states: " + ", ".join(f"{status} {count}" for status, count in sorted(counts.items())))
+
+    problems = []
+    checked, stale = unflushed_heartbeats(stats)
+    print(f"Heartbeats written to nodes.last_heartbeat: {checked - stale}/{checked} nodes")
+    if stale:
+        problems.append(f"{stale} nodes' heartbeats never reached the database")
+    if stats.task_failures:
+        print("Periodic task failures: " + ", ".join(
+            f"{name} {count}" for name, count in sorted(stats.task_failures.items())
+        ))
+        problems.append("periodic tasks raised (run with --verbose for tracebacks)")
+    return problems
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=1000)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--duration", type=float, default=120, help="Stop after this many seconds")
+    parser.add_argument("--ramp", type=float, default=10, help="Registrations are spread over this many seconds")
+    parser.add_argument("--slots", type=int, default=2, help="Concurrent jobs per node")
+    parser.add_argument("--cores", type=int, default=8)
+    parser.add_argument("--memory-gb", type=int, default=32)
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Mean seconds between polls per node")
+    parser.add_argument("--heartbeat-interval", type=float, default=30.0)
+    parser.add_argument("--job-seconds", type=float, nargs=2, default=(0.5, 3.0), metavar=("MIN", "MAX"),
+                        help="Simulated job run time range")
+    parser.add_argument("--database-url", help="Defaults to a temporary SQLite database")
+    parser.add_argument("--redis-url", help="Defaults to fakeredis")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--verbose", action="store_true", help="Show the app's log output")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.ERROR)
+    app, engine, scratch = configure(args)
+    try:
+        stats, elapsed, job_ids = asyncio.run(run(app, engine, args))
+        problems = report(stats, elapsed, job_ids, engine, args)
+    finally:
+        if scratch:
+            shutil.rmtree(scratch, ignore_errors=True)
+    if problems:
+        sys.exit("\nFAILED: " + "; ".join(problems))
+
+if __name__ == "__main__":
+    main()
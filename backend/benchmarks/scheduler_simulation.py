@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Placement-quality simulation for the job scheduler.
+
+Simulates a heterogeneous node fleet pulling jobs from a shared queue and
+compares two policies:
+
+  fifo      - the old poll_job behaviour: take the oldest job the node is
+              allowed to run, whether or not it fits. Jobs that exceed the
+              node's free memory/GPUs fail (OOM) and are counted as lost.
+  best-fit  - SchedulerService: consider a window of queued jobs and place
+              the one that fits the node's free resources most tightly.
+
+Reports completed and failed jobs, average CPU/memory/GPU utilisation,
+average queue wait and makespan.
+
+Usage: python benchmarks/scheduler_simulation.py [--nodes 50] [--jobs 2000] [--seed 1]
+"""
+import argparse
+import os
+import random
+import sys
+from types import SimpleNamespace
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.scheduler_service import SchedulerService
+
+GIB = 1024 ** 3
+
+# (weight, cpu cores, memory GiB, gpus, gpu memory MiB, max concurrent jobs)
+NODE_SHAPES = [
+    (5, 4, 8, 0, 0, 2),
+    (3, 16, 64, 1, 24576, 4),
+    (2, 32, 256, 4, 81920, 8),
+]
+
+# (weight, job type, cpu, memory GiB, gpus, gpu memory MiB, duration ticks)
+JOB_SHAPES = [
+    (10, "test", 0.5, 0.5, 0, 0, (1, 3)),
+    (6, "inference", 2, 8, 1, 16000, (2, 6)),
+    (3, "quantize", 4, 24, 1, 20000, (5, 15)),
+    (2, "merge", 8, 48, 0, 0, (5, 20)),
+    (1, "finetune", 16, 128, 4, 70000, (20, 60)),
+]
+
+def weighted_choice(rng, shapes):
+    return rng.choices(shapes, weights=[shape[0] for shape in shapes])[0]
+
+def make_nodes(rng, count):
+    nodes = []
+    for i in range(count):
+        _, cpu, mem, gpus, gpu_mem, slots = weighted_choice(rng, NODE_SHAPES)
+        nodes.append({
+            "id": i,
+            "gpu_enabled": gpus > 0,
+            "slots": slots,
+            "capacity": {
+                "cpu": cpu,
+                "cpu_available": None,
+                "memory": mem * GIB,
+                "memory_available": None,
+                "gpus": gpus,
+                "gpu_memory_mb": [gpu_mem] * gpus,
+                "gpu_memory_free_mb": [],
+            },
+            "running": [],
+        })
+    return nodes
+
+def make_jobs(rng, count, arrival_ticks):
+    jobs = []
+    for i in range(count):
+        _, job_type, cpu, mem, gpus, gpu_mem, (low, high) = weighted_choice(rng, JOB_SHAPES)
+        job = SimpleNamespace(
+            cpu_limit=cpu,
+            memory_limit=f"{mem}G",
+            gpus=gpus,
+            config={"gpu_memory_mb": gpu_mem} if gpu_mem else {},
+        )
+        jobs.append({
+            "id": i,
+            "type": job_type,
+            "requirements": SchedulerService.job_requirements(job),
+            "duration": rng.randint(low, high),
+            "arrival": rng.randint(0, arrival_ticks),
+        })
+    jobs.sort(key=lambda job: (job["arrival"], job["id"]))
+    return jobs
+
+def node_free(node):
+    return SchedulerService.free_resources(
+        node["capacity"],
+        [job["requirements"] for job, _ in node["running"]]
+    )
+
+def allowed(node, job):
+    """The only filter the old poll_job applied"""
+    return node["gpu_enabled"] or not job["requirements"]["gpus"]
+
+def simulate(policy, nodes, jobs, window):
+    queue = []
+    pending_arrivals = list(jobs)
+    completed = failed = 0
+    waits = []
+    util = {"cpu": [], "memory": [], "gpus": []}
+    totals = {
+        "cpu": sum(n["capacity"]["cpu"] for n in nodes),
+        "memory": sum(n["capacity"]["memory"] for n in nodes),
+        "gpus": sum(n["capacity"]["gpus"] for n in nodes),
+    }
+    tick = 0
+    while pending_arrivals or queue or any(n["running"] for n in nodes):
+        while pending_arrivals and pending_arrivals[0]["arrival"] <= tick:
+            queue.append(pending_arrivals.pop(0))
+
+        # Finish jobs
+        for node in nodes:
+            still_running = []
+            for job, finish in node["running"]:
+                if finish <= tick:
+                    completed += 1
+                else:
+                    still_running.append((job, finish))
+            node["running"] = still_running
+
+        # Nodes poll in random order, one claim per free slot
+        order = list(nodes)
+        random.shuffle(order)
+        for node in order:
+            while len(node["running"]) < node["slots"] and queue:
+                free = node_free(node)
+                if policy == "fifo":
+                    job = next((j for j in queue if allowed(node, j)), None)
+                    if job is None:
+                        break
+                    queue.remove(job)
+                    if not SchedulerService.fits(job["requirements"], free):
+                        failed += 1
+                        continue
+                else:
+                    candidates = [(j, j["requirements"]) for j in queue[:window] if allowed(node, j)]
+                    chosen = SchedulerService.select_jobs(candidates, free, 1)
+                    if not chosen:
+                        break
+                    job = chosen[0]
+                    queue.remove(job)
+                waits.append(tick - job["arrival"])
+                node["running"].append((job, tick + job["duration"]))
+
+        used = {"cpu": 0.0, "memory": 0, "gpus": 0}
+        for node in nodes:
+            for job, _ in node["running"]:
+                for resource in used:
+                    used[resource] += job["requirements"][resource]
+        for resource in util:
+            if totals[resource]:
+                util[resource].append(used[resource] / totals[resource])
+
+        tick += 1
+        if tick > 100000:
+            break
+
+    def mean(values):
+        return sum(values) / len(values) if values else 0.0
+
+    return {
+        "completed": completed,
+        "failed": failed,
+        "stranded": len(queue),
+        "makespan": tick,
+        "avg_wait": mean(waits),
+        "cpu_util": mean(util["cpu"]),
+        "memory_util": mean(util["memory"]),
+        "gpu_util": mean(util["gpus"]),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=50)
+    parser.add_argument("--jobs", type=int, default=2000)
+    parser.add_argument("--arrival-ticks", type=int, default=200, help="Jobs arrive uniformly over this many ticks")
+    parser.add_argument("--window", type=int, default=20, help="Candidate window for best-fit")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.nodes} nodes, {args.jobs} jobs, window {args.window}, seed {args.seed}\n")
+    print(f"{'policy':<10} {'done':>6} {'failed':>7} {'stranded':>9} {'makespan':>9} "
+          f"{'avg wait':>9} {'cpu':>6} {'mem':>6} {'gpu':>6}")
+
+    for policy in ("fifo", "best-fit"):
+        rng = random.Random(args.seed)
+        random.seed(args.seed)
+        nodes = make_nodes(rng, args.nodes)
+        jobs = make_jobs(rng, args.jobs, args.arrival_ticks)
+        r = simulate(policy, nodes, jobs, args.window)
+        print(f"{policy:<10} {r['completed']:>6} {r['failed']:>7} {r['stranded']:>9} {r['makespan']:>9} "
+              f"{r['avg_wait']:>9.1f} {r['cpu_util']:>6.1%} {r['memory_util']:>6.1%} {r['gpu_util']:>6.1%}")
+
+if __name__ == "__main__":
+    main()
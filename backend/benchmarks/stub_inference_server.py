@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Stub model server for testing inference routing without a model.
+
+Speaks the protocol the coordinator's InferenceRouter expects (GET /health,
+POST /v1/completions streaming newline-delimited JSON) and answers every
+request with a fixed number of tokens, each after a configurable delay, so
+time-to-first-token and balancing can be observed. Requests beyond
+--max-concurrency get 503, like a real server at capacity.
+
+Optionally registers itself with a coordinator as the inference endpoint of
+an existing node. It can also be started in-process from a test:
+
+    server = StubInferenceServer(models=["bafy..."], token_delay=0.01)
+    server.start()   # server.url is then http://127.0.0.1:<port>
+    ...
+    server.stop()
+
+Needs only the standard library (requests for --register).
+
+Usage: python benchmarks/stub_inference_server.py --models CID[,CID...] [--port 9100]
+           [--tokens 32] [--token-delay 0.02] [--first-token-delay 0.1] [--max-concurrency 4]
+           [--register http://coordinator:8000 --node-id node-... --node-token TOKEN]
+
+The coordinator only accepts model servers on public addresses unless
+INFERENCE_ALLOW_PRIVATE_URLS is set. Once registered, the server requires
+the secret the coordinator issued, like a real node's.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubInferenceServer:
+    def __init__(self, models, host="127.0.0.1", port=0, tokens=32, token_delay=0.02,
+                 first_token_delay=0.1, max_concurrency=4):
+        self.models = list(models)
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.max_concurrency = max_concurrency
+        self.requests = 0
+        self.active = 0
+        self.secret = None  # Required on completions once set by register()
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive, so the coordinator's connection pool is exercised
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status, body):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, message):
+                data = (json.dumps(message) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path != "/health":
+                    return self._json(404, {"error": "not found"})
+                self._json(200, {"status": "ok", "models": server.models, "active": server.active})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+                if self.path != "/v1/completions":
+                    return self._json(404, {"error": "not found"})
+                if server.secret and self.headers.get("Authorization") != f"Bearer {server.secret}":
+                    return self._json(401, {"error": "unauthorized"})
+                if body.get("model") not in server.models:
+                    return self._json(404, {"error": f"model {body.get('model')} not served here"})
+
+                with server._lock:
+                    if server.active >= server.max_concurrency:
+                        busy = True
+                    else:
+                        busy = False
+                        server.active += 1
+                        server.requests += 1
+                if busy:
+                    return self._json(503, {"error": "at capacity"})
+
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/x-ndjson")
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+
+                    tokens = min(server.tokens, body.get("max_tokens") or server.tokens)
+                    time.sleep(server.first_token_delay)
+                    for index in range(tokens):
+                        if index:
+                            time.sleep(server.token_delay)
+                        self._chunk({"text": f"tok{index} "})
+                    self._chunk({"done": True})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The coordinator's client went away mid-stream
+                    self.close_connection = True
+                finally:
+                    with server._lock:
+                        server.active -= 1
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def register(self, coordinator, node_id, token, url=None):
+        """Announce this server as the inference endpoint of an existing node, with the node's token"""
+        import requests
+        response = requests.put(
+            f"{coordinator.rstrip('/')}/api/nodes/{node_id}/inference",
+            json={"url": url or self.url, "models": self.models, "max_concurrency": self.max_concurrency},
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=10
+        )
+        response.raise_for_status()
+        endpoints = response.json()
+        if endpoints:
+            self.secret = endpoints[0].get("secret")
+        return endpoints
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--models", required=True, help="Comma-separated model CIDs to serve")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--tokens", type=int, default=32, help="Tokens per completion")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between tokens")
+    parser.add_argument("--first-token-delay", type=float, default=0.1, help="Seconds before the first token")
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--register", metavar="COORDINATOR_URL", help="Register with this coordinator")
+    parser.add_argument("--node-id", help="Node to register the endpoint for (with --register)")
+    parser.add_argument("--node-token", help="Token the node was issued at registration (with --register)")
+    parser.add_argument("--public-url", help="URL the coordinator should use, if not --host/--port")
+    args = parser.parse_args()
+
+    server = StubInferenceServer(
+        models=args.models.split(","), host=args.host, port=args.port, tokens=args.tokens,
+        token_delay=args.token_delay, first_token_delay=args.first_token_delay,
+        max_concurrency=args.max_concurrency
+    ).start()
+    print(f"Stub inference server on {server.url} serving {', '.join(server.models)}")
+
+    if args.register:
+        if not args.node_id or not args.node_token:
+            parser.error("--register needs --node-id and --node-token")
+        server.register(args.register, args.node_id, args.node_token, args.public_url)
+        print(f"Registered with {args.register} as node {args.node_id}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
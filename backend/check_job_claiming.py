@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Concurrency check for job claiming.
+
+Runs many simulated node pollers against the database configured in
+DATABASE_URL (a local Postgres with migrations applied) and verifies that
+every job is claimed exactly once. The jobs are added to the Redis queues
+as the API would, so the queue path is checked when Redis is reachable and
+the database fallback otherwise.
+
+Usage: python check_job_claiming.py [--nodes 200] [--jobs 2000] [--max-jobs 1]
+"""
+import argparse
+import sys
+import os
+import time
+import uuid
+import threading
+from collections import Counter
+
+# Add backend to path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.config import settings
+from app.core.redis_client import redis_client
+from app.models import User  # noqa: F401 - registers all mappers
+from app.models.node import Node
+from app.models.job import Job, JobStatus, JobType
+from app.services.job_dispatch_service import JobDispatchService
+from app.services.job_queue import JobQueue
+
+SessionLocal = None
+
+def setup(run_id: str, node_count: int, job_count: int) -> list:
+    """Create test nodes and pending jobs, return node primary keys"""
+    db = SessionLocal()
+    try:
+        nodes = [
+            Node(
+                node_id=f"claimtest-{run_id}-{i}",
+                name=f"claimtest-{i}",
+                max_concurrent_jobs=job_count,
+                gpu_enabled=False,
+                is_active=True
+            )
+            for i in range(node_count)
+        ]
+        db.add_all(nodes)
+        jobs = [
+            Job(
+                job_id=f"claimtest-{run_id}-{i}",
+                type=JobType.TEST,
+                config={"claim_test": run_id},
+                status=JobStatus.PENDING
+            )
+            for i in range(job_count)
+        ]
+        db.add_all(jobs)
+        db.commit()
+        queued = sum(JobQueue.enqueue(job) for job in jobs)
+        if queued < job_count:
+            print(f"Redis unavailable, {job_count - queued} jobs are only claimable by database scan")
+        return [node.id for node in nodes]
+    finally:
+        db.close()
+
+def cleanup(run_id: str):
+    """Remove test rows and any of their queue entries left unclaimed"""
+    db = SessionLocal()
+    try:
+        job_ids = [
+            job_id for job_id, in
+            db.query(Job.job_id).filter(Job.job_id.like(f"claimtest-{run_id}-%")).all()
+        ]
+        if job_ids:
+            try:
+                pipe = redis_client.pipeline()
+                for queue in JobQueue.node_queues():
+                    key = JobQueue.key(queue)
+                    pipe.zrem(key, *job_ids)
+                    pipe.zrem(f"{key}:delayed", *job_ids)
+                pipe.execute()
+            except Exception as e:
+                print(f"Could not remove test jobs from the queues: {e}")
+        db.query(Job).filter(Job.job_id.like(f"claimtest-{run_id}-%")).delete(synchronize_session=False)
+        db.query(Node).filter(Node.node_id.like(f"claimtest-{run_id}-%")).delete(synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+def poller(node_pk: int, max_jobs: int, claims: list, errors: list, start: threading.Event):
+    """Claim jobs until none are left"""
+    db = SessionLocal()
+    try:
+        node = db.query(Node).filter(Node.id == node_pk).first()
+        start.wait()
+        while True:
+            jobs = JobDispatchService.claim_jobs(db, node, max_jobs)
+            if not jobs:
+                break
+            claims.extend((job.job_id, node_pk) for job in jobs)
+    except Exception as e:
+        errors.append(str(e))
+    finally:
+        db.close()
+
+def check_job_claiming(node_count: int, job_count: int, max_jobs: int) -> bool:
+    run_id = uuid.uuid4().hex[:8]
+    print(f"Creating {node_count} nodes and {job_count} jobs (run {run_id})...")
+    node_pks = setup(run_id, node_count, job_count)
+
+    claims = []
+    errors = []
+    start = threading.Event()
+    threads = [
+        threading.Thread(target=poller, args=(pk, max_jobs, claims, errors, start))
+        for pk in node_pks
+    ]
+    for thread in threads:
+        thread.start()
+
+    began = time.perf_counter()
+    start.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    ok = True
+    try:
+        counts = Counter(job_id for job_id, _ in claims)
+        duplicates = [job_id for job_id, n in counts.items() if n > 1]
+
+        db = SessionLocal()
+        try:
+            owners = dict(
+                db.query(Job.job_id, Job.node_id)
+                .filter(Job.job_id.like(f"claimtest-{run_id}-%"))
+                .all()
+            )
+        finally:
+            db.close()
+        mismatched = [job_id for job_id, node_pk in claims if owners.get(job_id) != node_pk]
+
+        print(f"Claimed {len(counts)}/{job_count} jobs in {elapsed:.2f}s "
+              f"({len(claims) / elapsed if elapsed else 0:.0f} claims/s)")
+
+        if errors:
+            ok = False
+            print(f"❌ {len(errors)} pollers raised errors, first: {errors[0]}")
+        if duplicates:
+            ok = False
+            print(f"❌ {len(duplicates)} jobs were claimed more than once")
+        if mismatched:
+            ok = False
+            print(f"❌ {len(mismatched)} claims disagree with the stored owner")
+        if len(counts) != job_count:
+            ok = False
+            print(f"❌ {job_count - len(counts)} jobs were never claimed")
+        if ok:
+            print("✅ Every job was claimed exactly once")
+    finally:
+        cleanup(run_id)
+
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=200, help="Number of concurrent pollers")
+    parser.add_argument("--jobs", type=int, default=2000, help="Number of pending jobs")
+    parser.add_argument("--max-jobs", type=int, default=1, help="Jobs claimed per poll")
+    args = parser.parse_args()
+
+    # Each poller holds its own connection
+    engine = create_engine(settings.DATABASE_URL, pool_size=args.nodes + 1, max_overflow=0)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    sys.exit(0 if check_job_claiming(args.nodes, args.jobs, args.max_jobs) else 1)
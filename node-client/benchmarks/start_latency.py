@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Job start latency: fresh containers vs the warm container pool.
+
+Runs a short command --jobs times in a fresh container per job (what the
+node does without a pool), then through a WarmContainerPool, and reports the
+start latency (request to running command) and end-to-end time per job.
+Needs a local Docker daemon; the image is pulled first so neither side pays
+for the pull.
+
+Usage: python benchmarks/start_latency.py [--image python:3.11] [--jobs 20]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+# Add node-client to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.config import config
+from src.docker_manager import DockerManager
+from src.warm_pool import WarmContainerPool
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def report(name, starts, totals):
+    print(f"{name:<6} start p50 {percentile(starts, 0.5) * 1000:7.0f} ms  p95 {percentile(starts, 0.95) * 1000:7.0f} ms"
+          f"   total p50 {percentile(totals, 0.5) * 1000:7.0f} ms  p95 {percentile(totals, 0.95) * 1000:7.0f} ms")
+
+def run_cold(docker, job_config, work_root, jobs):
+    starts, totals = [], []
+    for i in range(jobs):
+        work_dir = os.path.join(work_root, f"job_cold_{i}")
+        os.makedirs(work_dir)
+        requested = time.time()
+        container_id = docker.create_job_container(dict(job_config, environment={}), work_dir)
+        started = time.time()
+        docker.client.containers.get(container_id).wait()
+        finished = time.time()
+        docker.stop_container(container_id)
+        starts.append(started - requested)
+        totals.append(finished - requested)
+    return starts, totals
+
+def run_warm(pool, job_config, work_root, jobs):
+    starts, totals = [], []
+    for i in range(jobs):
+        warm = None
+        while warm is None:
+            warm = pool.acquire(job_config["image"])
+            if warm is None:
+                time.sleep(0.1)
+        work_dir = os.path.join(work_root, f"job_warm_{i}")
+        job_dir = pool.job_dir(warm, work_dir)
+        os.makedirs(job_dir)
+        requested = time.time()
+        exec_id, stream = pool.run(warm, job_config, job_dir)
+        started = time.time()
+        for _ in stream:
+            pass
+        finished = time.time()
+        pool.release(warm, pool.exit_code(exec_id) == 0)
+        starts.append(started - requested)
+        totals.append(finished - requested)
+    return starts, totals
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--image", default="python:3.11")
+    parser.add_argument("--jobs", type=int, default=20)
+    parser.add_argument("--pool-size", type=int, default=2)
+    args = parser.parse_args()
+
+    docker = DockerManager()
+    if not docker.is_available():
+        sys.exit("Docker is not available")
+    if not docker.has_image(args.image):
+        print(f"Pulling {args.image}...")
+        docker.pull_image(args.image)
+
+    job_config = {"job_id": "bench", "image": args.image, "command": ["python", "-c", "print('ok')"]}
+    with tempfile.TemporaryDirectory() as work_root:
+        print(f"{args.jobs} jobs of `python -c \"print('ok')\"` on {args.image}\n")
+        report("cold", *run_cold(docker, job_config, work_root, args.jobs))
+
+        config.WARM_POOL_SIZE = args.pool_size
+        config.WARM_POOL_IMAGES = args.image
+        inputs_dir = os.path.join(work_root, "inputs")
+        os.makedirs(inputs_dir)
+        pool = WarmContainerPool(docker, work_root, inputs_dir).start()
+        try:
+            report("warm", *run_warm(pool, job_config, work_root, args.jobs))
+        finally:
+            pool.stop()
+
+if __name__ == "__main__":
+    main()
@@ -19,17 +19,64 @@ class NodeConfig(BaseSettings):
     GPU_ENABLED: bool = True
     CPU_LIMIT: Optional[float] = None  # CPU cores limit
     
+    # Resource monitoring and heartbeats
+    RESOURCE_SAMPLE_INTERVAL: float = 5  # Seconds between CPU/memory/disk samples
+    RESOURCE_SAMPLE_HISTORY: int = 60  # Samples kept in the rolling history
+    GPU_SAMPLE_INTERVAL: float = 30  # Seconds between nvidia-smi queries
+    HEARTBEAT_DELTA_TOLERANCE: float = 0.05  # Relative change before a resource field is re-sent
+    HEARTBEAT_FULL_SYNC_EVERY: int = 20  # Send the full resource snapshot every N heartbeats
+    
+    # Job assignment
+    JOB_POLL_INTERVAL: int = 5  # Seconds between polls when long polling is unavailable
+    LONG_POLL_TIMEOUT: int = 20  # Seconds the coordinator may hold a job request open
+    STATUS_FLUSH_INTERVAL: float = 5  # Seconds between batched job status/progress reports
+    
     # Docker settings
     DOCKER_NETWORK: str = "bridge"
     JOB_TIMEOUT: int = 3600  # Job timeout in seconds
+    IMAGE_PREFETCH: bool = True  # Pull images the coordinator says queued jobs need
+    WARM_POOL_SIZE: int = 0  # Idle containers kept per pooled image (0 disables the pool)
+    WARM_POOL_IMAGES: str = "python:3.11"  # Comma-separated images to keep warm containers for
+    WARM_POOL_JOB_TYPES: str = "inference,test"  # Job types run in warm containers
+    WARM_POOL_MAX_USES: int = 50  # Jobs a warm container runs before it is replaced
+    
+    # Job logs and progress
+    LOG_CHUNK_BYTES: int = 256 * 1024  # Log output is shipped once this much is buffered...
+    LOG_FLUSH_INTERVAL: float = 2  # ...or after this many seconds
+    LOG_BUFFER_MAX_BYTES: int = 8 * 1024 * 1024  # Unshipped output kept while the coordinator is unreachable
+    PROGRESS_MARKER: str = "AIFORGE_PROGRESS"  # Jobs print "<marker> 0.42" or "<marker> 42%" to report progress
     
     # IPFS settings
     IPFS_HOST: str = "localhost"
     IPFS_PORT: int = 5001
     IPFS_GATEWAY: str = "http://localhost:8080"
+    DOWNLOAD_CONCURRENCY: int = 4  # Input downloads in flight at once, across all jobs
+    DOWNLOAD_CHUNK_SIZE: int = 1024 * 1024  # Read/write buffer for gateway transfers
+    DOWNLOAD_RETRIES: int = 5  # Resumed attempts after a dropped gateway transfer
+    DOWNLOAD_READ_TIMEOUT: int = 60  # Seconds without data before a transfer is retried
+    UPLOAD_CONCURRENCY: int = 4  # Output files added to IPFS at once
+    OUTPUT_PACKAGING: str = "directory"  # "directory" (one IPFS directory) or "tar" (one streamed archive)
+    OUTPUT_COMPRESSION: str = "none"  # "zstd" compresses tar packages (needs the zstandard package)
+    OUTPUT_ZSTD_LEVEL: int = 3
     
     # Job storage
     JOB_WORK_DIR: str = "./jobs"
+    INPUT_CACHE_DIR: Optional[str] = None  # Defaults to <JOB_WORK_DIR>/.cache
+    INPUT_CACHE_MAX_GB: float = 50  # Disk budget for cached inputs (LRU eviction)
+    INPUT_CACHE_REPORT_LIMIT: int = 1000  # Most recently used cached inputs reported to the coordinator
+    
+    # Model serving (needs torch and transformers)
+    SERVE_ENABLED: bool = False  # Run a model server for interactive inference alongside jobs
+    SERVE_MODELS: str = ""  # Comma-separated model CIDs to serve (Hugging Face model directories)
+    SERVE_HOST: str = "0.0.0.0"
+    SERVE_PORT: int = 8100
+    SERVE_PUBLIC_URL: Optional[str] = None  # URL the coordinator uses to reach the server (default http://<fqdn>:<port>)
+    SERVE_PRELOAD: bool = True  # Load SERVE_MODELS at startup rather than on the first request
+    SERVE_MEMORY_GB: float = 8  # Memory budget for loaded models (LRU unloading)
+    SERVE_MAX_CONCURRENCY: int = 8  # Requests in flight at once, across models
+    SERVE_MAX_BATCH_SIZE: int = 8  # Requests decoded together
+    SERVE_BATCH_WAIT_MS: int = 10  # How long a batch waits for more requests before it starts
+    SERVE_MAX_TOKENS: int = 512  # Longest completion, whatever the request asks for
     
     class Config:
         env_file = ".env"
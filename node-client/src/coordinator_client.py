@@ -1,8 +1,14 @@
 import requests
+from requests.adapters import HTTPAdapter
 import time
-from typing import Optional, Dict, Any
+import threading
+import copy
+from typing import Optional, Dict, Any, List, Tuple, Callable
 from src.config import config
-from src.resource_monitor import ResourceMonitor
+from src.resource_monitor import ResourceMonitor, resource_delta, merge_resources
+
+# Statuses sent to the coordinator without waiting for the next batch
+FINAL_STATUSES = ("completed", "failed", "cancelled")
 
 class CoordinatorClient:
     def __init__(self):
@@ -10,6 +16,26 @@ class CoordinatorClient:
         self.token = config.NODE_TOKEN
         self.node_id: Optional[str] = None
         self.session = requests.Session()
+        # Job threads, the heartbeat thread and the poll loop share this session
+        adapter = HTTPAdapter(pool_maxsize=config.MAX_CONCURRENT_JOBS + 4)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.long_poll_supported = True
+        self.bulk_status_supported = True
+        # Job status updates waiting to be sent, merged per job
+        self._pending_status: Dict[str, Dict[str, Any]] = {}
+        # Completions that could not be sent, retried with the status updates
+        self._pending_completions: Dict[str, Dict[str, Any]] = {}
+        self._status_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Coordinator's view of our resources, for delta heartbeats
+        self._reported_resources: Optional[Dict[str, Any]] = None
+        self._heartbeats_since_sync = 0
+        # Images the coordinator suggests pulling, from the last heartbeat
+        self.prefetch_images: List[str] = []
+        # Called with the ID of a job the coordinator no longer wants run
+        # here (cancelled, failed or reassigned there)
+        self.on_job_stopped: Optional[Callable[[str], Any]] = None
         if self.token:
             self.session.headers.update({"Authorization": f"Bearer {self.token}"})
     
@@ -24,6 +50,10 @@ class CoordinatorClient:
             if response.status_code == 201:
                 data = response.json()
                 self.node_id = data.get("node_id")
+                # Registration already carried the full resource snapshot
+                if node_info.get("resources"):
+                    self._reported_resources = copy.deepcopy(node_info["resources"])
+                    self._heartbeats_since_sync = 0
                 self.token = data.get("token") or self.token
                 if self.token:
                     self.session.headers.update({"Authorization": f"Bearer {self.token}"})
@@ -35,48 +65,143 @@ class CoordinatorClient:
             print(f"Error registering node: {e}")
             return False
     
-    def heartbeat(self) -> bool:
-        """Send heartbeat to coordinator"""
+    def heartbeat(self, resource_info: Optional[Dict[str, Any]] = None,
+                  running_jobs: Optional[List[str]] = None) -> bool:
+        """
+        Send heartbeat to coordinator.
+        
+        Only resource fields that changed since the coordinator's last known
+        view are sent ("resources_delta"). The full snapshot is sent on the
+        first heartbeat, every HEARTBEAT_FULL_SYNC_EVERY heartbeats, after a
+        failed heartbeat, or when the coordinator asks for a resync.
+        
+        `running_jobs` are checked against the coordinator; those it has
+        stopped are passed to `on_job_stopped`.
+        """
         if not self.node_id:
             return False
         
         try:
-            resource_info = ResourceMonitor.get_resource_info()
+            if resource_info is None:
+                resource_info = ResourceMonitor.get_resource_info()
+            
+            payload = {"status": "active", "timestamp": time.time(), "gpu_enabled": config.GPU_ENABLED}
+            full_sync = (
+                self._reported_resources is None
+                or self._heartbeats_since_sync >= config.HEARTBEAT_FULL_SYNC_EVERY
+            )
+            if full_sync:
+                payload["resources"] = resource_info
+            else:
+                delta = resource_delta(self._reported_resources, resource_info, config.HEARTBEAT_DELTA_TOLERANCE)
+                if delta:
+                    payload["resources_delta"] = delta
+            if running_jobs:
+                payload["running_jobs"] = running_jobs
+            
             response = self.session.post(
                 f"{self.base_url}/api/nodes/{self.node_id}/heartbeat",
-                json={
-                    "status": "active",
-                    "resources": resource_info,
-                    "timestamp": time.time()
-                },
+                json=payload,
                 timeout=5
             )
-            return response.status_code == 200
+            if response.status_code != 200:
+                self._reported_resources = None
+                return False
+            
+            if full_sync:
+                self._reported_resources = copy.deepcopy(resource_info)
+                self._heartbeats_since_sync = 0
+            else:
+                if "resources_delta" in payload:
+                    self._reported_resources = merge_resources(self._reported_resources, payload["resources_delta"])
+                self._heartbeats_since_sync += 1
+            
+            data = response.json()
+            if data.get("resync"):
+                self._reported_resources = None
+            self.prefetch_images = data.get("prefetch_images") or []
+            self._jobs_stopped(data.get("cancel_jobs") or [])
+            return True
         except Exception as e:
             print(f"Error sending heartbeat: {e}")
+            self._reported_resources = None
             return False
     
-    def poll_job(self) -> Optional[Dict[str, Any]]:
-        """Poll coordinator for available jobs"""
+    def poll_jobs(self, max_jobs: int = 1) -> List[Dict[str, Any]]:
+        """Poll coordinator for available jobs, claiming up to `max_jobs` (e.g. the node's free slots)"""
         if not self.node_id:
-            return None
+            return []
         
         try:
             response = self.session.get(
                 f"{self.base_url}/api/nodes/{self.node_id}/jobs/poll",
+                params={"max_jobs": max_jobs},
                 timeout=10
             )
             if response.status_code == 200:
-                data = response.json()
-                if data.get("job"):
-                    return data["job"]
-            return None
+                return self._jobs_from_response(response.json())
+            return []
         except Exception as e:
             print(f"Error polling for jobs: {e}")
-            return None
+            return []
+    
+    def poll_job(self) -> Optional[Dict[str, Any]]:
+        """Poll coordinator for a single available job"""
+        jobs = self.poll_jobs(1)
+        return jobs[0] if jobs else None
+    
+    def wait_for_jobs(self, timeout: int, max_jobs: int = 1) -> List[Dict[str, Any]]:
+        """
+        Long-poll the coordinator: blocks until jobs are assigned (up to
+        `max_jobs`) or `timeout` seconds pass. Falls back to regular polling
+        against coordinators that do not support long polling.
+        """
+        if not self.node_id:
+            return []
+        if not self.long_poll_supported:
+            return self.poll_jobs(max_jobs)
+        
+        try:
+            response = self.session.get(
+                f"{self.base_url}/api/nodes/{self.node_id}/jobs",
+                params={"wait": timeout, "max_jobs": max_jobs},
+                timeout=timeout + 10
+            )
+            if response.status_code in (404, 405) and "Node not found" not in response.text:
+                print("Coordinator does not support long polling, falling back to polling")
+                self.long_poll_supported = False
+                return self.poll_jobs(max_jobs)
+            if response.status_code == 200:
+                return self._jobs_from_response(response.json())
+            return []
+        except Exception as e:
+            print(f"Error waiting for jobs: {e}")
+            return []
+    
+    def wait_for_job(self, timeout: int) -> Optional[Dict[str, Any]]:
+        """Long-poll the coordinator for a single job"""
+        jobs = self.wait_for_jobs(timeout, 1)
+        return jobs[0] if jobs else None
+    
+    @staticmethod
+    def _jobs_from_response(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Jobs in a poll response (older coordinators only return "job")"""
+        if data.get("jobs"):
+            return data["jobs"]
+        return [data["job"]] if data.get("job") else []
+    
+    def _jobs_stopped(self, job_ids: List[str]):
+        if not self.on_job_stopped:
+            return
+        for job_id in job_ids:
+            try:
+                self.on_job_stopped(job_id)
+            except Exception as e:
+                print(f"Error stopping job {job_id}: {e}")
     
     def update_job_status(self, job_id: str, status: str, progress: Optional[float] = None, 
-                         result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+                         result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                         timings: Optional[Dict[str, float]] = None):
         """Update job status on coordinator"""
         if not self.node_id:
             return False
@@ -86,36 +211,229 @@ class CoordinatorClient:
                 "status": status,
                 "progress": progress,
                 "result": result,
-                "error": error
+                "error": error,
+                "timings": timings
             }
             response = self.session.put(
                 f"{self.base_url}/api/nodes/{self.node_id}/jobs/{job_id}/status",
                 json=payload,
                 timeout=10
             )
-            return response.status_code == 200
+            if response.status_code == 403:
+                # Reassigned to another node
+                self._jobs_stopped([job_id])
+            if response.status_code != 200:
+                return False
+            # Ignored: the job already finished on the coordinator
+            if response.json().get("status") == "ignored":
+                self._jobs_stopped([job_id])
+            return True
         except Exception as e:
             print(f"Error updating job status: {e}")
             return False
     
-    def complete_job(self, job_id: str, result: Dict[str, Any], output_cid: Optional[str] = None):
-        """Mark job as complete"""
+    def report_job_status(self, job_id: str, status: str, progress: Optional[float] = None,
+                          result: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+                          timings: Optional[Dict[str, float]] = None) -> bool:
+        """
+        Queue a job status update. Updates are merged per job and sent in
+        batches every STATUS_FLUSH_INTERVAL seconds; failures and other
+        final states are sent at once. Returns False only if an immediate
+        send failed (the update stays queued). `timings` are the job's
+        lifecycle timestamps (see JobExecutor).
+        """
+        update = {"status": status, "progress": progress, "result": result, "error": error, "timings": timings}
+        with self._status_lock:
+            pending = self._pending_status.setdefault(job_id, {"job_id": job_id})
+            for key, value in update.items():
+                if value is not None:
+                    pending[key] = value
+        if status in FINAL_STATUSES:
+            return self.flush_job_statuses()
+        return True
+    
+    def flush_job_statuses(self) -> bool:
+        """Send all queued completions and status updates. Returns False if some could not be sent."""
+        with self._flush_lock:
+            with self._status_lock:
+                completions = list(self._pending_completions.items())
+            completed = True
+            for job_id, payload in completions:
+                completed = self._send_completion(job_id, payload) and completed
+            
+            with self._status_lock:
+                updates = list(self._pending_status.values())
+                self._pending_status = {}
+            if not updates:
+                return completed
+            
+            if self._send_job_statuses(updates):
+                return completed
+            
+            # Put them back under any newer updates
+            with self._status_lock:
+                for update in updates:
+                    newer = self._pending_status.get(update["job_id"])
+                    if newer:
+                        update.update({key: value for key, value in newer.items() if value is not None})
+                    self._pending_status[update["job_id"]] = update
+            return False
+    
+    def _send_job_statuses(self, updates: List[Dict[str, Any]]) -> bool:
         if not self.node_id:
             return False
         
+        if self.bulk_status_supported:
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/nodes/{self.node_id}/jobs/status",
+                    json={"updates": updates},
+                    timeout=10
+                )
+                if response.status_code == 200:
+                    results = response.json().get("results") or {}
+                    # Finished or reassigned on the coordinator
+                    self._jobs_stopped([
+                        job_id for job_id, outcome in results.items() if outcome in ("ignored", "forbidden", "not_found")
+                    ])
+                    return True
+                if response.status_code in (404, 405) and "Node not found" not in response.text:
+                    print("Coordinator does not support batched status updates, sending them one by one")
+                    self.bulk_status_supported = False
+                else:
+                    print(f"Status update failed: {response.status_code} - {response.text[:200]}")
+                    return False
+            except Exception as e:
+                print(f"Error sending status updates: {e}")
+                return False
+        
+        sent = True
+        for update in updates:
+            sent = self.update_job_status(
+                update["job_id"], update.get("status"), update.get("progress"),
+                update.get("result"), update.get("error"), update.get("timings")
+            ) and sent
+        return sent
+    
+    def status_flush_loop(self, stopped: threading.Event):
+        """Send queued status updates periodically until `stopped` is set (runs on its own thread)"""
+        while not stopped.wait(config.STATUS_FLUSH_INTERVAL):
+            self.flush_job_statuses()
+        self.flush_job_statuses()
+    
+    def upload_log_chunk(self, job_id: str, seq: int, data: bytes) -> Optional[Tuple[bool, int]]:
+        """
+        Send log chunk `seq` of a job. Returns whether the coordinator has
+        the chunk and the sequence number it expects next, or None if the
+        upload failed.
+        """
+        if not self.node_id:
+            return None
+        
         try:
-            payload = {
-                "status": "completed",
-                "result": result,
-                "output_cid": output_cid
-            }
             response = self.session.post(
-                f"{self.base_url}/api/nodes/{self.node_id}/jobs/{job_id}/complete",
-                json=payload,
+                f"{self.base_url}/api/nodes/{self.node_id}/jobs/{job_id}/logs",
+                params={"seq": seq},
+                data=data,
+                headers={"Content-Type": "application/octet-stream"},
                 timeout=30
             )
+            if response.status_code == 200:
+                next_seq = response.json().get("next_seq")
+                return True, next_seq if next_seq is not None else seq + 1
+            if response.status_code == 409:
+                # Out of step with the coordinator, which did not store the
+                # chunk and says which one it expects instead
+                next_seq = (response.json().get("detail") or {}).get("next_seq")
+                if next_seq is not None:
+                    return False, next_seq
+            print(f"Log upload failed: {response.status_code} - {response.text[:200]}")
+            return None
+        except Exception as e:
+            print(f"Error uploading logs: {e}")
+            return None
+    
+    def complete_job(self, job_id: str, result: Dict[str, Any], output_cid: Optional[str] = None,
+                     output_manifest: Optional[Dict[str, Any]] = None,
+                     timings: Optional[Dict[str, float]] = None):
+        """
+        Mark job as complete. If the coordinator cannot be reached, the
+        completion is kept and retried with the next status flush.
+        """
+        payload = {
+            "status": "completed",
+            "result": result,
+            "output_cid": output_cid,
+            "output_manifest": output_manifest,
+            "timings": timings
+        }
+        return self._send_completion(job_id, payload)
+    
+    def _send_completion(self, job_id: str, payload: Dict[str, Any]) -> bool:
+        sent = False
+        retry = True
+        if self.node_id:
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/nodes/{self.node_id}/jobs/{job_id}/complete",
+                    json=payload,
+                    timeout=30
+                )
+                sent = 200 <= response.status_code < 300
+                # Rejected for good (job gone, reassigned or invalid): retrying will not help
+                retry = not sent and not (400 <= response.status_code < 500 and response.status_code not in (408, 429))
+                if not sent:
+                    print(f"Completing job {job_id} failed: {response.status_code} - {response.text[:200]}")
+            except Exception as e:
+                print(f"Error completing job: {e}")
+        
+        with self._status_lock:
+            if retry:
+                self._pending_completions[job_id] = payload
+            else:
+                self._pending_completions.pop(job_id, None)
+                # Completion supersedes any progress still queued for the job
+                self._pending_status.pop(job_id, None)
+        return sent
+    
+    def register_inference(self, url: str, models: List[str], max_concurrency: int) -> Optional[str]:
+        """
+        Announce this node's model server so the coordinator routes chat
+        requests to it. Returns the secret the server must require, or None
+        if registration failed.
+        """
+        if not self.node_id:
+            return None
+        
+        try:
+            response = self.session.put(
+                f"{self.base_url}/api/nodes/{self.node_id}/inference",
+                json={"url": url, "models": models, "max_concurrency": max_concurrency},
+                timeout=10
+            )
+            if response.status_code == 200:
+                endpoints = response.json()
+                if endpoints and endpoints[0].get("secret"):
+                    return endpoints[0]["secret"]
+                print("Inference registration returned no secret")
+                return None
+            print(f"Inference registration failed: {response.status_code} - {response.text[:200]}")
+            return None
+        except Exception as e:
+            print(f"Error registering model server: {e}")
+            return None
+    
+    def unregister_inference(self) -> bool:
+        """Stop the coordinator routing chat requests to this node"""
+        if not self.node_id:
+            return False
+        
+        try:
+            response = self.session.delete(
+                f"{self.base_url}/api/nodes/{self.node_id}/inference",
+                timeout=5
+            )
             return response.status_code == 200
         except Exception as e:
-            print(f"Error completing job: {e}")
+            print(f"Error unregistering model server: {e}")
             return False
-
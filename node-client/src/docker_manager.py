@@ -1,7 +1,8 @@
 import docker
+from docker.utils import parse_repository_tag
 import os
 import tempfile
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple, Iterator
 from src.config import config
 
 class DockerManager:
@@ -16,8 +17,39 @@ class DockerManager:
         """Check if Docker is available"""
         return self.client is not None
     
-    def create_job_container(self, job_config: Dict[str, Any], work_dir: str) -> Optional[str]:
-        """Create and start a Docker container for a job"""
+    def has_image(self, image: str) -> bool:
+        """Check whether an image is present locally"""
+        if not self.client:
+            return False
+        
+        try:
+            self.client.images.get(image)
+            return True
+        except docker.errors.ImageNotFound:
+            return False
+        except Exception as e:
+            print(f"Failed to inspect image {image}: {e}")
+            return False
+    
+    def pull_image(self, image: str) -> bool:
+        """Pull an image (only the given tag, "latest" if none)"""
+        if not self.client:
+            return False
+        
+        try:
+            repository, tag = parse_repository_tag(image)
+            self.client.images.pull(repository, tag=tag or "latest")
+            return True
+        except Exception as e:
+            print(f"Failed to pull image {image}: {e}")
+            return False
+    
+    def create_job_container(self, job_config: Dict[str, Any], work_dir: str,
+                             read_only_mounts: Optional[List[Tuple[str, str]]] = None) -> Optional[str]:
+        """
+        Create and start a Docker container for a job.
+        `read_only_mounts` are (host path, path inside /workspace) pairs.
+        """
         if not self.client:
             return None
         
@@ -26,17 +58,20 @@ class DockerManager:
             env_vars = job_config.get("environment", {})
             env_vars.update({
                 "JOB_ID": job_config.get("job_id"),
-                "WORK_DIR": work_dir
+                "WORK_DIR": work_dir,
+                "PROGRESS_MARKER": config.PROGRESS_MARKER
             })
             
+            volumes = [f"{os.path.abspath(work_dir)}:/workspace:rw"]
+            for host_path, container_path in read_only_mounts or []:
+                volumes.append(f"{host_path}:/workspace/{container_path.lstrip('/')}:ro")
+            
             # Create container
             container = self.client.containers.run(
                 image=job_config.get("image", "python:3.11"),
                 command=job_config.get("command", ["python", "-c", "print('Hello from container')"]),
                 environment=env_vars,
-                volumes={
-                    work_dir: {"bind": "/workspace", "mode": "rw"}
-                },
+                volumes=volumes,
                 network=config.DOCKER_NETWORK,
                 detach=True,
                 remove=False,
@@ -62,6 +97,17 @@ class DockerManager:
             print(f"Failed to get logs: {e}")
             return ""
     
+    def stream_container_logs(self, container_id: str) -> Iterator[bytes]:
+        """
+        Follow a container's combined stdout/stderr as it is produced.
+        The iterator ends when the container exits.
+        """
+        if not self.client:
+            return iter(())
+        
+        container = self.client.containers.get(container_id)
+        return container.logs(stream=True, follow=True, stdout=True, stderr=True)
+    
     def stop_container(self, container_id: str):
         """Stop and remove a container"""
         if not self.client:
@@ -0,0 +1,57 @@
+import time
+import queue
+import threading
+from typing import List, Dict
+from src.docker_manager import DockerManager
+
+# Don't retry a failed pull for this long
+RETRY_AFTER = 600  # seconds
+
+class ImagePrefetcher:
+    """
+    Pulls images the coordinator expects this node to need (from the jobs
+    waiting in its queues) in the background, one at a time, so a job does
+    not pay for the pull when it starts.
+    """
+
+    def __init__(self, docker: DockerManager):
+        self.docker = docker
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = set()
+        self._failed: Dict[str, float] = {}  # image -> time of last failed pull
+        self._thread = threading.Thread(target=self._run, name="image-prefetch", daemon=True)
+
+    def start(self) -> "ImagePrefetcher":
+        if self.docker.is_available():
+            self._thread.start()
+        return self
+
+    def prefetch(self, images: List[str]):
+        """Queue pulls for images not present locally"""
+        if not self._thread.is_alive():
+            return
+        now = time.time()
+        for image in images:
+            with self._lock:
+                if image in self._pending or now - self._failed.get(image, 0) < RETRY_AFTER:
+                    continue
+                self._pending.add(image)
+            self._queue.put(image)
+
+    def _run(self):
+        while True:
+            image = self._queue.get()
+            try:
+                if self.docker.has_image(image):
+                    continue
+                print(f"Prefetching image {image}")
+                started = time.time()
+                if self.docker.pull_image(image):
+                    print(f"Prefetched image {image} in {time.time() - started:.1f}s")
+                else:
+                    with self._lock:
+                        self._failed[image] = time.time()
+            finally:
+                with self._lock:
+                    self._pending.discard(image)
@@ -0,0 +1,243 @@
+import os
+import json
+import time
+import hashlib
+import shutil
+import threading
+from typing import Dict, Any, List, Optional
+from src.ipfs_client import IPFSClient
+
+INDEX_FILE = "index.json"
+# Partial downloads older than this are not worth resuming
+PARTIAL_MAX_AGE = 24 * 3600
+
+def cid_digest(cid: str) -> str:
+    """
+    Short digest of a CID used to report cache contents to the coordinator
+    (must match SchedulerService.cid_digest on the backend)
+    """
+    return hashlib.sha256(cid.encode()).hexdigest()[:12]
+
+class InputCache:
+    """
+    Node-local cache of job inputs keyed by IPFS CID.
+
+    Content under a CID never changes, so a cached object can be shared by
+    every job that needs it. Objects are stored read-only and handed to jobs
+    as read-only bind mounts (Docker) or hardlinks (direct execution) rather
+    than copied. Objects in use by a running job are pinned; the rest are
+    evicted least-recently-used first when the cache exceeds its budget.
+    """
+
+    def __init__(self, ipfs: IPFSClient, cache_dir: str, max_bytes: int):
+        self.ipfs = ipfs
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.objects_dir = os.path.join(self.cache_dir, "objects")
+        self.tmp_dir = os.path.join(self.cache_dir, "tmp")
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}  # cid -> {"size", "last_used"}
+        self._pins: Dict[str, int] = {}
+        self._fetching: Dict[str, threading.Event] = {}
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        self._clean_tmp()
+        self._load_index()
+
+    def _clean_tmp(self):
+        """Remove leftovers of interrupted downloads, keeping resumable partial files"""
+        for name in os.listdir(self.tmp_dir):
+            path = os.path.join(self.tmp_dir, name)
+            if name.endswith(".part") and time.time() - os.path.getmtime(path) < PARTIAL_MAX_AGE:
+                continue
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                os.remove(path)
+
+    def path(self, cid: str) -> str:
+        return os.path.join(self.objects_dir, cid)
+
+    @staticmethod
+    def _size(path: str) -> int:
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                total += os.path.getsize(os.path.join(root, name))
+        return total
+
+    @staticmethod
+    def _make_read_only(path: str):
+        """Make cached files read-only so a job cannot modify a shared object"""
+        if os.path.isfile(path):
+            os.chmod(path, 0o444)
+            return
+        for root, _, files in os.walk(path):
+            for name in files:
+                os.chmod(os.path.join(root, name), 0o444)
+
+    def _load_index(self):
+        """Rebuild the index from disk, keeping recorded access times"""
+        recorded = {}
+        try:
+            with open(os.path.join(self.cache_dir, INDEX_FILE)) as f:
+                recorded = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+        for cid in os.listdir(self.objects_dir):
+            entry = recorded.get(cid) or {}
+            self._entries[cid] = {
+                "size": entry.get("size") or self._size(self.path(cid)),
+                "last_used": entry.get("last_used", 0),
+            }
+
+    def _save_index(self):
+        tmp_path = os.path.join(self.cache_dir, f"{INDEX_FILE}.tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, os.path.join(self.cache_dir, INDEX_FILE))
+
+    def _download(self, cid: str) -> bool:
+        """Fetch a CID into the cache and pin it. Returns False on failure."""
+        # Fixed per CID (only one download of a CID runs at a time), so a
+        # partial gateway transfer left by a failed attempt is resumed
+        tmp_path = os.path.join(self.tmp_dir, cid)
+        try:
+            if not self.ipfs.download_file(cid, tmp_path):
+                return False
+            self._make_read_only(tmp_path)
+            os.replace(tmp_path, self.path(cid))
+            size = self._size(self.path(cid))
+        finally:
+            if os.path.isdir(tmp_path):
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            elif os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._entries[cid] = {"size": size, "last_used": time.time()}
+            # Pinned for the caller before evicting, so it cannot evict itself
+            self._pins[cid] = self._pins.get(cid, 0) + 1
+            self._evict()
+            self._save_index()
+        return True
+
+    def acquire(self, cid: str) -> Optional[str]:
+        """
+        Return the cached path for a CID, downloading it on a miss, and pin
+        it until release(). Concurrent requests for the same CID share one
+        download. Returns None if the download fails.
+        """
+        while True:
+            with self._lock:
+                if cid in self._entries:
+                    self._entries[cid]["last_used"] = time.time()
+                    self._pins[cid] = self._pins.get(cid, 0) + 1
+                    self._save_index()
+                    return self.path(cid)
+                pending = self._fetching.get(cid)
+                if pending is None:
+                    pending = threading.Event()
+                    self._fetching[cid] = pending
+                    downloading = True
+                else:
+                    downloading = False
+
+            if not downloading:
+                pending.wait()
+                with self._lock:
+                    if cid not in self._entries:
+                        # The other download failed
+                        return None
+                continue
+
+            try:
+                return self.path(cid) if self._download(cid) else None
+            finally:
+                with self._lock:
+                    self._fetching.pop(cid, None)
+                pending.set()
+
+    def release(self, cid: str):
+        """Unpin a CID taken with acquire()"""
+        with self._lock:
+            count = self._pins.get(cid, 0) - 1
+            if count > 0:
+                self._pins[cid] = count
+            else:
+                self._pins.pop(cid, None)
+            self._evict()
+            self._save_index()
+
+    def _evict(self):
+        """Drop least-recently-used unpinned objects until within budget (lock held)"""
+        total = sum(entry["size"] for entry in self._entries.values())
+        if total <= self.max_bytes:
+            return
+        for cid in sorted(self._entries, key=lambda c: self._entries[c]["last_used"]):
+            if total <= self.max_bytes:
+                break
+            if self._pins.get(cid):
+                continue
+            path = self.path(cid)
+            if os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+            elif os.path.exists(path):
+                os.remove(path)
+            total -= self._entries.pop(cid)["size"]
+
+    def link_into(self, cid: str, dest_path: str):
+        """
+        Place an acquired object at `dest_path` using hardlinks, falling back
+        to a copy when the job directory is on another filesystem
+        """
+        source = self.path(cid)
+        os.makedirs(os.path.dirname(dest_path) or ".", exist_ok=True)
+
+        def link(src, dst):
+            try:
+                os.link(src, dst)
+            except OSError:
+                shutil.copy2(src, dst)
+
+        if os.path.isdir(source):
+            shutil.copytree(source, dest_path, copy_function=link, dirs_exist_ok=True)
+        else:
+            link(source, dest_path)
+
+    def inventory(self) -> List[Dict[str, Any]]:
+        """Cached CIDs with their sizes, most recently used first"""
+        with self._lock:
+            return [
+                {"cid": cid, "size": entry["size"]}
+                for cid, entry in sorted(
+                    self._entries.items(), key=lambda item: item[1]["last_used"], reverse=True
+                )
+            ]
+
+    def size(self, cid: str) -> int:
+        """Size in bytes of a cached CID (0 if not cached)"""
+        with self._lock:
+            entry = self._entries.get(cid)
+            return entry["size"] if entry else 0
+
+    def digests(self, limit: int) -> Dict[str, int]:
+        """
+        Compact inventory for heartbeats: CID digest -> size in bytes for
+        the `limit` most recently used objects
+        """
+        return {cid_digest(item["cid"]): item["size"] for item in self.inventory()[:limit]}
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache usage summary"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": sum(entry["size"] for entry in self._entries.values()),
+                "max_bytes": self.max_bytes,
+                "pinned": len(self._pins),
+            }
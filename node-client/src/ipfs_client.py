@@ -1,12 +1,54 @@
+import os
+import time
+import base64
+import hashlib
 import ipfshttpclient
 import requests
-from typing import Optional
+from typing import Optional, List, Dict, Any, BinaryIO
 from src.config import config
 
+# Multicodec / multihash codes needed to verify raw-leaf CIDs
+RAW_CODEC = 0x55
+SHA2_256 = 0x12
+
+def _read_varint(data: bytes, offset: int):
+    value = shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, offset
+        shift += 7
+
+def raw_sha256_digest(cid: str) -> Optional[bytes]:
+    """
+    Expected sha256 of the content for a CIDv1 raw-codec CID in base32
+    ("bafkrei..."), whose hash covers the file bytes directly. Other CIDs
+    (CIDv0 "Qm...", dag-pb) hash the UnixFS DAG rather than the bytes and
+    cannot be checked in a single pass; None is returned for them.
+    """
+    if not cid.startswith("b"):
+        return None
+    try:
+        encoded = cid[1:].upper()
+        data = base64.b32decode(encoded + "=" * (-len(encoded) % 8))
+        version, offset = _read_varint(data, 0)
+        codec, offset = _read_varint(data, offset)
+        hash_code, offset = _read_varint(data, offset)
+        length, offset = _read_varint(data, offset)
+    except (ValueError, IndexError):
+        return None
+    if version != 1 or codec != RAW_CODEC or hash_code != SHA2_256 or length != 32:
+        return None
+    return data[offset:offset + length]
+
 class IPFSClient:
     def __init__(self):
         self.client = None
         self.gateway = config.IPFS_GATEWAY
+        self.chunk_size = config.DOWNLOAD_CHUNK_SIZE
+        self.session = requests.Session()
         self._connect()
     
     def _connect(self):
@@ -18,32 +60,131 @@ class IPFSClient:
             print("Will use IPFS gateway for downloads")
             self.client = None
     
+    def _verify_file(self, cid: str, path: str) -> bool:
+        """Check a downloaded file against its CID where the CID allows it"""
+        expected = raw_sha256_digest(cid)
+        if expected is None or not os.path.isfile(path):
+            return True
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                digest.update(chunk)
+        return digest.digest() == expected
+    
     def download_file(self, cid: str, output_path: str) -> bool:
         """Download file from IPFS by CID"""
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        
         # Try direct IPFS node first
         if self.client:
             try:
-                self.client.get(cid, output_path)
+                # `get` writes <target>/<cid>; move it to the requested path
+                target = os.path.dirname(output_path) or '.'
+                self.client.get(cid, target=target)
+                fetched = os.path.join(target, cid)
+                if os.path.abspath(fetched) != os.path.abspath(output_path):
+                    os.replace(fetched, output_path)
+                if not self._verify_file(cid, output_path):
+                    os.remove(output_path)
+                    raise Exception("content does not match CID")
                 return True
             except Exception as e:
                 print(f"Direct IPFS download failed: {e}, trying gateway...")
         
         # Fallback to gateway
-        try:
-            gateway_url = f"{self.gateway}/ipfs/{cid}"
-            response = requests.get(gateway_url, stream=True, timeout=300)
-            response.raise_for_status()
-            
-            import os
-            os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        return self._download_from_gateway(cid, output_path)
+    
+    def _download_from_gateway(self, cid: str, output_path: str) -> bool:
+        """
+        Stream a CID from the gateway into `output_path`.
+        
+        Bytes go to `<output_path>.part` first. After a dropped connection the
+        transfer resumes from the end of the partial file with an HTTP Range
+        request (a later call for the same path resumes too). Raw-leaf CIDs
+        are hashed as the bytes arrive and rejected on mismatch.
+        """
+        gateway_url = f"{self.gateway}/ipfs/{cid}"
+        part_path = f"{output_path}.part"
+        expected = raw_sha256_digest(cid)
+        
+        for attempt in range(config.DOWNLOAD_RETRIES + 1):
+            if attempt:
+                time.sleep(min(2 ** attempt, 30))
             
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return True
-        except Exception as e:
-            print(f"Gateway download failed: {e}")
-            return False
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            headers = {"Range": f"bytes={offset}-"} if offset else {}
+            try:
+                with self.session.get(
+                    gateway_url,
+                    headers=headers,
+                    stream=True,
+                    timeout=(10, config.DOWNLOAD_READ_TIMEOUT)
+                ) as response:
+                    if response.status_code == 416:
+                        # Partial file already holds everything
+                        pass
+                    else:
+                        response.raise_for_status()
+                        if offset and response.status_code != 206:
+                            # Server ignored the range; start over
+                            offset = 0
+                        
+                        digest = hashlib.sha256() if expected else None
+                        if digest and offset:
+                            with open(part_path, 'rb') as f:
+                                for chunk in iter(lambda: f.read(self.chunk_size), b''):
+                                    digest.update(chunk)
+                        
+                        with open(part_path, 'ab' if offset else 'wb') as f:
+                            for chunk in response.iter_content(chunk_size=self.chunk_size):
+                                f.write(chunk)
+                                if digest:
+                                    digest.update(chunk)
+                        
+                        if digest and digest.digest() != expected:
+                            os.remove(part_path)
+                            print(f"Gateway download of {cid} does not match its CID")
+                            continue
+                
+                if response.status_code == 416 and not self._verify_file(cid, part_path):
+                    os.remove(part_path)
+                    continue
+                
+                os.replace(part_path, output_path)
+                return True
+            except (requests.exceptions.RequestException, OSError) as e:
+                print(f"Gateway download of {cid} interrupted ({e}), attempt {attempt + 1}")
+        
+        print(f"Gateway download failed: {cid}")
+        return False
+    
+    def is_available(self) -> bool:
+        """Uploads need the IPFS API; the gateway is read-only"""
+        return self.client is not None
+    
+    def add_path(self, path: str) -> List[Dict[str, Any]]:
+        """
+        Add a file or a directory tree. Returns the added entries ("Name",
+        "Hash"); for a directory the last entry is the directory itself.
+        Raises on failure.
+        """
+        result = self.client.add(path, recursive=os.path.isdir(path))
+        return result if isinstance(result, list) else [result]
+    
+    def add_stream(self, stream: BinaryIO) -> str:
+        """Add the contents of a file object as it is read. Returns the CID."""
+        result = self.client.add(stream)
+        return result['Hash'] if isinstance(result, dict) else result[-1]['Hash']
+    
+    def make_directory(self, links: Dict[str, str]) -> str:
+        """
+        Build a UnixFS directory from `links` (path inside the directory ->
+        CID) without re-uploading anything. Returns the directory's CID.
+        """
+        root = self.client.object.new("unixfs-dir")['Hash']
+        for name, cid in links.items():
+            root = self.client.object.patch.add_link(root, name, cid, create=True)['Hash']
+        return root
     
     def upload_file(self, file_path: str) -> Optional[str]:
         """Upload file to IPFS and return CID"""
@@ -59,4 +200,3 @@ class IPFSClient:
         except Exception as e:
             print(f"Failed to upload to IPFS: {e}")
             return None
-
@@ -2,11 +2,28 @@ import os
 import json
 import time
 import shutil
-from typing import Dict, Any, Optional
+import threading
+import subprocess
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
 from src.config import config
 from src.docker_manager import DockerManager
 from src.ipfs_client import IPFSClient
+from src.input_cache import InputCache
+from src.output_packager import OutputPackager
 from src.coordinator_client import CoordinatorClient
+from src.log_shipper import LogShipper
+from src.warm_pool import WarmContainerPool, WarmContainer, INPUTS_MOUNT
+
+# How often a running job checks for cancellation and its deadline
+WAIT_POLL_INTERVAL = 2  # seconds
+# How long to wait for buffered output after a container exits
+LOG_DRAIN_TIMEOUT = 10  # seconds
+
+class JobCancelled(Exception):
+    """Raised when a job is cancelled or exceeds its timeout"""
+    pass
 
 class JobExecutor:
     def __init__(self, coordinator_client: CoordinatorClient):
@@ -15,11 +32,34 @@ class JobExecutor:
         self.ipfs = IPFSClient()
         self.job_work_dir = config.JOB_WORK_DIR
         os.makedirs(self.job_work_dir, exist_ok=True)
+        self.input_cache = InputCache(
+            self.ipfs,
+            config.INPUT_CACHE_DIR or os.path.join(self.job_work_dir, ".cache"),
+            int(config.INPUT_CACHE_MAX_GB * 1024 ** 3)
+        )
+        # Shared by all jobs on this node, so concurrent jobs cannot
+        # open more than DOWNLOAD_CONCURRENCY transfers between them
+        self.download_pool = ThreadPoolExecutor(
+            max_workers=config.DOWNLOAD_CONCURRENCY,
+            thread_name_prefix="input-download"
+        )
+        self.outputs = OutputPackager(self.ipfs)
+        # Optional pool of started containers for short jobs
+        self.warm_pool = WarmContainerPool(self.docker, self.job_work_dir, self.input_cache).start()
     
-    def execute_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute a job"""
+    def execute_job(self, job: Dict[str, Any], cancel_event: Optional[threading.Event] = None) -> Dict[str, Any]:
+        """
+        Execute a job. Setting `cancel_event` stops it early.
+        
+        The job's lifecycle timestamps (received, inputs_ready,
+        container_started, finished, outputs_uploaded; Unix time) are sent
+        to the coordinator with its completion or failure.
+        """
         job_id = job.get("id")
+        timings = {"received": time.time()}
         job_type = job.get("type", "test")
+        timeout = (job.get("config") or {}).get("timeout") or config.JOB_TIMEOUT
+        deadline = time.time() + timeout
         
         print(f"Starting job {job_id} of type {job_type}")
         
@@ -27,21 +67,44 @@ class JobExecutor:
         work_dir = os.path.join(self.job_work_dir, f"job_{job_id}")
         os.makedirs(work_dir, exist_ok=True)
         
+        # Inputs pinned in the cache for the duration of the job
+        acquired = []
+        
         try:
             # Update status to running
-            self.coordinator.update_job_status(job_id, "running", progress=0.0)
+            self.coordinator.report_job_status(job_id, "running", progress=0.0)
             
-            # Download required files from IPFS
+            # Fetch input files through the node's CID cache
+            input_mounts = []
             if job.get("input_files"):
-                print("Downloading input files...")
-                for file_info in job["input_files"]:
-                    cid = file_info.get("cid")
-                    file_path = file_info.get("path")
-                    if cid and file_path:
-                        full_path = os.path.join(work_dir, file_path)
-                        if not self.ipfs.download_file(cid, full_path):
-                            raise Exception(f"Failed to download file {cid}")
-                self.coordinator.update_job_status(job_id, "running", progress=0.2)
+                print("Fetching input files...")
+                wanted = [
+                    (file_info.get("cid"), file_info.get("path"))
+                    for file_info in job["input_files"]
+                    if file_info.get("cid") and file_info.get("path")
+                ]
+                # Download distinct CIDs concurrently on the shared pool
+                futures = {
+                    cid: self.download_pool.submit(self.input_cache.acquire, cid)
+                    for cid in dict.fromkeys(cid for cid, _ in wanted)
+                }
+                cached_paths = {}
+                failed = []
+                for cid, future in futures.items():
+                    try:
+                        cached_path = future.result()
+                    except Exception as e:
+                        print(f"Failed to fetch input {cid}: {e}")
+                        cached_path = None
+                    if cached_path:
+                        acquired.append(cid)
+                        cached_paths[cid] = cached_path
+                    else:
+                        failed.append(cid)
+                if failed:
+                    raise Exception(f"Failed to download file {', '.join(failed)}")
+                input_mounts = [(cid, cached_paths[cid], file_path) for cid, file_path in wanted]
+            timings["inputs_ready"] = time.time()
             
             # Prepare job configuration
             job_config = {
@@ -54,55 +117,85 @@ class JobExecutor:
                 "gpus": job.get("gpus")
             }
             
-            # Execute in Docker container
-            if self.docker.is_available():
-                print("Executing job in Docker container...")
-                container_id = self.docker.create_job_container(job_config, work_dir)
-                
-                if not container_id:
-                    raise Exception("Failed to create Docker container")
+            # Job output is shipped to the coordinator while it runs; only a
+            # small tail is kept here for the error message
+            shipper = LogShipper(self.coordinator, job_id).start()
+            try:
+                warm = None
+                if self.warm_pool.eligible(job, job_config["image"]):
+                    warm = self.warm_pool.acquire(job_config["image"], WarmContainerPool.owner(job))
                 
-                # Wait for container to complete
-                self.coordinator.update_job_status(job_id, "running", progress=0.5)
-                
-                container = self.docker.client.containers.get(container_id)
-                exit_code = container.wait(timeout=config.JOB_TIMEOUT)
-                
-                # Get logs
-                logs = self.docker.get_container_logs(container_id)
-                
-                # Clean up
-                self.docker.stop_container(container_id)
-                
-                if exit_code != 0:
-                    raise Exception(f"Container exited with code {exit_code}: {logs}")
-                
-                result = {
-                    "exit_code": exit_code,
-                    "logs": logs,
-                    "output_dir": work_dir
-                }
-            else:
-                # Fallback: execute directly (not recommended for production)
-                print("Docker not available, executing directly...")
-                result = self._execute_directly(job_config, work_dir)
+                if warm:
+                    print("Executing job in a warm container...")
+                    result = self._execute_warm(
+                        warm, job_config, work_dir, input_mounts, deadline, cancel_event, shipper, timings
+                    )
+                # Execute in Docker container
+                elif self.docker.is_available():
+                    print("Executing job in Docker container...")
+                    # Inputs are mounted read-only straight from the cache
+                    start_requested = time.time()
+                    container_id = self.docker.create_job_container(
+                        job_config, work_dir,
+                        [(cached_path, file_path) for _, cached_path, file_path in input_mounts]
+                    )
+                    
+                    if not container_id:
+                        raise Exception("Failed to create Docker container")
+                    timings["container_started"] = time.time()
+                    start_latency = timings["container_started"] - start_requested
+                    
+                    try:
+                        output = self._ship_output(
+                            lambda: self.docker.stream_container_logs(container_id), shipper
+                        )
+                        exit_code = self._wait_for_container(container_id, deadline, cancel_event)
+                        # The log stream ends with the container; let it drain
+                        output.join(timeout=LOG_DRAIN_TIMEOUT)
+                    finally:
+                        # Clean up (also stops the container on timeout or cancellation)
+                        self.docker.stop_container(container_id)
+                    
+                    if exit_code != 0:
+                        raise Exception(f"Container exited with code {exit_code}: {shipper.tail()}")
+                    
+                    result = {
+                        "exit_code": exit_code,
+                        "output_dir": work_dir,
+                        "start_latency": start_latency,
+                        "warm_start": False
+                    }
+                else:
+                    # Fallback: execute directly (not recommended for production)
+                    print("Docker not available, executing directly...")
+                    for cid, _, file_path in input_mounts:
+                        self.input_cache.link_into(cid, os.path.join(work_dir, file_path))
+                    result = self._execute_directly(job_config, work_dir, deadline, cancel_event, shipper, timings)
+            finally:
+                timings["finished"] = time.time()
+                shipper.close()
+            result["log_bytes"] = shipper.total_bytes
+            if "start_latency" in result:
+                kind = "warm" if result.get("warm_start") else "cold"
+                print(f"Job {job_id} started in {result['start_latency']:.2f}s ({kind} container)")
             
-            # Upload output files to IPFS if any
+            # Upload all output files to IPFS as one package
             output_cid = None
+            output_manifest = None
             if job.get("output_files"):
-                print("Uploading output files...")
-                for output_file in job["output_files"]:
-                    file_path = os.path.join(work_dir, output_file)
-                    if os.path.exists(file_path):
-                        cid = self.ipfs.upload_file(file_path)
-                        if cid:
-                            output_cid = cid
-                            break
+                if self.ipfs.is_available():
+                    print("Uploading output files...")
+                    output_manifest = self.outputs.package(work_dir, job["output_files"])
+                    output_cid = output_manifest["cid"]
+                    if output_manifest["missing"]:
+                        print(f"Outputs not produced: {', '.join(output_manifest['missing'])}")
+                else:
+                    print("IPFS client not available, cannot upload outputs")
             
-            self.coordinator.update_job_status(job_id, "running", progress=0.9)
+            timings["outputs_uploaded"] = time.time()
             
             # Mark job as complete
-            self.coordinator.complete_job(job_id, result, output_cid)
+            self.coordinator.complete_job(job_id, result, output_cid, output_manifest, timings)
             
             print(f"Job {job_id} completed successfully")
             return result
@@ -110,38 +203,132 @@ class JobExecutor:
         except Exception as e:
             error_msg = str(e)
             print(f"Job {job_id} failed: {error_msg}")
-            self.coordinator.update_job_status(
+            self.coordinator.report_job_status(
                 job_id, 
                 "failed", 
-                error=error_msg
+                error=error_msg,
+                timings=timings
             )
             raise
         finally:
+            for cid in acquired:
+                self.input_cache.release(cid)
             # Cleanup work directory (optional, keep for debugging)
             # shutil.rmtree(work_dir, ignore_errors=True)
-            pass
     
-    def _execute_directly(self, job_config: Dict[str, Any], work_dir: str) -> Dict[str, Any]:
-        """Execute job directly without Docker (fallback)"""
-        import subprocess
+    @staticmethod
+    def _check_cancelled(timeout_at: float, cancel_event: Optional[threading.Event]):
+        if cancel_event and cancel_event.is_set():
+            raise JobCancelled("Job cancelled")
+        if time.time() >= timeout_at:
+            raise JobCancelled("Job timed out")
+    
+    def _wait_for_container(self, container_id: str, deadline: float,
+                            cancel_event: Optional[threading.Event]) -> int:
+        """Wait for a container to exit, checking for cancellation and the deadline"""
+        container = self.docker.client.containers.get(container_id)
+        while True:
+            self._check_cancelled(deadline, cancel_event)
+            wait_for = max(1, min(WAIT_POLL_INTERVAL, deadline - time.time()))
+            try:
+                result = container.wait(timeout=wait_for)
+            except requests.exceptions.RequestException:
+                # Still running
+                continue
+            return result.get("StatusCode", -1) if isinstance(result, dict) else result
+    
+    @staticmethod
+    def _ship_output(stream_factory, shipper: LogShipper) -> threading.Thread:
+        """Feed a job's output stream to the log shipper on a background thread"""
+        def pump():
+            try:
+                for data in stream_factory():
+                    shipper.write(data)
+            except Exception as e:
+                print(f"Log streaming stopped: {e}")
+        
+        thread = threading.Thread(target=pump, daemon=True)
+        thread.start()
+        return thread
+    
+    def _execute_warm(self, warm: WarmContainer, job_config: Dict[str, Any], work_dir: str,
+                      input_mounts: List[Tuple[str, str, str]], deadline: float,
+                      cancel_event: Optional[threading.Event], shipper: LogShipper,
+                      timings: Dict[str, float]) -> Dict[str, Any]:
+        """Run a job in a pooled container (see WarmContainerPool)"""
+        job_dir = self.warm_pool.job_dir(warm, work_dir)
+        os.rename(work_dir, job_dir)
+        reusable = False
+        try:
+            # Inputs are symlinks to this job's objects in the container's read-only /inputs
+            self.warm_pool.add_inputs(warm, [cid for cid, _, _ in input_mounts])
+            for cid, _, file_path in input_mounts:
+                link_path = os.path.join(job_dir, file_path)
+                os.makedirs(os.path.dirname(link_path), exist_ok=True)
+                if not os.path.lexists(link_path):
+                    os.symlink(f"{INPUTS_MOUNT}/{cid}", link_path)
+            
+            start_requested = time.time()
+            exec_id, stream = self.warm_pool.run(warm, job_config, job_dir)
+            timings["container_started"] = time.time()
+            start_latency = timings["container_started"] - start_requested
+            
+            output = self._ship_output(lambda: stream, shipper)
+            while output.is_alive():
+                self._check_cancelled(deadline, cancel_event)
+                output.join(timeout=WAIT_POLL_INTERVAL)
+            exit_code = self.warm_pool.exit_code(exec_id)
+            reusable = exit_code == 0
+        finally:
+            # Move the job directory back before the container can be discarded
+            os.rename(job_dir, work_dir)
+            # A cancelled or failed job's container is removed, which also
+            # stops anything it left running
+            self.warm_pool.release(warm, reusable)
+        
+        if exit_code != 0:
+            raise Exception(f"Container exited with code {exit_code}: {shipper.tail()}")
         
+        return {
+            "exit_code": exit_code,
+            "output_dir": work_dir,
+            "start_latency": start_latency,
+            "warm_start": True
+        }
+    
+    def _execute_directly(self, job_config: Dict[str, Any], work_dir: str, deadline: float,
+                          cancel_event: Optional[threading.Event], shipper: LogShipper,
+                          timings: Dict[str, float]) -> Dict[str, Any]:
+        """Execute job directly without Docker (fallback)"""
         command = job_config.get("command", [])
         env = os.environ.copy()
         env.update(job_config.get("environment", {}))
         env["WORK_DIR"] = work_dir
+        env["PROGRESS_MARKER"] = config.PROGRESS_MARKER
         
-        result = subprocess.run(
+        process = subprocess.Popen(
             command,
             cwd=work_dir,
             env=env,
-            capture_output=True,
-            text=True,
-            timeout=config.JOB_TIMEOUT
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT
         )
+        timings["container_started"] = time.time()
+        output = self._ship_output(lambda: iter(lambda: process.stdout.read1(65536), b""), shipper)
+        while True:
+            try:
+                self._check_cancelled(deadline, cancel_event)
+            except JobCancelled:
+                process.kill()
+                process.wait()
+                raise
+            try:
+                process.wait(timeout=WAIT_POLL_INTERVAL)
+                break
+            except subprocess.TimeoutExpired:
+                continue
+        output.join(timeout=LOG_DRAIN_TIMEOUT)
         
         return {
-            "exit_code": result.returncode,
-            "stdout": result.stdout,
-            "stderr": result.stderr
+            "exit_code": process.returncode
         }
-
@@ -0,0 +1,143 @@
+import re
+import time
+import threading
+from typing import Optional
+from src.config import config
+from src.coordinator_client import CoordinatorClient
+
+# Longest partial line kept while looking for progress markers
+MAX_LINE_BYTES = 4096
+# Local tail kept for error messages
+TAIL_BYTES = 4096
+
+class LogShipper:
+    """
+    Ships a job's output to the coordinator while it runs.
+
+    Output is buffered and sent as numbered chunks every LOG_FLUSH_INTERVAL
+    seconds or LOG_CHUNK_BYTES, whichever comes first, so memory use stays
+    bounded however much a job prints. Lines of the form
+    "<PROGRESS_MARKER> 0.42" (or "42%") update the job's progress.
+    """
+
+    def __init__(self, coordinator: CoordinatorClient, job_id: str):
+        self.coordinator = coordinator
+        self.job_id = job_id
+        self.total_bytes = 0
+        self.dropped_bytes = 0
+        self._seq = 0
+        self._buffer = bytearray()
+        self._buffer_offset = 0  # Position of the buffer's first byte in the whole output
+        self._line = bytearray()
+        self._tail = bytearray()
+        self._progress: Optional[float] = None
+        self._reported_progress: Optional[float] = None
+        self._marker = re.compile(
+            rb"^\s*" + re.escape(config.PROGRESS_MARKER.encode()) + rb"[\s:=]+([0-9]*\.?[0-9]+)\s*(%?)"
+        )
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"logs-{job_id}", daemon=True)
+
+    def start(self) -> "LogShipper":
+        self._thread.start()
+        return self
+
+    def write(self, data: bytes):
+        """Add job output"""
+        if not data:
+            return
+        with self._lock:
+            self.total_bytes += len(data)
+            self._buffer += data
+            if len(self._buffer) > config.LOG_BUFFER_MAX_BYTES:
+                # Coordinator unreachable for a while: keep the newest output
+                excess = len(self._buffer) - config.LOG_BUFFER_MAX_BYTES
+                del self._buffer[:excess]
+                self._buffer_offset += excess
+                self.dropped_bytes += excess
+            self._tail += data
+            del self._tail[:-TAIL_BYTES]
+            self._scan_progress(data)
+            full = len(self._buffer) >= config.LOG_CHUNK_BYTES
+        if full:
+            self.flush()
+
+    def _scan_progress(self, data: bytes):
+        """Look for progress markers in complete lines (lock held)"""
+        self._line += data
+        lines = self._line.split(b"\n")
+        self._line = bytearray(lines.pop()[-MAX_LINE_BYTES:])
+        for line in lines:
+            match = self._marker.match(line)
+            if not match:
+                continue
+            value = float(match.group(1))
+            if match.group(2):
+                value /= 100
+            self._progress = min(max(value, 0.0), 1.0)
+
+    def tail(self) -> str:
+        """Last few KB of output, for error messages"""
+        with self._lock:
+            return self._tail.decode("utf-8", errors="replace")
+
+    def _take_chunk(self) -> bytes:
+        """Up to LOG_CHUNK_BYTES of buffered output, cut at a line end when possible (lock held)"""
+        if len(self._buffer) <= config.LOG_CHUNK_BYTES:
+            return bytes(self._buffer)
+        end = self._buffer.rfind(b"\n", 0, config.LOG_CHUNK_BYTES)
+        end = end + 1 if end >= 0 else config.LOG_CHUNK_BYTES
+        return bytes(self._buffer[:end])
+
+    def flush(self) -> bool:
+        """Send buffered output and progress. Returns False if something could not be sent."""
+        with self._send_lock:
+            while True:
+                with self._lock:
+                    chunk = self._take_chunk()
+                    chunk_end = self._buffer_offset + len(chunk)
+                if not chunk:
+                    break
+                result = self.coordinator.upload_log_chunk(self.job_id, self._seq, chunk)
+                if result is None:
+                    # Keep the output and try again on the next flush
+                    return False
+                stored, next_seq = result
+                if not stored:
+                    if next_seq == self._seq:
+                        return False
+                    # The coordinator lost earlier chunks: continue from where
+                    # it is, resending this chunk under the number it expects
+                    self._seq = next_seq
+                    continue
+                with self._lock:
+                    # Part of the chunk may have been dropped meanwhile
+                    sent = max(chunk_end - self._buffer_offset, 0)
+                    del self._buffer[:sent]
+                    self._buffer_offset += sent
+                self._seq = next_seq
+
+            with self._lock:
+                progress = self._progress
+            if progress is not None and progress != self._reported_progress:
+                if self.coordinator.report_job_status(self.job_id, "running", progress=progress):
+                    self._reported_progress = progress
+        return True
+
+    def _run(self):
+        while not self._stop.wait(config.LOG_FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self):
+        """Stop the background flusher and send what is left"""
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+        for attempt in range(3):
+            if self.flush():
+                return
+            time.sleep(2 ** attempt)
+        if self._buffer:
+            print(f"Giving up on {len(self._buffer)} bytes of log output for job {self.job_id}")
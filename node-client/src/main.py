@@ -7,23 +7,45 @@ Connects to coordinator and executes training jobs
 import time
 import signal
 import sys
+import threading
 from src.config import config
 from src.coordinator_client import CoordinatorClient
-from src.resource_monitor import ResourceMonitor
+from src.resource_monitor import ResourceSampler
 from src.job_executor import JobExecutor
+from src.worker_pool import JobWorkerPool
+from src.image_prefetcher import ImagePrefetcher
+from src.model_server import ModelServer
 
 class NodeClient:
     def __init__(self):
         self.running = False
         self.coordinator = CoordinatorClient()
+        self.sampler = ResourceSampler(
+            interval=config.RESOURCE_SAMPLE_INTERVAL,
+            history=config.RESOURCE_SAMPLE_HISTORY,
+            gpu_interval=config.GPU_SAMPLE_INTERVAL
+        )
         self.executor = JobExecutor(self.coordinator)
+        self.workers = JobWorkerPool(self.executor, config.MAX_CONCURRENT_JOBS)
+        # Stop jobs cancelled on the coordinator
+        self.coordinator.on_job_stopped = self.cancel_job
+        self.prefetcher = ImagePrefetcher(self.executor.docker)
+        self.model_server = None
         self.heartbeat_interval = 30  # seconds
-        self.job_poll_interval = 5  # seconds
-        self.last_heartbeat = 0
+        self.job_poll_interval = config.JOB_POLL_INTERVAL  # seconds
+        self.stopped = threading.Event()
+    
+    def resource_info(self) -> dict:
+        """Resource snapshot plus the inputs cached on this node, for job placement"""
+        info = self.sampler.snapshot()
+        info["input_cache"] = {
+            "digests": self.executor.input_cache.digests(config.INPUT_CACHE_REPORT_LIMIT)
+        }
+        return info
     
     def register_node(self) -> bool:
         """Register this node with the coordinator"""
-        resource_info = ResourceMonitor.get_resource_info()
+        resource_info = self.resource_info()
         
         node_info = {
             "name": config.NODE_NAME,
@@ -36,25 +58,32 @@ class NodeClient:
         print(f"Registering node '{config.NODE_NAME}' with coordinator...")
         return self.coordinator.register(node_info)
     
-    def send_heartbeat(self):
-        """Send periodic heartbeat to coordinator"""
-        current_time = time.time()
-        if current_time - self.last_heartbeat >= self.heartbeat_interval:
-            if self.coordinator.heartbeat():
-                self.last_heartbeat = current_time
+    def heartbeat_loop(self):
+        """Send periodic heartbeats until the client stops (runs on its own thread)"""
+        while not self.stopped.is_set():
+            if self.coordinator.heartbeat(self.resource_info(), self.workers.running_jobs()):
                 print("Heartbeat sent")
+                # Pull images that jobs waiting in the queue will need
+                if config.IMAGE_PREFETCH:
+                    self.prefetcher.prefetch(self.coordinator.prefetch_images)
             else:
                 print("Warning: Heartbeat failed")
+            self.stopped.wait(self.heartbeat_interval)
+    
+    def cancel_job(self, job_id: str):
+        """Stop a running job the coordinator no longer wants run here"""
+        if self.workers.cancel(job_id):
+            print(f"Cancelling job {job_id}: stopped by the coordinator")
     
-    def process_jobs(self):
-        """Poll for and process jobs"""
-        job = self.coordinator.poll_job()
-        if job:
+    def process_jobs(self, max_jobs: int) -> bool:
+        """Wait for up to `max_jobs` jobs and start them. Returns True if any were received."""
+        jobs = self.coordinator.wait_for_jobs(config.LONG_POLL_TIMEOUT, max_jobs)
+        for job in jobs:
             print(f"Received job: {job.get('id')}")
-            try:
-                self.executor.execute_job(job)
-            except Exception as e:
-                print(f"Error executing job: {e}")
+            if not self.workers.submit(job):
+                print(f"Warning: no free slot for job {job.get('id')}")
+                self.coordinator.report_job_status(job.get("id"), "failed", error="Node had no free slot")
+        return bool(jobs)
     
     def run(self):
         """Main loop"""
@@ -62,6 +91,11 @@ class NodeClient:
         print(f"Coordinator URL: {config.COORDINATOR_URL}")
         print(f"Node Name: {config.NODE_NAME}")
         
+        # Start background resource sampling
+        self.sampler.start()
+        if config.IMAGE_PREFETCH:
+            self.prefetcher.start()
+        
         # Register node
         if not self.register_node():
             print("Failed to register node. Exiting.")
@@ -70,6 +104,18 @@ class NodeClient:
         print("Node registered successfully!")
         print(f"Node ID: {self.coordinator.node_id}")
         
+        # Serve models for interactive inference next to the job slots
+        if config.SERVE_ENABLED:
+            self.model_server = ModelServer(self.executor.input_cache).start()
+            secret = self.coordinator.register_inference(
+                self.model_server.url, self.model_server.models, self.model_server.max_concurrency
+            )
+            if secret:
+                self.model_server.secret = secret
+                print(f"Model server registered at {self.model_server.url}")
+            else:
+                print("Warning: could not register the model server; it will not receive requests")
+        
         # Setup signal handlers
         def signal_handler(sig, frame):
             print("\nShutting down node client...")
@@ -81,25 +127,57 @@ class NodeClient:
         
         self.running = True
         
-        print("Node client running. Press Ctrl+C to stop.")
+        # Heartbeats run on their own thread so long jobs never delay them
+        heartbeat_thread = threading.Thread(target=self.heartbeat_loop, name="heartbeat", daemon=True)
+        heartbeat_thread.start()
+        
+        # Job status updates are batched and sent on their own thread too
+        status_thread = threading.Thread(
+            target=self.coordinator.status_flush_loop, args=(self.stopped,), name="job-status", daemon=True
+        )
+        status_thread.start()
         
-        # Main loop
-        while self.running:
-            try:
-                # Send heartbeat
-                self.send_heartbeat()
-                
-                # Poll for jobs
-                self.process_jobs()
-                
-                # Sleep before next iteration
-                time.sleep(self.job_poll_interval)
-                
-            except KeyboardInterrupt:
-                break
-            except Exception as e:
-                print(f"Error in main loop: {e}")
-                time.sleep(5)
+        print(f"Node client running with {self.workers.max_workers} job slots. Press Ctrl+C to stop.")
+        
+        # Main loop: keep every free slot busy
+        try:
+            while self.running:
+                try:
+                    free_slots = self.workers.free_slots()
+                    if free_slots <= 0:
+                        self.workers.wait_for_slot(timeout=self.job_poll_interval)
+                        continue
+                    
+                    # Wait for jobs
+                    poll_started = time.time()
+                    received = self.process_jobs(free_slots)
+                    
+                    # A long poll already waited on the coordinator. Only sleep
+                    # when polling, or when the request returned early (node at
+                    # capacity, coordinator unreachable).
+                    elapsed = time.time() - poll_started
+                    if not received and elapsed < self.job_poll_interval:
+                        time.sleep(self.job_poll_interval - elapsed)
+                    
+                except KeyboardInterrupt:
+                    break
+                except Exception as e:
+                    print(f"Error in main loop: {e}")
+                    time.sleep(5)
+        finally:
+            self.running = False
+            self.stopped.set()
+            self.sampler.stop()
+            if self.model_server:
+                self.coordinator.unregister_inference()
+                self.model_server.stop()
+            running = self.workers.running_jobs()
+            if running:
+                print(f"Cancelling {len(running)} running job(s)...")
+            self.workers.shutdown(cancel_running=True)
+            self.executor.warm_pool.stop()
+            # Send the final statuses of cancelled jobs
+            self.coordinator.flush_job_statuses()
         
         print("Node client stopped.")
 
@@ -0,0 +1,131 @@
+"""
+Causal language models for the model server
+
+Wraps a Hugging Face transformers model stored under a CID (a directory
+with its config, tokenizer and weights). Requests are decoded in batches:
+every step is one forward pass over the whole batch, and each request gets
+its new text as soon as the step is done. Runs on the CPU unless GPU_ENABLED
+is set and CUDA is available.
+
+Needs torch and transformers (pip install torch transformers); they are
+imported only when a model is loaded.
+"""
+import queue
+import threading
+from typing import List, Optional
+
+class GenerationRequest:
+    """One completion: pieces of text are put on `output` as they are generated"""
+
+    def __init__(self, messages: list, max_tokens: int, temperature: float):
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.output: "queue.Queue" = queue.Queue()  # str pieces, an Exception, then None at the end
+        self.cancelled = threading.Event()  # Set when the client goes away
+
+class CausalLM:
+    def __init__(self, path: str, use_gpu: bool = False):
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer
+
+        self.torch = torch
+        self.device = "cuda" if use_gpu and torch.cuda.is_available() else "cpu"
+        self.tokenizer = AutoTokenizer.from_pretrained(path)
+        # Prompts are padded on the left so every row's next token is in the last column
+        self.tokenizer.padding_side = "left"
+        # Over-long prompts lose their oldest messages, not the newest
+        self.tokenizer.truncation_side = "left"
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        dtype = torch.float16 if self.device == "cuda" else torch.float32
+        self.model = AutoModelForCausalLM.from_pretrained(path, torch_dtype=dtype).to(self.device).eval()
+        self.max_context = getattr(self.model.config, "max_position_embeddings", None) or 2048
+        self.size_bytes = sum(p.numel() * p.element_size() for p in self.model.parameters())
+
+    def prompt(self, messages: list) -> str:
+        if getattr(self.tokenizer, "chat_template", None):
+            return self.tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+        # Models without a chat template get a plain transcript
+        lines = [f"{message.get('role', 'user')}: {message.get('content', '')}" for message in messages]
+        return "\n".join(lines + ["assistant:"])
+
+    def _sample(self, logits, batch: List[GenerationRequest]):
+        """Next token per row: greedy at temperature 0, sampled otherwise"""
+        torch = self.torch
+        logits = logits.float()
+        tokens = logits.argmax(dim=-1)
+        temperatures = torch.tensor([max(request.temperature or 0.0, 0.0) for request in batch], device=logits.device)
+        hot = temperatures > 0
+        if hot.any():
+            probabilities = torch.softmax(logits[hot] / temperatures[hot].unsqueeze(-1), dim=-1)
+            tokens[hot] = torch.multinomial(probabilities, 1).squeeze(-1)
+        return tokens
+
+    def generate(self, batch: List[GenerationRequest]):
+        """
+        Decode a batch of requests together. Rows that finish early (end of
+        sequence, token limit, client gone) stop receiving output but stay
+        in the batch until the longest one is done.
+        """
+        torch = self.torch
+        prompts = [self.prompt(request.messages) for request in batch]
+        longest = max(request.max_tokens for request in batch)
+        encoded = self.tokenizer(
+            prompts, return_tensors="pt", padding=True, truncation=True,
+            max_length=max(self.max_context - longest, 1)
+        ).to(self.device)
+        input_ids = encoded["input_ids"]
+        attention_mask = encoded["attention_mask"]
+        # Positions skip the left padding
+        position_ids = (attention_mask.cumsum(-1) - 1).clamp(min=0)
+
+        eos = self.tokenizer.eos_token_id
+        generated: List[List[int]] = [[] for _ in batch]
+        sent = [""] * len(batch)
+        done = [request.cancelled.is_set() for request in batch]
+        past = None
+
+        with torch.inference_mode():
+            for _ in range(longest):
+                out = self.model(
+                    input_ids=input_ids, attention_mask=attention_mask,
+                    position_ids=position_ids, past_key_values=past, use_cache=True
+                )
+                past = out.past_key_values
+                tokens = self._sample(out.logits[:, -1, :], batch)
+
+                for index, request in enumerate(batch):
+                    if done[index]:
+                        continue
+                    token = int(tokens[index])
+                    if request.cancelled.is_set() or token == eos:
+                        done[index] = True
+                        continue
+                    generated[index].append(token)
+                    text = self._new_text(generated[index], sent[index])
+                    if text:
+                        sent[index] += text
+                        request.output.put(text)
+                    if len(generated[index]) >= request.max_tokens:
+                        done[index] = True
+                if all(done):
+                    break
+
+                input_ids = tokens.unsqueeze(-1)
+                attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(batch), 1))], dim=-1)
+                position_ids = position_ids[:, -1:] + 1
+
+        # Text held back waiting for the rest of a character
+        for index, request in enumerate(batch):
+            if not request.cancelled.is_set():
+                rest = self.tokenizer.decode(generated[index], skip_special_tokens=True)[len(sent[index]):]
+                if rest:
+                    request.output.put(rest)
+
+    def _new_text(self, tokens: List[int], sent: str) -> Optional[str]:
+        """Text added by the latest token, held back while it ends mid-character"""
+        text = self.tokenizer.decode(tokens, skip_special_tokens=True)
+        if text.endswith("\ufffd") or len(text) <= len(sent):
+            return None
+        return text[len(sent):]
@@ -0,0 +1,354 @@
+"""
+Long-lived model server for interactive inference
+
+Serves completions for models (by IPFS CID) to the coordinator, which
+routes chat requests here instead of through the job queue. A model is
+loaded once and kept in memory; when loaded models exceed SERVE_MEMORY_GB
+the least recently used idle one is unloaded. Model files come from the
+node's input cache and stay pinned there while the model is loaded.
+
+Each loaded model has one thread that runs its batches. A batch starts with
+the first waiting request and takes whatever else arrives within
+SERVE_BATCH_WAIT_MS, up to SERVE_MAX_BATCH_SIZE; requests arriving while it
+decodes wait for the next one.
+
+Protocol (see the coordinator's inference router):
+    GET  /health          {"status": "ok", "models": [loaded CIDs], "active": n}
+    POST /v1/completions  {"model": cid, "messages": [...], "temperature", "max_tokens"}
+        Requires "Authorization: Bearer <secret>", the secret the coordinator
+        issued when the server was registered; 401 otherwise, so only the
+        coordinator can use the node's capacity.
+        200 newline-delimited JSON: {"text": "..."}..., then {"done": true};
+        {"error": "..."} if generation fails. 503 when at capacity or while
+        the model is still loading, so the coordinator tries another node.
+"""
+import hmac
+import json
+import os
+import queue
+import socket
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from src.config import config
+from src.input_cache import InputCache
+from src.model_runtime import CausalLM, GenerationRequest
+
+# Longest wait for the next piece of a completion before giving up on it
+OUTPUT_TIMEOUT = 300  # seconds
+
+class ModelUnavailable(Exception):
+    """The model cannot be loaded right now"""
+
+class ModelWorker:
+    """A loaded model and the thread that runs its batches"""
+
+    def __init__(self, cid: str, model: CausalLM):
+        self.cid = cid
+        self.model = model
+        self.size_bytes = model.size_bytes
+        self.active = 0  # Requests submitted and not yet finished (guarded by the cache lock)
+        self._queue: "queue.Queue[Optional[GenerationRequest]]" = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=f"model-{cid[:12]}", daemon=True)
+        self._thread.start()
+
+    def submit(self, request: GenerationRequest):
+        self._queue.put(request)
+
+    def stop(self):
+        self._queue.put(None)
+
+    def _next_batch(self) -> Optional[List[GenerationRequest]]:
+        first = self._queue.get()
+        if first is None:
+            return None
+        batch = [first]
+        deadline = time.monotonic() + config.SERVE_BATCH_WAIT_MS / 1000
+        while len(batch) < config.SERVE_MAX_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                # Stopping: finish this batch first
+                self._queue.put(None)
+                break
+            batch.append(request)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            live = [request for request in batch if not request.cancelled.is_set()]
+            try:
+                if live:
+                    self.model.generate(live)
+            except Exception as e:
+                print(f"Generation failed for model {self.cid}: {e}")
+                for request in live:
+                    request.output.put(e)
+            finally:
+                for request in batch:
+                    request.output.put(None)
+
+class ModelCache:
+    """Loaded models by CID within a memory budget, least recently used unloaded first"""
+
+    def __init__(self, input_cache: InputCache, max_bytes: int):
+        self.input_cache = input_cache
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._workers: "OrderedDict[str, ModelWorker]" = OrderedDict()
+        self._loading: Dict[str, int] = {}  # cid -> bytes reserved for a load in progress
+
+    def loaded(self) -> List[str]:
+        with self._lock:
+            return list(self._workers)
+
+    def checkout(self, cid: str) -> Optional[ModelWorker]:
+        """The loaded model for a CID, marked in use until checkin(); None if not loaded"""
+        with self._lock:
+            worker = self._workers.get(cid)
+            if worker:
+                self._workers.move_to_end(cid)
+                worker.active += 1
+            return worker
+
+    def checkin(self, worker: ModelWorker):
+        with self._lock:
+            worker.active -= 1
+
+    def is_loading(self, cid: str) -> bool:
+        with self._lock:
+            return cid in self._loading
+
+    def _make_room(self, cid: str, needed: int):
+        """Unload idle models until `needed` more bytes fit (lock held)"""
+        used = sum(worker.size_bytes for worker in self._workers.values()) + sum(self._loading.values())
+        for loaded in list(self._workers):
+            if used + needed <= self.max_bytes:
+                break
+            worker = self._workers[loaded]
+            if worker.active:
+                continue
+            del self._workers[loaded]
+            worker.stop()
+            self.input_cache.release(loaded)
+            used -= worker.size_bytes
+            print(f"Unloaded model {loaded} ({worker.size_bytes / 1024 ** 3:.1f} GB)")
+        if used + needed > self.max_bytes:
+            raise ModelUnavailable(f"Not enough memory for model {cid}: other models are in use or loading")
+
+    def load(self, cid: str):
+        """Load a model into memory (blocking). Raises ModelUnavailable."""
+        with self._lock:
+            if cid in self._workers or cid in self._loading:
+                return
+            self._loading[cid] = 0
+
+        path = None
+        try:
+            path = self.input_cache.acquire(cid)
+            if path is None:
+                raise ModelUnavailable(f"Could not download model {cid}")
+            if not os.path.isdir(path):
+                raise ModelUnavailable(f"Model {cid} is not a Hugging Face model directory")
+
+            # Weights take about their size on disk in memory
+            estimate = self.input_cache.size(cid)
+            with self._lock:
+                self._make_room(cid, estimate)
+                self._loading[cid] = estimate
+
+            started = time.time()
+            model = CausalLM(path, use_gpu=config.GPU_ENABLED)
+            worker = ModelWorker(cid, model)
+            with self._lock:
+                self._workers[cid] = worker
+                path = None  # Stays pinned while loaded
+            print(f"Loaded model {cid} on {model.device} in {time.time() - started:.1f}s "
+                  f"({model.size_bytes / 1024 ** 3:.1f} GB)")
+        except ModelUnavailable:
+            raise
+        except Exception as e:
+            raise ModelUnavailable(f"Could not load model {cid}: {e}") from e
+        finally:
+            with self._lock:
+                self._loading.pop(cid, None)
+            if path is not None:
+                self.input_cache.release(cid)
+
+    def load_in_background(self, cid: str):
+        def run():
+            try:
+                self.load(cid)
+            except ModelUnavailable as e:
+                print(f"Warning: {e}")
+        threading.Thread(target=run, name=f"load-{cid[:12]}", daemon=True).start()
+
+    def stop(self):
+        with self._lock:
+            for cid, worker in self._workers.items():
+                worker.stop()
+                self.input_cache.release(cid)
+            self._workers.clear()
+
+class ModelServer:
+    def __init__(self, input_cache: InputCache):
+        self.models = [cid.strip() for cid in config.SERVE_MODELS.split(",") if cid.strip()]
+        self.cache = ModelCache(input_cache, int(config.SERVE_MEMORY_GB * 1024 ** 3))
+        self.max_concurrency = config.SERVE_MAX_CONCURRENCY
+        self.secret: Optional[str] = None  # Issued by the coordinator at registration; no requests are served before
+        self.active = 0
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((config.SERVE_HOST, config.SERVE_PORT), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="model-server", daemon=True)
+
+    @property
+    def url(self) -> str:
+        """Where the coordinator reaches this server"""
+        if config.SERVE_PUBLIC_URL:
+            return config.SERVE_PUBLIC_URL.rstrip("/")
+        host, port = self._httpd.server_address[:2]
+        if host in ("0.0.0.0", ""):
+            host = socket.getfqdn()
+        return f"http://{host}:{port}"
+
+    def start(self) -> "ModelServer":
+        self._thread.start()
+        print(f"Model server listening on {self.url} for {len(self.models)} model(s)")
+        if config.SERVE_PRELOAD:
+            for cid in self.models:
+                self.cache.load_in_background(cid)
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self.cache.stop()
+
+    def _acquire_slot(self) -> bool:
+        with self._lock:
+            if self.active >= self.max_concurrency:
+                return False
+            self.active += 1
+            return True
+
+    def _release_slot(self):
+        with self._lock:
+            self.active -= 1
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # Keep-alive: the coordinator reuses its connections
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _json(self, status: int, body: dict):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if status == 503:
+                    self.send_header("Retry-After", "5")
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, message: dict):
+                data = (json.dumps(message) + "\n").encode()
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+                self.wfile.flush()
+
+            def do_GET(self):
+                if self.path != "/health":
+                    return self._json(404, {"error": "Not found"})
+                self._json(200, {"status": "ok", "models": server.cache.loaded(), "active": server.active})
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                    body = json.loads(self.rfile.read(length) or b"{}")
+                except ValueError:
+                    return self._json(400, {"error": "Invalid JSON"})
+                if self.path != "/v1/completions":
+                    return self._json(404, {"error": "Not found"})
+                authorization = self.headers.get("Authorization") or ""
+                if not server.secret or not hmac.compare_digest(
+                    authorization.encode(), f"Bearer {server.secret}".encode()
+                ):
+                    return self._json(401, {"error": "Unauthorized"})
+                cid = body.get("model")
+                if cid not in server.models:
+                    return self._json(404, {"error": f"Model {cid} is not served here"})
+                if not isinstance(body.get("messages"), list):
+                    return self._json(400, {"error": "messages must be a list"})
+                for field in ("max_tokens", "temperature"):
+                    value = body.get(field)
+                    if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                        return self._json(400, {"error": f"{field} must be a number"})
+
+                if not server._acquire_slot():
+                    return self._json(503, {"error": "At capacity"})
+                try:
+                    worker = server.cache.checkout(cid)
+                    if worker is None:
+                        # Loading takes far longer than a request should wait
+                        if not server.cache.is_loading(cid):
+                            server.cache.load_in_background(cid)
+                        return self._json(503, {"error": f"Model {cid} is loading"})
+                    try:
+                        self._complete(worker, body)
+                    finally:
+                        server.cache.checkin(worker)
+                finally:
+                    server._release_slot()
+
+            def _complete(self, worker: ModelWorker, body: dict):
+                max_tokens = min(int(body.get("max_tokens") or config.SERVE_MAX_TOKENS), config.SERVE_MAX_TOKENS)
+                temperature = body.get("temperature")
+                request = GenerationRequest(
+                    body["messages"], max(max_tokens, 1),
+                    0.7 if temperature is None else float(temperature)
+                )
+                worker.submit(request)
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                try:
+                    failed = False
+                    while True:
+                        item = request.output.get(timeout=OUTPUT_TIMEOUT)
+                        if item is None:
+                            if not failed:
+                                self._chunk({"done": True})
+                            break
+                        if isinstance(item, Exception):
+                            failed = True
+                            self._chunk({"error": str(item)})
+                        else:
+                            self._chunk({"text": item})
+                    self.wfile.write(b"0\r\n\r\n")
+                except queue.Empty:
+                    request.cancelled.set()
+                    self._chunk({"error": "Generation timed out"})
+                    self.wfile.write(b"0\r\n\r\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # The coordinator's client went away; stop generating for it
+                    request.cancelled.set()
+                    self.close_connection = True
+
+        return Handler
@@ -0,0 +1,124 @@
+import os
+import tarfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from src.config import config
+from src.ipfs_client import IPFSClient
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class OutputPackager:
+    """
+    Uploads every declared output of a job to IPFS as one package and
+    describes it in a manifest.
+
+    "directory" packaging adds the outputs concurrently and links them into
+    a single IPFS directory, so each file keeps its own CID. "tar" packaging
+    streams one archive (optionally zstd-compressed) straight into IPFS
+    without writing it to disk.
+    """
+
+    def __init__(self, ipfs: IPFSClient):
+        self.ipfs = ipfs
+        self.pool = ThreadPoolExecutor(max_workers=config.UPLOAD_CONCURRENCY, thread_name_prefix="output-upload")
+
+    def package(self, work_dir: str, output_files: List[str]) -> Dict[str, Any]:
+        """
+        Upload the outputs found in `work_dir`. Returns the manifest:
+        {"cid", "format", "files": [{"path", "size", "cid"}], "missing": [...]}.
+        Raises if an upload fails.
+        """
+        present = [path for path in output_files if os.path.exists(os.path.join(work_dir, path))]
+        missing = [path for path in output_files if path not in present]
+        if not present:
+            return {"cid": None, "format": None, "files": [], "missing": missing}
+
+        if config.OUTPUT_PACKAGING == "tar":
+            manifest = self._upload_tar(work_dir, present)
+        else:
+            manifest = self._upload_directory(work_dir, present)
+        manifest["missing"] = missing
+        return manifest
+
+    @staticmethod
+    def _local_files(full_path: str):
+        """(path relative to the parent of `full_path`, size) of every file under it"""
+        parent = os.path.dirname(full_path)
+        if os.path.isfile(full_path):
+            yield os.path.basename(full_path), os.path.getsize(full_path)
+            return
+        for root, _, names in os.walk(full_path):
+            for name in sorted(names):
+                file_path = os.path.join(root, name)
+                yield os.path.relpath(file_path, parent), os.path.getsize(file_path)
+
+    def _upload_directory(self, work_dir: str, present: List[str]) -> Dict[str, Any]:
+        futures = {
+            path: self.pool.submit(self.ipfs.add_path, os.path.join(work_dir, path))
+            for path in present
+        }
+
+        links = {}
+        files = []
+        for path, future in futures.items():
+            entries = future.result()
+            name = os.path.normpath(path).strip("/")
+            links[name] = entries[-1]["Hash"]
+
+            cids = {entry.get("Name"): entry.get("Hash") for entry in entries}
+            prefix = os.path.dirname(name)
+            for relative, size in self._local_files(os.path.join(work_dir, name)):
+                files.append({
+                    "path": os.path.join(prefix, relative) if prefix else relative,
+                    "size": size,
+                    "cid": cids.get(relative),
+                })
+
+        return {"cid": self.ipfs.make_directory(links), "format": "directory", "files": files}
+
+    def _upload_tar(self, work_dir: str, present: List[str]) -> Dict[str, Any]:
+        compress = config.OUTPUT_COMPRESSION == "zstd"
+        if compress and zstandard is None:
+            print("Warning: zstandard is not installed, uploading an uncompressed tar")
+            compress = False
+
+        files = []
+        errors = []
+
+        def record(info: tarfile.TarInfo) -> tarfile.TarInfo:
+            if info.isfile():
+                files.append({"path": info.name, "size": info.size, "cid": None})
+            return info
+
+        read_fd, write_fd = os.pipe()
+
+        def write():
+            try:
+                with os.fdopen(write_fd, "wb") as raw:
+                    stream = raw
+                    if compress:
+                        stream = zstandard.ZstdCompressor(level=config.OUTPUT_ZSTD_LEVEL).stream_writer(raw, closefd=False)
+                    with tarfile.open(fileobj=stream, mode="w|") as tar:
+                        for path in present:
+                            tar.add(os.path.join(work_dir, path), arcname=os.path.normpath(path), filter=record)
+                    if compress:
+                        stream.close()
+            except Exception as e:
+                # Includes the upload side closing the pipe early
+                errors.append(e)
+
+        writer = threading.Thread(target=write, daemon=True)
+        writer.start()
+        try:
+            with os.fdopen(read_fd, "rb") as reader:
+                cid = self.ipfs.add_stream(reader)
+        finally:
+            writer.join()
+        if errors:
+            raise Exception(f"Failed to package outputs: {errors[0]}")
+
+        return {"cid": cid, "format": "tar.zst" if compress else "tar", "files": files}
@@ -1,6 +1,10 @@
 import psutil
 import platform
-from typing import Dict, Any, Optional
+import threading
+import time
+import copy
+from collections import deque
+from typing import Dict, Any, Optional, List
 import subprocess
 
 class ResourceMonitor:
@@ -82,3 +86,139 @@ class ResourceMonitor:
         
         return info
 
+
+class ResourceSampler:
+    """
+    Samples resources on a background thread and keeps a rolling history.
+    
+    Heartbeats and registration read the cached snapshot instead of blocking
+    on psutil.cpu_percent(interval=1) or forking nvidia-smi each time. GPU
+    queries are refreshed on a slower interval than CPU/memory/disk.
+    """
+    
+    def __init__(self, interval: float = 5, history: int = 60, gpu_interval: float = 30):
+        self.interval = interval
+        self.gpu_interval = gpu_interval
+        self.samples: deque = deque(maxlen=history)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._gpu_info: Optional[Dict[str, Any]] = None
+        self._gpu_sampled_at = 0.0
+        self._static = {
+            "cores": psutil.cpu_count(logical=False),
+            "logical_cores": psutil.cpu_count(logical=True),
+            "platform": platform.system(),
+            "platform_version": platform.version(),
+        }
+        # Prime cpu_percent so the first non-blocking reading is meaningful
+        psutil.cpu_percent(interval=None)
+    
+    def start(self):
+        """Take a first sample and start the background thread"""
+        self.sample()
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="resource-sampler", daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:
+                print(f"Resource sampling failed: {e}")
+    
+    def sample(self) -> Dict[str, Any]:
+        """Take one sample and add it to the history"""
+        now = time.time()
+        if now - self._gpu_sampled_at >= self.gpu_interval:
+            self._gpu_info = ResourceMonitor.get_gpu_info()
+            self._gpu_sampled_at = now
+        
+        freq = psutil.cpu_freq()
+        sample = {
+            "timestamp": now,
+            "cpu_percent": psutil.cpu_percent(interval=None),
+            "cpu_frequency": freq._asdict() if freq else None,
+            "memory": ResourceMonitor.get_memory_info(),
+            "disk": ResourceMonitor.get_disk_info(),
+            "gpu": self._gpu_info,
+        }
+        with self._lock:
+            self.samples.append(sample)
+        return sample
+    
+    def history(self) -> List[Dict[str, Any]]:
+        """Copy of the rolling sample history, oldest first"""
+        with self._lock:
+            return list(self.samples)
+    
+    def snapshot(self, window: int = 3) -> Dict[str, Any]:
+        """
+        Latest resource info, in the same shape as
+        ResourceMonitor.get_resource_info(). CPU usage is averaged over the
+        last `window` samples to smooth out spikes.
+        """
+        with self._lock:
+            recent = list(self.samples)[-window:]
+        if not recent:
+            recent = [self.sample()]
+        latest = recent[-1]
+        
+        info = {
+            "cpu": {
+                "cores": self._static["cores"],
+                "logical_cores": self._static["logical_cores"],
+                "usage_percent": round(sum(s["cpu_percent"] for s in recent) / len(recent), 1),
+                "frequency": latest["cpu_frequency"],
+            },
+            "memory": latest["memory"],
+            "disk": latest["disk"],
+            "platform": self._static["platform"],
+            "platform_version": self._static["platform_version"],
+        }
+        if latest["gpu"]:
+            info["gpu"] = latest["gpu"]
+        return copy.deepcopy(info)
+
+def resource_delta(previous: Dict[str, Any], current: Dict[str, Any], tolerance: float = 0.01) -> Dict[str, Any]:
+    """
+    Fields of `current` that changed since `previous`, as a nested dict.
+    
+    Numbers count as changed only if they moved by more than `tolerance`
+    (relative), so constantly jittering values like available memory do not
+    make every heartbeat a full update. Removed keys are sent as None.
+    """
+    delta = {}
+    for key, value in current.items():
+        old = previous.get(key)
+        if isinstance(value, dict) and isinstance(old, dict):
+            nested = resource_delta(old, value, tolerance)
+            if nested:
+                delta[key] = nested
+        elif isinstance(value, (int, float)) and isinstance(old, (int, float)) \
+                and not isinstance(value, bool) and not isinstance(old, bool):
+            if abs(value - old) > tolerance * max(abs(old), 1):
+                delta[key] = value
+        elif value != old:
+            delta[key] = value
+    for key in previous:
+        if key not in current:
+            delta[key] = None
+    return delta
+
+def merge_resources(base: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a resource_delta to a resource dict (None removes a key)"""
+    merged = copy.deepcopy(base) if base else {}
+    for key, value in delta.items():
+        if value is None:
+            merged.pop(key, None)
+        elif isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge_resources(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
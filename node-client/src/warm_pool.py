@@ -0,0 +1,262 @@
+import os
+import uuid
+import shutil
+import threading
+from typing import Dict, Any, List, Optional, Iterator, Tuple
+from src.config import config
+from src.docker_manager import DockerManager
+from src.input_cache import InputCache
+
+# Label on pooled containers, so leftovers from a previous run can be removed
+POOL_LABEL = "aiforge.warm"
+# Where the container's job directory and the running job's inputs appear inside it
+JOBS_MOUNT = "/jobs"
+INPUTS_MOUNT = "/inputs"
+# Keeps the container alive between jobs. The name lets the reset find it.
+IDLE_NAME = "aiforge-idle"
+IDLE_COMMAND = ["sh", "-c", "while :; do sleep 3600; done", IDLE_NAME]
+# Run as root between jobs: kills whatever the last job left running and
+# clears its temporary files
+RESET_COMMAND = ["sh", "-c", f"""
+for dir in /proc/[0-9]*; do
+    pid=${{dir#/proc/}}
+    if [ "$pid" = 1 ] || [ "$pid" = $$ ]; then continue; fi
+    if grep -q {IDLE_NAME} "$dir/cmdline" 2>/dev/null; then continue; fi
+    kill -9 "$pid" 2>/dev/null
+done
+rm -rf /workspace /tmp/* /tmp/.[!.]* /var/tmp/* 2>/dev/null
+true
+"""]
+# How often the pool is topped up
+REFILL_INTERVAL = 5  # seconds
+
+class WarmContainer:
+    def __init__(self, container, image: str, root_dir: str):
+        self.container = container
+        self.image = image
+        self.root_dir = root_dir
+        self.host_dir = os.path.join(root_dir, "jobs")  # Mounted at /jobs; holds the running job's directory
+        self.inputs_dir = os.path.join(root_dir, "inputs")  # Mounted at /inputs; the running job's inputs
+        self.owner: Optional[str] = None  # Whose jobs it has run; None while unused
+        self.uses = 0
+        self.reusable = True
+
+class WarmContainerPool:
+    """
+    Idle, already-started containers kept per image so short jobs skip
+    container creation and startup.
+
+    Each pooled container has its own host directories mounted at /jobs and
+    (read-only) at /inputs; the job's directory is moved into the first
+    while it runs, and its inputs are hardlinked from the input cache into
+    the second, so a job sees only its own inputs. A job runs as an exec:
+    /workspace is symlinked to its directory first, so jobs see the same
+    layout as in a fresh container.
+
+    Jobs share a container's writable layer, so a container that has run a
+    job is only handed to later jobs of the same submitter, and is reset
+    (leftover processes killed, temporary files and inputs removed) in
+    between. Up to WARM_POOL_SIZE unused and WARM_POOL_SIZE used containers
+    are kept per image. Jobs that need GPUs are not pooled (GPUs are
+    assigned at creation), and a container is replaced after a failed job,
+    after a job with resource limits, or after WARM_POOL_MAX_USES jobs.
+    """
+
+    def __init__(self, docker: DockerManager, jobs_dir: str, input_cache: InputCache):
+        self.docker = docker
+        self.pool_dir = os.path.join(os.path.abspath(jobs_dir), ".warm")
+        self.input_cache = input_cache
+        self.size = config.WARM_POOL_SIZE
+        self.images = [image.strip() for image in config.WARM_POOL_IMAGES.split(",") if image.strip()]
+        self.job_types = {t.strip() for t in config.WARM_POOL_JOB_TYPES.split(",") if t.strip()}
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[WarmContainer]] = {image: [] for image in self.images}
+        self._stop = threading.Event()
+        self._refill = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="warm-pool", daemon=True)
+
+    def enabled(self) -> bool:
+        return self.size > 0 and bool(self.images) and self.docker.is_available()
+
+    def start(self) -> "WarmContainerPool":
+        if self.enabled():
+            self._remove_leftovers()
+            self._thread.start()
+        return self
+
+    @staticmethod
+    def owner(job: Dict[str, Any]) -> str:
+        """Who a job runs for; containers are only reused between jobs of the same owner"""
+        return f"user:{job['user_id']}" if job.get("user_id") is not None else "system"
+
+    def eligible(self, job: Dict[str, Any], image: str) -> bool:
+        """Whether a job can run in a pooled container"""
+        return (
+            self.enabled()
+            and image in self._idle
+            and not job.get("gpus")
+            and job.get("type", "test") in self.job_types
+        )
+
+    def _remove_leftovers(self):
+        try:
+            for container in self.docker.client.containers.list(all=True, filters={"label": POOL_LABEL}):
+                container.remove(force=True)
+        except Exception as e:
+            print(f"Failed to remove old warm containers: {e}")
+        shutil.rmtree(self.pool_dir, ignore_errors=True)
+
+    def _create(self, image: str) -> Optional[WarmContainer]:
+        root_dir = os.path.join(self.pool_dir, uuid.uuid4().hex[:12])
+        jobs_dir = os.path.join(root_dir, "jobs")
+        inputs_dir = os.path.join(root_dir, "inputs")
+        os.makedirs(jobs_dir, exist_ok=True)
+        os.makedirs(inputs_dir, exist_ok=True)
+        try:
+            container = self.docker.client.containers.run(
+                image=image,
+                command=IDLE_COMMAND,
+                volumes=[
+                    f"{jobs_dir}:{JOBS_MOUNT}:rw",
+                    f"{inputs_dir}:{INPUTS_MOUNT}:ro",
+                ],
+                network=config.DOCKER_NETWORK,
+                labels={POOL_LABEL: "1"},
+                init=True,
+                detach=True
+            )
+            return WarmContainer(container, image, root_dir)
+        except Exception as e:
+            print(f"Failed to start warm container for {image}: {e}")
+            shutil.rmtree(root_dir, ignore_errors=True)
+            return None
+
+    def _count(self, image: str, used: bool) -> int:
+        """Idle containers for an image that have (or have not) run a job (lock held)"""
+        return sum(1 for warm in self._idle[image] if (warm.owner is not None) == used)
+
+    def _run(self):
+        while not self._stop.is_set():
+            for image in self.images:
+                while not self._stop.is_set():
+                    with self._lock:
+                        if self._count(image, used=False) >= self.size:
+                            break
+                    warm = self._create(image)
+                    if warm is None:
+                        break
+                    with self._lock:
+                        self._idle[image].append(warm)
+            self._refill.wait(REFILL_INTERVAL)
+            self._refill.clear()
+
+    def acquire(self, image: str, owner: str) -> Optional[WarmContainer]:
+        """
+        Take an idle container for `image` that has only run `owner`'s jobs,
+        or an unused one; None if there is neither
+        """
+        with self._lock:
+            idle = self._idle.get(image) or []
+            warm = next((warm for warm in reversed(idle) if warm.owner == owner), None)
+            if warm is None:
+                warm = next((warm for warm in reversed(idle) if warm.owner is None), None)
+            if warm is not None:
+                idle.remove(warm)
+                warm.owner = owner
+        self._refill.set()
+        return warm
+
+    def add_inputs(self, warm: WarmContainer, cids: List[str]):
+        """Make acquired cache objects visible to the container at /inputs/<cid>"""
+        for cid in cids:
+            path = os.path.join(warm.inputs_dir, cid)
+            if not os.path.lexists(path):
+                self.input_cache.link_into(cid, path)
+
+    @staticmethod
+    def job_dir(warm: WarmContainer, work_dir: str) -> str:
+        """Where a job's directory must be on the host while it runs in `warm`"""
+        return os.path.join(warm.host_dir, os.path.basename(os.path.normpath(work_dir)))
+
+    def run(self, warm: WarmContainer, job_config: Dict[str, Any], work_dir: str) -> Tuple[str, Iterator[bytes]]:
+        """
+        Start a job's command in a pooled container; `work_dir` must already
+        be at job_dir(). Returns the exec id and the command's combined
+        output stream, which ends when it exits.
+        """
+        warm.uses += 1
+        if job_config.get("memory_limit") or job_config.get("cpu_limit"):
+            # Limits stay on the container, so it is not reused afterwards
+            warm.reusable = False
+            warm.container.update(
+                mem_limit=job_config.get("memory_limit"),
+                memswap_limit=-1 if job_config.get("memory_limit") else None,
+                cpu_quota=int(job_config["cpu_limit"] * 100000) if job_config.get("cpu_limit") else None
+            )
+
+        job_path = f"{JOBS_MOUNT}/{os.path.basename(os.path.normpath(work_dir))}"
+        environment = dict(job_config.get("environment") or {})
+        environment.update({
+            "JOB_ID": job_config.get("job_id"),
+            "WORK_DIR": "/workspace",
+            "PROGRESS_MARKER": config.PROGRESS_MARKER
+        })
+        command = [
+            "sh", "-c", 'ln -sfn "$0" /workspace && cd /workspace && exec "$@"', job_path,
+            *job_config.get("command", ["python", "-c", "print('Hello from container')"])
+        ]
+        api = self.docker.client.api
+        exec_id = api.exec_create(warm.container.id, command, environment=environment)["Id"]
+        return exec_id, api.exec_start(exec_id, stream=True)
+
+    def exit_code(self, exec_id: str) -> int:
+        result = self.docker.client.api.exec_inspect(exec_id)
+        return result.get("ExitCode") if result.get("ExitCode") is not None else -1
+
+    def _reset(self, warm: WarmContainer) -> bool:
+        """Clear what the last job left behind. Returns False if the container must not be reused."""
+        try:
+            for name in os.listdir(warm.host_dir):
+                path = os.path.join(warm.host_dir, name)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.remove(path)
+            shutil.rmtree(warm.inputs_dir)
+            os.makedirs(warm.inputs_dir)
+            result = warm.container.exec_run(RESET_COMMAND, user="root")
+            return result.exit_code == 0
+        except Exception as e:
+            print(f"Failed to reset warm container: {e}")
+            return False
+
+    def release(self, warm: WarmContainer, reusable: bool):
+        """Return a container after a job, or replace it"""
+        if reusable and warm.reusable and warm.uses < config.WARM_POOL_MAX_USES and not self._stop.is_set():
+            with self._lock:
+                keep = self._count(warm.image, used=True) < self.size
+            if keep and self._reset(warm):
+                with self._lock:
+                    self._idle[warm.image].append(warm)
+                return
+        self._discard(warm)
+        self._refill.set()
+
+    @staticmethod
+    def _discard(warm: WarmContainer):
+        try:
+            warm.container.remove(force=True)
+        except Exception as e:
+            print(f"Failed to remove warm container: {e}")
+        shutil.rmtree(warm.root_dir, ignore_errors=True)
+
+    def stop(self):
+        """Remove all idle containers"""
+        self._stop.set()
+        self._refill.set()
+        with self._lock:
+            idle = [warm for containers in self._idle.values() for warm in containers]
+            for containers in self._idle.values():
+                containers.clear()
+        for warm in idle:
+            self._discard(warm)
@@ -0,0 +1,72 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from src.job_executor import JobExecutor
+
+class JobWorkerPool:
+    """Runs up to `max_workers` jobs in parallel, each with its own cancel flag"""
+
+    def __init__(self, executor: JobExecutor, max_workers: int):
+        self.executor = executor
+        self.max_workers = max(1, max_workers)
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self._running: Dict[str, threading.Event] = {}  # job_id -> cancel flag
+
+    def free_slots(self) -> int:
+        """Number of jobs that can be started right now"""
+        with self._lock:
+            return self.max_workers - len(self._running)
+
+    def running_jobs(self) -> List[str]:
+        """IDs of jobs currently running"""
+        with self._lock:
+            return list(self._running)
+
+    def wait_for_slot(self, timeout: float) -> bool:
+        """Block until a slot is free or `timeout` passes"""
+        with self._slot_freed:
+            return self._slot_freed.wait_for(
+                lambda: len(self._running) < self.max_workers,
+                timeout=timeout
+            )
+
+    def submit(self, job: Dict[str, Any]) -> bool:
+        """Start a job in the background. Returns False if no slot is free."""
+        job_id = job.get("id")
+        cancel_event = threading.Event()
+        with self._lock:
+            if len(self._running) >= self.max_workers or job_id in self._running:
+                return False
+            self._running[job_id] = cancel_event
+
+        self._pool.submit(self._run, job, cancel_event)
+        return True
+
+    def _run(self, job: Dict[str, Any], cancel_event: threading.Event):
+        job_id = job.get("id")
+        try:
+            self.executor.execute_job(job, cancel_event=cancel_event)
+        except Exception as e:
+            print(f"Error executing job {job_id}: {e}")
+        finally:
+            with self._slot_freed:
+                self._running.pop(job_id, None)
+                self._slot_freed.notify_all()
+
+    def cancel(self, job_id: str) -> bool:
+        """Ask a running job to stop. Returns False if the job is not running here."""
+        with self._lock:
+            cancel_event = self._running.get(job_id)
+        if not cancel_event:
+            return False
+        cancel_event.set()
+        return True
+
+    def shutdown(self, cancel_running: bool = True, wait: bool = True):
+        """Stop accepting jobs, optionally cancelling those still running"""
+        if cancel_running:
+            for job_id in self.running_jobs():
+                self.cancel(job_id)
+        self._pool.shutdown(wait=wait)